@@ -23,5 +23,12 @@ DATABASES = {
         'OPTIONS': {
             'timeout': 100,
         }
-    }
+    },
+    # second sqlite database standing for a read replica, see PublisherRouter
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+    },
 }
+
+DATABASE_ROUTERS = ['djangosnapshotpublisher.routers.PublisherRouter']
@@ -2,12 +2,47 @@
 .. module:: djangosnapshotpublisher.admin
    :synopsis: djangosnapshotpublisher custom django admin
 """
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Q
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
+from django.utils.http import urlencode
 
 from .models import (ContentRelease, ContentReleaseExtraParameter, ReleaseDocument,
                      ReleaseDocumentExtraParameter)
 
 
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    EstimatedCountPaginator, count an unfiltered changelist from the table statistics of
+    postgresql when the table is too big to be counted on every page
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+        return super(EstimatedCountPaginator, self).count
+
+
 class ContentReleaseExtraParameterInline(admin.TabularInline):
     """ ContentReleaseExtraParameterInline """
     model = ContentReleaseExtraParameter
@@ -16,8 +51,11 @@ class ContentReleaseExtraParameterInline(admin.TabularInline):
 class ContentReleaseAdmin(admin.ModelAdmin):
     """ ContentReleaseAdmin """
     ordering = ['title']
-    list_display = ('title', 'version', 'site_code', 'uuid', 'base_release', )
+    list_display = ('title', 'version', 'site_code', 'uuid', 'base_release', 'document_count', )
     list_filter = ('site_code', )
+    list_select_related = ('base_release', )
+    # the documents are listed by document_summary, not by a widget loading every document
+    exclude = ['release_documents']
     readonly_fields = ['base_release']
     inlines = [
         ContentReleaseExtraParameterInline,
@@ -25,10 +63,39 @@ class ContentReleaseAdmin(admin.ModelAdmin):
 
     def get_readonly_fields(self, request, obj=None):
         if obj:
-            return ['base_release']
+            return ['base_release', 'document_summary']
         else:
             return []
 
+    def get_queryset(self, request):
+        return super(ContentReleaseAdmin, self).get_queryset(request).annotate(
+            document_count=Count('release_documents'))
+
+    def document_count(self, obj):
+        """ document_count """
+        return obj.document_count
+    document_count.admin_order_field = 'document_count'
+    document_count.short_description = 'documents'
+
+    def document_summary(self, obj):
+        """ document_summary, the number of documents by content_type """
+        content_types = ReleaseDocument.objects.filter(
+            content_releases=obj.id,
+        ).values('content_type').annotate(
+            count=Count('id'),
+            deleted_count=Count('id', filter=Q(deleted=True)),
+        ).order_by('content_type')
+        return format_html(
+            '<ul>{}</ul><a href="{}">Browse the documents</a>',
+            format_html_join('', '<li>{}: {} ({} deleted)</li>', (
+                (content_type['content_type'], content_type['count'],
+                 content_type['deleted_count'])
+                for content_type in content_types
+            )) or 'No documents',
+            reverse('admin:djangosnapshotpublisher_releasedocument_browse', args=[obj.id]),
+        )
+    document_summary.short_description = 'documents'
+
 admin.site.register(ContentRelease, ContentReleaseAdmin)
 
 
@@ -37,14 +104,119 @@ class ReleaseDocumentExtraParameterInline(admin.TabularInline):
     model = ReleaseDocumentExtraParameter
 
 
+class ReleaseDocumentForm(forms.ModelForm):
+    """ ReleaseDocumentForm, edit the body stored in the DocumentBlob of the document """
+    document_json = forms.CharField(widget=forms.Textarea, required=False)
+
+    class Meta:
+        model = ReleaseDocument
+        fields = ['document_key', 'content_type', 'document_json', 'deleted']
+
+    def __init__(self, *args, **kwargs):
+        super(ReleaseDocumentForm, self).__init__(*args, **kwargs)
+        self.initial.setdefault('document_json', self.instance.document_json)
+
+    def save(self, commit=True):
+        self.instance.document_json = self.cleaned_data['document_json']
+        return super(ReleaseDocumentForm, self).save(commit)
+
+
+class ContentReleaseListFilter(admin.SimpleListFilter):
+    """
+    ContentReleaseListFilter, only the latest releases are listed, any other one is selected
+    from the link of its ContentRelease change form
+    """
+    title = 'content release'
+    parameter_name = 'content_release'
+    max_choices = 20
+
+    def lookups(self, request, model_admin):
+        content_releases = list(ContentRelease.objects.order_by('-id').only(
+            'id', 'site_code', 'title', 'version')[:self.max_choices])
+        if self.value() and self.value() not in {
+                str(content_release.id) for content_release in content_releases}:
+            content_releases += list(ContentRelease.objects.filter(
+                id=self.value()).only('id', 'site_code', 'title', 'version'))
+        return [
+            (str(content_release.id), '{} - {} ({})'.format(
+                content_release.site_code, content_release.title, content_release.version))
+            for content_release in content_releases
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(content_releases=self.value())
+        return queryset
+
+
 class ReleaseDocumentAdmin(admin.ModelAdmin):
     """ ReleaseDocumentAdmin """
+    form = ReleaseDocumentForm
     ordering = ['content_type', 'document_key']
     list_display = ('content_type', 'document_key', 'deleted',)
-    list_filter = ('content_type', 'content_releases', 'document_key',)
+    list_filter = ('content_type', 'deleted', ContentReleaseListFilter,)
+    search_fields = ('^document_key',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    browse_per_page = 100
     inlines = [
         ReleaseDocumentExtraParameterInline,
     ]
 
+    def get_urls(self):
+        return [
+            path(
+                'browse/<int:content_release_id>/',
+                self.admin_site.admin_view(self.browse_view),
+                name='djangosnapshotpublisher_releasedocument_browse',
+            ),
+        ] + super(ReleaseDocumentAdmin, self).get_urls()
+
+    def browse_view(self, request, content_release_id):
+        """ browse_view, the documents of a release paginated by (content_type, document_key) """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        content_release = get_object_or_404(ContentRelease, id=content_release_id)
+        release_documents = ReleaseDocument.objects.filter(
+            content_releases=content_release.id,
+        ).only(
+            'id', 'content_type', 'document_key', 'deleted',
+        ).order_by('content_type', 'document_key')
+
+        search = request.GET.get('q', '')
+        if search:
+            release_documents = release_documents.filter(document_key__startswith=search)
+        after_content_type = request.GET.get('after_content_type')
+        after_document_key = request.GET.get('after_document_key')
+        if after_content_type is not None and after_document_key is not None:
+            release_documents = release_documents.filter(
+                Q(content_type__gt=after_content_type) |
+                Q(content_type=after_content_type, document_key__gt=after_document_key)
+            )
+
+        release_documents = list(release_documents[:self.browse_per_page + 1])
+        next_query = None
+        if len(release_documents) > self.browse_per_page:
+            release_documents = release_documents[:self.browse_per_page]
+            next_query = urlencode({
+                'q': search,
+                'after_content_type': release_documents[-1].content_type,
+                'after_document_key': release_documents[-1].document_key,
+            })
+
+        return TemplateResponse(
+            request,
+            'admin/djangosnapshotpublisher/releasedocument/browse.html',
+            dict(
+                self.admin_site.each_context(request),
+                opts=self.model._meta,
+                title='Documents of {} ({})'.format(content_release.title, content_release.version),
+                content_release=content_release,
+                release_documents=release_documents,
+                search=search,
+                next_query=next_query,
+            ),
+        )
+
 
 admin.site.register(ReleaseDocument, ReleaseDocumentAdmin)
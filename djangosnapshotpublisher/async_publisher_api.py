@@ -0,0 +1,237 @@
+"""
+.. module:: djangosnapshotpublisher.async_publisher_api
+   :synopsis: AsyncPublisherAPI
+"""
+
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models.query import QuerySet
+
+from .changelog import DEFAULT_CHANGES_LIMIT
+from .garbage_collection import DEFAULT_GC_BATCH_SIZE
+from .publisher_api import PublisherAPI
+
+
+def _call_read(method, *args, **kwargs):
+    """
+    run a PublisherAPI read in a worker thread, every worker thread has its own database
+    connection which is closed when unusable or older than CONN_MAX_AGE, like django does
+    around a request
+    """
+    close_old_connections()
+    try:
+        response = method(*args, **kwargs)
+        # evaluate querysets here, they can't be evaluated from the event loop
+        if isinstance(response, dict) and isinstance(response.get('content'), QuerySet):
+            len(response['content'])
+        return response
+    finally:
+        close_old_connections()
+
+
+class AsyncPublisherAPI:
+    """
+    AsyncPublisherAPI
+
+    Awaitable version of the PublisherAPI. Reads run in a pool of worker threads so they can
+    be fanned out with asyncio.gather, writes run in the thread shared with the other
+    thread sensitive code (e.g. django views) so they keep using the same connection and
+    transaction.
+    """
+
+    def __init__(self, api_type='django', read_database=None):
+        self.publisher_api = PublisherAPI(api_type=api_type, read_database=read_database)
+
+    @property
+    def api_type(self):
+        """ api_type """
+        return self.publisher_api.api_type
+
+    async def _read(self, method_name, *args, **kwargs):
+        method = getattr(self.publisher_api, method_name)
+        return await sync_to_async(
+            partial(_call_read, method), thread_sensitive=False)(*args, **kwargs)
+
+    async def _write(self, method_name, *args, **kwargs):
+        method = getattr(self.publisher_api, method_name)
+        return await sync_to_async(method, thread_sensitive=True)(*args, **kwargs)
+
+    # read
+
+    async def get_extra_paramater(self, site_code, release_uuid, key):
+        """ get_extra_paramater """
+        return await self._read('get_extra_paramater', site_code, release_uuid, key)
+
+    async def get_extra_paramaters(self, site_code, release_uuid):
+        """ get_extra_paramaters """
+        return await self._read('get_extra_paramaters', site_code, release_uuid)
+
+    async def get_content_release_details(self, site_code, release_uuid, parameters=None,
+                                          include_parameters=False):
+        """ get_content_release_details """
+        return await self._read(
+            'get_content_release_details', site_code, release_uuid, parameters,
+            include_parameters=include_parameters)
+
+    async def get_content_release_details_query_parameters(self, site_code, parameters):
+        """ get_content_release_details_query_parameters """
+        return await self._read(
+            'get_content_release_details_query_parameters', site_code, parameters)
+
+    async def get_stage_content_release(self, site_code, parameters=None,
+                                        include_parameters=False):
+        """ get_stage_content_release """
+        return await self._read(
+            'get_stage_content_release', site_code, parameters,
+            include_parameters=include_parameters)
+
+    async def get_live_content_release(self, site_code, parameters=None,
+                                       include_parameters=False):
+        """ get_live_content_release """
+        return await self._read(
+            'get_live_content_release', site_code, parameters,
+            include_parameters=include_parameters)
+
+    async def list_content_releases(self, site_code, status=None, after=None,
+                                    include_parameters=False):
+        """ list_content_releases """
+        return await self._read(
+            'list_content_releases', site_code, status, after,
+            include_parameters=include_parameters)
+
+    async def get_latest_version_content_release(self, site_code, status=None,
+                                                 include_parameters=False):
+        """ get_latest_version_content_release """
+        return await self._read(
+            'get_latest_version_content_release', site_code, status,
+            include_parameters=include_parameters)
+
+    async def get_document_from_content_release(self, site_code, release_uuid, document_key,
+                                                content_type='content'):
+        """ get_document_from_content_release """
+        return await self._read(
+            'get_document_from_content_release', site_code, release_uuid, document_key,
+            content_type)
+
+    async def get_document_extra_from_content_release(self, site_code, release_uuid,
+                                                      document_key, content_type='content'):
+        """ get_document_extra_from_content_release """
+        return await self._read(
+            'get_document_extra_from_content_release', site_code, release_uuid, document_key,
+            content_type)
+
+    async def get_document_with_extra_from_content_release(self, site_code, release_uuid,
+                                                           document_key,
+                                                           content_type='content'):
+        """ get_document_with_extra_from_content_release """
+        return await self._read(
+            'get_document_with_extra_from_content_release', site_code, release_uuid,
+            document_key, content_type)
+
+    async def get_documents_from_content_release(self, site_code, release_uuid, keys,
+                                                 resolve_base_release=False):
+        """ get_documents_from_content_release """
+        return await self._read(
+            'get_documents_from_content_release', site_code, release_uuid, keys,
+            resolve_base_release=resolve_base_release)
+
+    async def compare_content_releases(self, site_code, my_release_uuid,
+                                       compare_to_release_uuid, limit=None, cursor=None,
+                                       summary=False):
+        """ compare_content_releases """
+        return await self._read(
+            'compare_content_releases', site_code, my_release_uuid, compare_to_release_uuid,
+            limit=limit, cursor=cursor, summary=summary)
+
+    async def get_changes_since(self, site_code, sequence=0, limit=DEFAULT_CHANGES_LIMIT):
+        """ get_changes_since """
+        return await self._read('get_changes_since', site_code, sequence, limit)
+
+    async def get_document_diffs(self, site_code, my_release_uuid, compare_to_release_uuid,
+                                 keys):
+        """ get_document_diffs """
+        return await self._read(
+            'get_document_diffs', site_code, my_release_uuid, compare_to_release_uuid, keys)
+
+    # write
+
+    async def add_content_release(self, site_code, title, version, parameters=None,
+                                  based_on_release_uuid=None,
+                                  use_current_live_as_base_release=False):
+        """ add_content_release """
+        return await self._write(
+            'add_content_release', site_code, title, version, parameters,
+            based_on_release_uuid, use_current_live_as_base_release)
+
+    async def update_content_release_parameters(self, site_code, release_uuid, parameters,
+                                                clear_first=False):
+        """ update_content_release_parameters """
+        return await self._write(
+            'update_content_release_parameters', site_code, release_uuid, parameters,
+            clear_first)
+
+    async def remove_content_release(self, site_code, release_uuid):
+        """ remove_content_release """
+        return await self._write('remove_content_release', site_code, release_uuid)
+
+    async def update_content_release(self, site_code, release_uuid, title=None, version=None,
+                                     parameters=None):
+        """ update_content_release """
+        return await self._write(
+            'update_content_release', site_code, release_uuid, title, version, parameters)
+
+    async def set_stage_content_release(self, site_code, release_uuid):
+        """ set_stage_content_release """
+        return await self._write('set_stage_content_release', site_code, release_uuid)
+
+    async def unset_stage_content_release(self, site_code, release_uuid):
+        """ unset_stage_content_release """
+        return await self._write('unset_stage_content_release', site_code, release_uuid)
+
+    async def set_live_content_release(self, site_code, release_uuid, publish_datetime=None):
+        """ set_live_content_release """
+        return await self._write(
+            'set_live_content_release', site_code, release_uuid, publish_datetime)
+
+    async def publish_document_to_content_release(self, site_code, release_uuid, document_json,
+                                                  document_key, content_type='content',
+                                                  parameters=None):
+        """ publish_document_to_content_release """
+        return await self._write(
+            'publish_document_to_content_release', site_code, release_uuid, document_json,
+            document_key, content_type, parameters)
+
+    async def unpublish_document_from_content_release(self, site_code, release_uuid,
+                                                      document_key, content_type='content'):
+        """ unpublish_document_from_content_release """
+        return await self._write(
+            'unpublish_document_from_content_release', site_code, release_uuid, document_key,
+            content_type)
+
+    async def delete_document_from_content_release(self, site_code, release_uuid, document_key,
+                                                   content_type='content'):
+        """ delete_document_from_content_release """
+        return await self._write(
+            'delete_document_from_content_release', site_code, release_uuid, document_key,
+            content_type)
+
+    async def unpublish_documents_from_content_release(self, site_code, release_uuid, keys=None,
+                                                       prefix=None, content_type='content'):
+        """ unpublish_documents_from_content_release """
+        return await self._write(
+            'unpublish_documents_from_content_release', site_code, release_uuid, keys=keys,
+            prefix=prefix, content_type=content_type)
+
+    async def delete_documents_from_content_release(self, site_code, release_uuid, keys=None,
+                                                    prefix=None, content_type='content'):
+        """ delete_documents_from_content_release """
+        return await self._write(
+            'delete_documents_from_content_release', site_code, release_uuid, keys=keys,
+            prefix=prefix, content_type=content_type)
+
+    async def gc_release_documents(self, batch_size=DEFAULT_GC_BATCH_SIZE, dry_run=False):
+        """ gc_release_documents """
+        return await self._write(
+            'gc_release_documents', batch_size=batch_size, dry_run=dry_run)
@@ -0,0 +1,515 @@
+"""
+.. module:: djangosnapshotpublisher.cache
+   :synopsis: optional cache for PublisherAPI reads
+
+Two levels of cache, both optional:
+
+* the shared cache set by SNAPSHOTPUBLISHER_CACHE
+* a per process LRU bounded in bytes set by SNAPSHOTPUBLISHER_LOCAL_CACHE_MAX_BYTES, in front
+  of the shared cache
+
+Every key embeds the generation of its site, held in the shared cache and incremented by the
+PublisherAPI writes once they are committed, so a write invalidates the entries of the site in
+every process without deleting them one by one. The generation is read before querying the
+database and the result is stored under it, so a write happening in between can't leave a stale
+entry behind, as long as the query sees every write committed before the generation was read.
+Bumped before the commit, a reader could still see the rows of before the write under the new
+generation. A read replica doesn't see every committed write either: it can lag behind the write
+which bumped the generation, so the PublisherAPI reads whose result is stored here go to the
+primary (see SNAPSHOTPUBLISHER_READ_DATABASE).
+
+A go live bumps the generation by CUTOVER_STEP instead of 1, so the entries of the incoming
+release can be stored ahead of time under the generation the go live will set (see
+djangosnapshotpublisher.warmup). Any other write in between moves the go live to another
+generation, so these entries are never served if they are outdated.
+
+Misses are coalesced with `coalesce` so a cutover doesn't send every worker to the database:
+one computation per key in a process, and one process per key holding a short lock in the
+shared cache while the others serve the entry of the previous generation or wait for it.
+"""
+
+from collections import OrderedDict
+import copy
+from functools import partial
+import hashlib
+import json
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
+from .routers import get_current_read_database, get_primary_database, is_primary_pinned
+
+
+CACHE_KEY_PREFIX = 'snapshotpublisher'
+DEFAULT_CACHE_TIMEOUT = 3600
+CUTOVER_STEP = 2 ** 20
+DEFAULT_STAMPEDE_LOCK_TIMEOUT = 10
+DEFAULT_STAMPEDE_WAIT = 1
+STAMPEDE_POLL_INTERVAL = 0.05
+
+
+def get_cache():
+    """ return the cache set by SNAPSHOTPUBLISHER_CACHE, None if caching is disabled """
+    alias = getattr(settings, 'SNAPSHOTPUBLISHER_CACHE', None)
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def get_cache_timeout():
+    """ get_cache_timeout """
+    return getattr(settings, 'SNAPSHOTPUBLISHER_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)
+
+
+class LocalCache:
+    """
+    LocalCache
+
+    LRU cache of the process bounded by the size of its values in bytes. Values are stored
+    pickled so callers can't alter the cached copy and their size is known exactly.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ get """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        """ set, values bigger than max_bytes are not cached """
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous_value = self._entries.pop(key, None)
+            if previous_value is not None:
+                self._bytes -= len(previous_value)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted_value = self._entries.popitem(last=False)
+                self._bytes -= len(evicted_value)
+                self.evictions += 1
+
+    def clear(self):
+        """ clear """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """ stats """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_local_cache = None
+_local_generations = {}
+
+
+def get_local_cache():
+    """
+    return the LocalCache of the process, None if SNAPSHOTPUBLISHER_LOCAL_CACHE_MAX_BYTES isn't
+    set or the shared cache is disabled, the generations are held in the shared cache
+    """
+    global _local_cache  # pylint: disable=global-statement
+    max_bytes = getattr(settings, 'SNAPSHOTPUBLISHER_LOCAL_CACHE_MAX_BYTES', 0)
+    if not max_bytes or get_cache() is None:
+        return None
+    if _local_cache is None or _local_cache.max_bytes != max_bytes:
+        _local_cache = LocalCache(max_bytes)
+    return _local_cache
+
+
+def get_local_cache_stats():
+    """ hit, miss and eviction counters of the LocalCache, None if disabled """
+    local_cache = get_local_cache()
+    return local_cache.stats() if local_cache is not None else None
+
+
+def generation_key(site_code):
+    """ generation_key """
+    return '{}:generation:{}'.format(CACHE_KEY_PREFIX, site_code)
+
+
+def _initial_generation():
+    # start from the clock so a generation evicted from the cache never comes back
+    # to a value that older entries were stored with
+    return int(time.time() * 1000)
+
+
+def get_generation(site_code):
+    """
+    return the cache generation of a site, every cache key of the site embeds it, None if
+    caching is disabled
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+
+    # SNAPSHOTPUBLISHER_LOCAL_CACHE_GENERATION_TTL allows to skip the round trip to the shared
+    # cache, writes from other processes are then seen with up to this delay
+    generation_ttl = getattr(settings, 'SNAPSHOTPUBLISHER_LOCAL_CACHE_GENERATION_TTL', 0)
+    if generation_ttl:
+        generation, expires = _local_generations.get(site_code, (None, 0))
+        if expires > time.monotonic():
+            return generation
+
+    generation = _get_shared_generation(cache, site_code)
+    if generation_ttl:
+        _local_generations[site_code] = (generation, time.monotonic() + generation_ttl)
+    return generation
+
+
+def _get_shared_generation(cache, site_code):
+    key = generation_key(site_code)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _initial_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_cutover_generation(site_code):
+    """
+    return the generation the next go live of a site will set if no other write happens
+    before, None if caching is disabled
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+    return _get_shared_generation(cache, site_code) + CUTOVER_STEP
+
+
+def previous_generation_key(site_code):
+    """ previous_generation_key """
+    return '{}:previous-generation:{}'.format(CACHE_KEY_PREFIX, site_code)
+
+
+def bump_generation(site_code, cutover=False):
+    """
+    invalidate every cache entry of a site, cutover is set by a go live so the entries
+    stored by the warm-up become current
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    _local_generations.pop(site_code, None)
+    key = generation_key(site_code)
+    step = CUTOVER_STEP if cutover else 1
+    try:
+        generation = cache.incr(key, step)
+    except ValueError:
+        cache.add(key, _initial_generation(), None)
+    else:
+        cache.set(previous_generation_key(site_code), generation - step, None)
+
+
+def cutover(site_code, live_content_release):
+    """
+    bump the generation of a site whose live release changed, the new live release is cached
+    first so the go live doesn't send every reader to the database
+    """
+    generation = get_cutover_generation(site_code)
+    if generation is not None:
+        prefetch_related_objects([live_content_release], 'parameters')
+        set_live(site_code, generation, live_content_release)
+    bump_generation(site_code, cutover=True)
+
+
+def bump_generation_on_commit(site_code):
+    """
+    bump_generation once the transaction of the write is committed, at once outside of a
+    transaction
+    """
+    transaction.on_commit(partial(bump_generation, site_code), using=get_primary_database())
+
+
+def cutover_on_commit(site_code, live_content_release):
+    """
+    cutover once the transaction of the go live is committed, at once outside of a transaction
+    """
+    transaction.on_commit(
+        partial(cutover, site_code, live_content_release), using=get_primary_database())
+
+
+def _get_many(keys):
+    """ read keys from the LocalCache then the shared cache """
+    values = {}
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        for key in keys:
+            value = local_cache.get(key)
+            if value is not None:
+                values[key] = value
+    missing_keys = [key for key in keys if key not in values]
+    if missing_keys:
+        shared_values = get_cache().get_many(missing_keys)
+        if local_cache is not None:
+            for key, value in shared_values.items():
+                local_cache.set(key, value)
+        values.update(shared_values)
+    return values
+
+
+def _set_many(values, timeout):
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        for key, value in values.items():
+            local_cache.set(key, value)
+    get_cache().set_many(values, timeout)
+
+
+def document_cache_key(site_code, release_uuid, document_key, content_type, generation,
+                       resolve_base_release=False):
+    """ document_cache_key """
+    # hash the document key, it can be longer or contain characters memcached doesn't accept
+    document_hash = hashlib.md5('{}:{}'.format(content_type, document_key).encode()).hexdigest()
+    return '{}:{}:{}:{}:{}:{}'.format(
+        CACHE_KEY_PREFIX, 'resolved-document' if resolve_base_release else 'document',
+        site_code, generation, release_uuid, document_hash)
+
+
+def get_documents(site_code, generation, release_uuid, keys, resolve_base_release=False):
+    """
+    return a dict of the cached documents by (document_key, content_type), only the keys found
+    in the cache are returned
+    """
+    if generation is None:
+        return {}
+    cache_keys = {
+        document_cache_key(
+            site_code, release_uuid, document_key, content_type, generation,
+            resolve_base_release,
+        ): (document_key, content_type)
+        for document_key, content_type in keys
+    }
+    return {
+        cache_keys[cache_key]: document
+        for cache_key, document in _get_many(list(cache_keys.keys())).items()
+    }
+
+
+def get_all_documents(site_code, generation, release_uuid, keys, resolve_base_release=False):
+    """ same as get_documents but return None unless every key is cached """
+    documents = get_documents(site_code, generation, release_uuid, keys, resolve_base_release)
+    return documents if len(documents) == len(set(keys)) else None
+
+
+def documents_cache_key(site_code, release_uuid, keys, generation, resolve_base_release=False):
+    """ key of a batch of documents, only used to coalesce identical batches """
+    keys_hash = hashlib.md5(json.dumps(sorted(keys)).encode()).hexdigest()
+    return '{}:{}:{}:{}:{}:{}'.format(
+        CACHE_KEY_PREFIX, 'resolved-documents' if resolve_base_release else 'documents',
+        site_code, generation, release_uuid, keys_hash)
+
+
+def set_documents(site_code, generation, release_uuid, documents, resolve_base_release=False):
+    """ cache a dict of documents by (document_key, content_type) """
+    if generation is None or not documents:
+        return
+    _set_many({
+        document_cache_key(
+            site_code, release_uuid, document_key, content_type, generation,
+            resolve_base_release,
+        ): document
+        for (document_key, content_type), document in documents.items()
+    }, get_cache_timeout())
+
+
+def get_document(site_code, generation, release_uuid, document_key, content_type):
+    """ return the cached document dict, None if missing or caching is disabled """
+    return get_documents(
+        site_code, generation, release_uuid, [(document_key, content_type)]).get(
+            (document_key, content_type))
+
+
+def set_document(site_code, generation, release_uuid, document_key, content_type, document):
+    """ set_document """
+    set_documents(site_code, generation, release_uuid, {(document_key, content_type): document})
+
+
+def live_cache_key(site_code, generation):
+    """ live_cache_key """
+    return '{}:live:{}:{}'.format(CACHE_KEY_PREFIX, site_code, generation)
+
+
+def get_live(site_code, generation):
+    """
+    return the cached live ContentRelease of a site, None if missing or if a staged release
+    is scheduled to go live since it was cached
+    """
+    if generation is None:
+        return None
+    key = live_cache_key(site_code, generation)
+    live_content_release, valid_until = _get_many([key]).get(key, (None, None))
+    if valid_until is not None and valid_until <= timezone.now():
+        return None
+    return live_content_release
+
+
+def set_live(site_code, generation, live_content_release, valid_until=None):
+    """ set_live, valid_until is the publish_datetime of the next scheduled release """
+    if generation is None:
+        return
+    _set_many({
+        live_cache_key(site_code, generation): (live_content_release, valid_until),
+    }, get_cache_timeout())
+
+
+def document_diff_cache_key(from_hash, to_hash):
+    """ document_diff_cache_key, bodies are immutable so the key needs no generation """
+    return '{}:document-diff:{}:{}'.format(CACHE_KEY_PREFIX, from_hash or '', to_hash or '')
+
+
+def get_document_diffs(hash_pairs):
+    """
+    return a dict of the cached diffs by (from_hash, to_hash), only the pairs found in the cache
+    are returned
+    """
+    if get_cache() is None:
+        return {}
+    cache_keys = {
+        document_diff_cache_key(from_hash, to_hash): (from_hash, to_hash)
+        for from_hash, to_hash in hash_pairs
+    }
+    return {
+        cache_keys[cache_key]: diff
+        for cache_key, diff in _get_many(list(cache_keys.keys())).items()
+    }
+
+
+def set_document_diffs(diffs):
+    """ cache a dict of diffs by (from_hash, to_hash) """
+    if get_cache() is None or not diffs:
+        return
+    _set_many({
+        document_diff_cache_key(from_hash, to_hash): diff
+        for (from_hash, to_hash), diff in diffs.items()
+    }, get_cache_timeout())
+
+
+class SingleFlight:
+    """
+    SingleFlight
+
+    Run a function once per key at a time in the process, the threads asking for a key being
+    computed wait for it and get a copy of its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        """ do """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = {'event': threading.Event()}
+
+        if not is_leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return copy.deepcopy(call['result'])
+
+        try:
+            call['result'] = function()
+            return call['result']
+        except Exception as error:
+            call['error'] = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+_single_flight = SingleFlight()
+
+
+def coalesce(key, compute, recheck=None, stale=None):
+    """
+    return compute() making sure only one caller computes a key at a time: in the process
+    (single flight) and, if the shared cache is enabled, across processes with a lock in the
+    shared cache. A process that doesn't get the lock returns stale() if it has a value,
+    else waits up to SNAPSHOTPUBLISHER_STAMPEDE_WAIT for recheck() to find the value stored
+    by the lock holder, then computes it itself.
+    """
+    # a caller pinned to the primary after its write must not get the result read from a replica
+    return _single_flight.do(
+        (key, get_current_read_database()), partial(_compute_once, key, compute, recheck, stale))
+
+
+def _compute_once(key, compute, recheck, stale):
+    cache = get_cache()
+    if cache is None:
+        return compute()
+
+    lock_key = '{}:lock:{}'.format(CACHE_KEY_PREFIX, hashlib.md5(key.encode()).hexdigest())
+    if cache.add(lock_key, 1, getattr(
+            settings, 'SNAPSHOTPUBLISHER_STAMPEDE_LOCK_TIMEOUT', DEFAULT_STAMPEDE_LOCK_TIMEOUT)):
+        try:
+            return compute()
+        finally:
+            cache.delete(lock_key)
+
+    if stale is not None:
+        value = stale()
+        if value is not None:
+            return value
+    deadline = time.monotonic() + getattr(
+        settings, 'SNAPSHOTPUBLISHER_STAMPEDE_WAIT', DEFAULT_STAMPEDE_WAIT)
+    while recheck is not None and time.monotonic() < deadline:
+        time.sleep(STAMPEDE_POLL_INTERVAL)
+        value = recheck()
+        if value is not None:
+            return value
+        # released without storing a value, e.g. the document doesn't exist
+        if cache.get(lock_key) is None:
+            break
+    return compute()
+
+
+def get_stale_generation(site_code, generation):
+    """
+    return the generation before `generation` whose entries can be served while a key is
+    recomputed, None if SNAPSHOTPUBLISHER_SERVE_STALE is False or the context must read its
+    own writes
+    """
+    if generation is None or not getattr(settings, 'SNAPSHOTPUBLISHER_SERVE_STALE', True) or \
+            is_primary_pinned():
+        return None
+    previous_generation = get_cache().get(previous_generation_key(site_code))
+    if previous_generation is None or previous_generation >= generation:
+        return generation - 1
+    return previous_generation
@@ -0,0 +1,55 @@
+"""
+.. module:: djangosnapshotpublisher.changelog
+   :synopsis: append-only log of the changes of a site
+
+Every document published, unpublished or deleted and every release going live appends a
+ChangeLogEntry numbered by a sequence per site, so a consumer (CDN purge, search indexing...)
+syncs by reading the entries after the last sequence it saw.
+
+The sequences are allocated by locking the ChangeLogSequence row of the site in the transaction
+of the change, so the entries of a site are committed in the order of their sequence and a
+consumer never sees a sequence appear behind the one it already read.
+"""
+
+from django.db import router, transaction
+
+from .models import ChangeLogEntry, ChangeLogSequence
+
+
+DEFAULT_CHANGES_LIMIT = 100
+
+
+def record_changes(site_code, release_uuid, action, keys=None):
+    """
+    append the entries of an action in a release, one per (document_key, content_type) of keys,
+    or one entry without a document if keys is None; to be called in the transaction of the change
+    """
+    keys = [(None, None)] if keys is None else list(keys)
+    if not keys:
+        return []
+    using = router.db_for_write(ChangeLogEntry)
+    with transaction.atomic(using=using):
+        sequence, _ = ChangeLogSequence.objects.using(using).select_for_update().get_or_create(
+            site_code=site_code)
+        first_sequence = sequence.sequence + 1
+        sequence.sequence += len(keys)
+        sequence.save(update_fields=['sequence'])
+        return ChangeLogEntry.objects.using(using).bulk_create([
+            ChangeLogEntry(
+                site_code=site_code,
+                sequence=first_sequence + index,
+                action=action,
+                release_uuid=release_uuid,
+                document_key=document_key,
+                content_type=content_type,
+            )
+            for index, (document_key, content_type) in enumerate(keys)
+        ])
+
+
+def get_changes_since(site_code, sequence=0, limit=DEFAULT_CHANGES_LIMIT):
+    """ the entries of a site after sequence, in the order of their sequence """
+    return ChangeLogEntry.objects.filter(
+        site_code=site_code,
+        sequence__gt=sequence,
+    ).order_by('sequence')[:limit]
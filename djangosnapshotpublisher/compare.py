@@ -0,0 +1,244 @@
+"""
+.. module:: djangosnapshotpublisher.compare
+   :synopsis: compare two content releases page by page
+
+The documents of a release are its own documents plus the ones of its base release it doesn't
+override. Between two releases a document is:
+
+* Added: in the first release and not in the second one (or deleted there)
+* Removed: in the second release and not in the first one (or deleted there)
+* Changed: in both, with a different body or different parameters
+
+Each diff type is a queryset ordered by (content_type, document_key), so the rows are produced
+in (diff, content_type, document_key) order with constant memory, resuming after any row.
+
+`document_json_diff` gives the field level changes of a document between two releases.
+"""
+
+import base64
+import binascii
+import json
+
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+
+from .models import ContentRelease, ReleaseDocument, ReleaseDocumentExtraParameter
+
+
+DIFF_TYPES = ['Added', 'Changed', 'Removed']
+DEFAULT_COMPARE_PAGE_SIZE = 100
+
+
+def _same_key(release_documents):
+    return release_documents.filter(
+        document_key=OuterRef('document_key'),
+        content_type=OuterRef('content_type'),
+    )
+
+
+def release_documents_with_base_release(content_release):
+    """ the documents of a release and the ones of its base release it doesn't override """
+    release_documents = ReleaseDocument.objects.filter(content_releases=content_release.id)
+    base_release_id = content_release.base_release_id
+    if content_release.use_current_live_as_base_release:
+        try:
+            base_release_id = ContentRelease.objects.live(content_release.site_code).id
+        except ContentRelease.DoesNotExist:
+            base_release_id = None
+    if base_release_id is None:
+        return release_documents
+    return ReleaseDocument.objects.filter(
+        Q(id__in=release_documents.values('id')) |
+        Q(id__in=ReleaseDocument.objects.filter(
+            content_releases=base_release_id,
+        ).exclude(
+            Exists(_same_key(release_documents)),
+        ).values('id'))
+    )
+
+
+def compare_querysets(my_content_release, compare_to_content_release):
+    """
+    return a dict of querysets of ReleaseDocuments by diff type, ordered by (content_type,
+    document_key): the documents of my_content_release for Added and Changed (annotated with
+    compare_to_id, the document they are compared to), the ones of compare_to_content_release
+    for Removed
+    """
+    my_release_documents = release_documents_with_base_release(
+        my_content_release).filter(deleted=False)
+    compare_to_release_documents = release_documents_with_base_release(
+        compare_to_content_release).filter(deleted=False)
+    parameters = ReleaseDocumentExtraParameter.objects
+
+    compare_to_release_document = _same_key(compare_to_release_documents)
+    changed = my_release_documents.annotate(
+        compare_to_id=Subquery(compare_to_release_document.values('id')[:1]),
+        compare_to_blob_id=Subquery(compare_to_release_document.values('blob_id')[:1]),
+    ).filter(
+        compare_to_id__isnull=False,
+    ).exclude(
+        compare_to_id=F('id'),
+    ).annotate(
+        parameters_added=Exists(parameters.filter(
+            release_document=OuterRef('id'),
+        ).exclude(Exists(parameters.filter(
+            release_document=OuterRef(OuterRef('compare_to_id')),
+            key=OuterRef('key'),
+            content=OuterRef('content'),
+        )))),
+        parameters_removed=Exists(parameters.filter(
+            release_document=OuterRef('compare_to_id'),
+        ).exclude(Exists(parameters.filter(
+            release_document=OuterRef(OuterRef('id')),
+            key=OuterRef('key'),
+            content=OuterRef('content'),
+        )))),
+    ).filter(
+        ~Q(compare_to_blob_id=F('blob_id')) |
+        Q(parameters_added=True) |
+        Q(parameters_removed=True)
+    )
+
+    ordering = ['content_type', 'document_key']
+    return {
+        'Added': my_release_documents.exclude(
+            Exists(compare_to_release_document),
+        ).order_by(*ordering),
+        'Changed': changed.order_by(*ordering),
+        'Removed': compare_to_release_documents.exclude(
+            Exists(_same_key(my_release_documents)),
+        ).order_by(*ordering),
+    }
+
+
+def compare_summary(my_content_release, compare_to_content_release):
+    """ return the number of documents by diff type """
+    return {
+        diff: release_documents.count()
+        for diff, release_documents in compare_querysets(
+            my_content_release, compare_to_content_release).items()
+    }
+
+
+def iter_compare(my_content_release, compare_to_content_release, after=None, chunk_size=500):
+    """
+    yield the diff rows in (diff, content_type, document_key) order, after the row with the
+    (diff, content_type, document_key) `after` if set, reading chunk_size documents at a time
+    """
+    querysets = compare_querysets(my_content_release, compare_to_content_release)
+    for diff in DIFF_TYPES:
+        if after is not None and diff < after[0]:
+            continue
+        position = after[1:] if after is not None and diff == after[0] else None
+        while True:
+            release_documents = querysets[diff]
+            if position is not None:
+                release_documents = release_documents.filter(
+                    Q(content_type__gt=position[0]) |
+                    Q(content_type=position[0], document_key__gt=position[1])
+                )
+            release_documents = list(release_documents[:chunk_size])
+            if not release_documents:
+                break
+            yield from _diff_rows(diff, release_documents)
+            position = (release_documents[-1].content_type, release_documents[-1].document_key)
+
+
+def _diff_rows(diff, release_documents):
+    release_document_ids = [release_document.id for release_document in release_documents]
+    if diff == 'Changed':
+        release_document_ids += [
+            release_document.compare_to_id for release_document in release_documents]
+    parameters = {}
+    for release_document_id, key, content in ReleaseDocumentExtraParameter.objects.filter(
+            release_document_id__in=release_document_ids,
+    ).values_list('release_document_id', 'key', 'content'):
+        parameters.setdefault(release_document_id, {})[key] = content
+
+    for release_document in release_documents:
+        row = {
+            'document_key': release_document.document_key,
+            'content_type': release_document.content_type,
+            'diff': diff,
+        }
+        if diff == 'Changed':
+            release_from = parameters.get(release_document.id, {})
+            release_compare_to = parameters.get(release_document.compare_to_id, {})
+            if release_from or release_compare_to:
+                row['parameters'] = {
+                    'release_from': release_from,
+                    'release_compare_to': release_compare_to,
+                }
+        elif release_document.id in parameters:
+            row['parameters'] = parameters[release_document.id]
+        yield row
+
+
+def _pointer(path, key):
+    return '{}/{}'.format(path, str(key).replace('~', '~0').replace('/', '~1'))
+
+
+def json_diff(old, new, path=''):
+    """
+    return the changes from old to new, a list of {'op': 'add' | 'remove' | 'replace', 'path'}
+    with the added 'value' and the replaced or removed 'old_value', path being a JSON pointer
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(old.keys() | new.keys()):
+            if key not in new:
+                changes.append({'op': 'remove', 'path': _pointer(path, key), 'old_value': old[key]})
+            elif key not in old:
+                changes.append({'op': 'add', 'path': _pointer(path, key), 'value': new[key]})
+            else:
+                changes += json_diff(old[key], new[key], _pointer(path, key))
+        return changes
+    if isinstance(old, list) and isinstance(new, list):
+        changes = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            changes += json_diff(old_item, new_item, _pointer(path, index))
+        for index in range(len(new), len(old)):
+            changes.append({'op': 'remove', 'path': _pointer(path, index), 'old_value': old[index]})
+        for index in range(len(old), len(new)):
+            changes.append({'op': 'add', 'path': _pointer(path, index), 'value': new[index]})
+        return changes
+    # 1 == 1.0 == True in python, not in JSON
+    if type(old) is type(new) and old == new:
+        return []
+    return [{'op': 'replace', 'path': path, 'old_value': old, 'value': new}]
+
+
+def document_json_diff(old_document_json, new_document_json):
+    """
+    json_diff of two document_json, a missing document is None and a body which isn't valid
+    JSON is compared as a string
+    """
+    def load(document_json):
+        try:
+            return json.loads(document_json)
+        except ValueError:
+            return document_json
+
+    if old_document_json is None and new_document_json is None:
+        return []
+    if old_document_json is None:
+        return [{'op': 'add', 'path': '', 'value': load(new_document_json)}]
+    if new_document_json is None:
+        return [{'op': 'remove', 'path': '', 'old_value': load(old_document_json)}]
+    return json_diff(load(old_document_json), load(new_document_json))
+
+
+def encode_cursor(row):
+    """ encode_cursor, opaque cursor of the page after a diff row """
+    return base64.urlsafe_b64encode(json.dumps(
+        [row['diff'], row['content_type'], row['document_key']]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """ decode_cursor, raise ValueError for an invalid cursor """
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(after, list) or len(after) != 3 or after[0] not in DIFF_TYPES:
+        raise ValueError('invalid cursor')
+    return tuple(after)
@@ -0,0 +1,148 @@
+"""
+.. module:: djangosnapshotpublisher.export
+   :synopsis: export the documents of a release to a file tree
+
+Each document is written to `<content_type>/<quoted document_key>.json` with a `manifest.json`
+listing the path and the hash of every document. A name too long for a file name is truncated and
+suffixed with its sha256. The hashes are the ones of the DocumentBlobs,
+so comparing a release with the previous manifest reads no body: in incremental mode only the
+documents whose hash changed are read and written, and the files of the documents gone are
+deleted.
+
+The database is read by the calling process, the files are written by a pool of processes.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import re
+from urllib.parse import quote
+
+from .compare import release_documents_with_base_release
+from .models import DocumentBlob, ReleaseDocument
+
+
+MANIFEST_FILENAME = 'manifest.json'
+DEFAULT_EXPORT_BATCH_SIZE = 500
+# 255 bytes on most file systems, less the suffix of the temporary file
+MAX_FILENAME_LENGTH = 240
+
+
+def _file_name(name, extension=''):
+    file_name = quote(name, safe='')
+    if len(file_name) + len(extension) <= MAX_FILENAME_LENGTH:
+        return file_name + extension
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    # cut before an incomplete %XX escape
+    prefix = re.sub(
+        r'%[0-9A-F]?$', '', file_name[:MAX_FILENAME_LENGTH - len(extension) - len(digest) - 1])
+    return '{}~{}{}'.format(prefix, digest, extension)
+
+
+def document_path(document_key, content_type):
+    """
+    path of a document relative to the export directory, ValueError if content_type can't be
+    a directory of it
+    """
+    if content_type in ('', '.', '..') or '/' in content_type or '\\' in content_type:
+        raise ValueError('Invalid content_type {!r}'.format(content_type))
+    return os.path.join(_file_name(content_type), _file_name(document_key, '.json'))
+
+
+def _write_file(path, content):
+    # written next to the file then renamed, a reader never sees a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = '{}.tmp{}'.format(path, os.getpid())
+    with open(temporary_path, 'w', encoding='utf-8') as export_file:
+        export_file.write(content)
+    os.replace(temporary_path, path)
+
+
+def _write_files(output_dir, files):
+    for path, content in files:
+        _write_file(os.path.join(output_dir, path), content)
+    return len(files)
+
+
+def read_manifest(output_dir):
+    """ the documents of the manifest of an export by path, empty if there is none """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME), encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+    return {document['path']: document for document in manifest['documents']}
+
+
+def export_static(content_release, output_dir, incremental=False, processes=None,
+                  batch_size=DEFAULT_EXPORT_BATCH_SIZE, resolve_base_release=False):
+    """
+    export the documents of a release to output_dir, with the ones of its base release it
+    doesn't override if resolve_base_release; return the number of files written, unchanged
+    and deleted
+    """
+    if resolve_base_release:
+        release_documents = release_documents_with_base_release(content_release)
+    else:
+        release_documents = ReleaseDocument.objects.filter(content_releases=content_release.id)
+
+    documents = {}
+    for document_key, content_type, blob_hash in release_documents.filter(
+            deleted=False, blob__isnull=False,
+    ).values_list('document_key', 'content_type', 'blob__hash').iterator():
+        path = document_path(document_key, content_type)
+        documents[path] = {
+            'document_key': document_key,
+            'content_type': content_type,
+            'path': path,
+            'hash': blob_hash,
+        }
+
+    previous_documents = read_manifest(output_dir)
+    if incremental:
+        paths_to_write = sorted(
+            path for path, document in documents.items()
+            if previous_documents.get(path, {}).get('hash') != document['hash'])
+    else:
+        paths_to_write = sorted(documents)
+
+    written = 0
+    processes = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # a few batches per process are read ahead, not the bodies of the whole release
+        futures = deque()
+        for index in range(0, len(paths_to_write), batch_size):
+            if len(futures) >= 2 * processes:
+                written += futures.popleft().result()
+            paths = paths_to_write[index:index + batch_size]
+            bodies = dict(DocumentBlob.objects.filter(
+                hash__in={documents[path]['hash'] for path in paths},
+            ).values_list('hash', 'body'))
+            futures.append(executor.submit(_write_files, output_dir, [
+                (path, bodies[documents[path]['hash']]) for path in paths
+            ]))
+        while futures:
+            written += futures.popleft().result()
+
+    deleted = 0
+    for path in set(previous_documents) - set(documents):
+        try:
+            os.remove(os.path.join(output_dir, path))
+            deleted += 1
+        except FileNotFoundError:
+            pass
+
+    # written last, an interrupted export is redone from the previous manifest
+    _write_file(os.path.join(output_dir, MANIFEST_FILENAME), json.dumps({
+        'site_code': content_release.site_code,
+        'release_uuid': str(content_release.uuid),
+        'documents': [documents[path] for path in sorted(documents)],
+    }, indent=1, sort_keys=True))
+
+    return {
+        'written': written,
+        'unchanged': len(documents) - len(paths_to_write),
+        'deleted': deleted,
+    }
@@ -0,0 +1,204 @@
+"""
+.. module:: djangosnapshotpublisher.garbage_collection
+   :synopsis: delete the data no release uses anymore
+
+The deletions are done in batches of primary keys, each batch in its own short transaction,
+so they can run next to the publishing without holding long locks.
+
+The archived releases are kept according to SNAPSHOTPUBLISHER_RETENTION, by site code
+(``'*'`` for the sites not listed), e.g.::
+
+    SNAPSHOTPUBLISHER_RETENTION = {
+        'site1': {'keep_last': 10, 'keep_days': 90},
+        '*': {'keep_last': 5},
+    }
+
+an archived release is expired unless it is one of the last ``keep_last`` archived releases,
+published less than ``keep_days`` days ago, or the base release of another release. Sites
+without policy keep every release.
+"""
+
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import cache
+from .models import ContentRelease, DocumentBlob, ReleaseDocument
+from .routers import get_primary_database
+
+
+DEFAULT_GC_BATCH_SIZE = 1000
+
+
+def gc_release_documents(batch_size=DEFAULT_GC_BATCH_SIZE, dry_run=False, pause=0,
+                         progress=None):
+    """
+    delete the ReleaseDocuments, tombstones included, no ContentRelease references and their
+    parameters, return the number of documents deleted (found with dry_run).
+    progress is called after every batch with the total so far.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        release_document_ids = list(ReleaseDocument.objects.orphans().filter(
+            id__gt=last_id,
+        ).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not release_document_ids:
+            break
+        last_id = release_document_ids[-1]
+
+        if dry_run:
+            total += len(release_document_ids)
+        else:
+            with transaction.atomic(using=get_primary_database()):
+                # checked again in the transaction, a document may have been added since
+                release_documents = ReleaseDocument.objects.orphans().filter(
+                    id__in=release_document_ids)
+                total += release_documents.delete()[1].get(ReleaseDocument._meta.label, 0)
+
+        if progress is not None:
+            progress(total)
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def gc_document_blobs(batch_size=DEFAULT_GC_BATCH_SIZE, dry_run=False, pause=0, progress=None):
+    """
+    delete the DocumentBlobs no ReleaseDocument references anymore, return the number of blobs
+    deleted (found with dry_run, counting the blobs of the documents gc_release_documents
+    would delete). progress is called after every batch with the total so far.
+    """
+    if dry_run:
+        document_blobs = DocumentBlob.objects.exclude(
+            release_documents__content_releases__isnull=False)
+    else:
+        document_blobs = DocumentBlob.objects.filter(release_documents__isnull=True)
+
+    total = 0
+    last_id = 0
+    while True:
+        document_blob_ids = list(document_blobs.filter(
+            id__gt=last_id,
+        ).order_by('id').values_list('id', flat=True).distinct()[:batch_size])
+        if not document_blob_ids:
+            break
+        last_id = document_blob_ids[-1]
+
+        if dry_run:
+            total += len(document_blob_ids)
+        else:
+            total += _delete_document_blobs(document_blob_ids)
+
+        if progress is not None:
+            progress(total)
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def _delete_document_blobs(document_blob_ids):
+    with transaction.atomic(using=get_primary_database()):
+        # locked then checked again in the transaction, a document may reference them since.
+        # The blobs locked by a ReleaseDocument.save being committed are in use, they are skipped
+        document_blob_ids = list(DocumentBlob.objects.select_for_update(
+            skip_locked=True,
+        ).filter(id__in=document_blob_ids).order_by('id').values_list('id', flat=True))
+        return DocumentBlob.objects.filter(
+            id__in=document_blob_ids,
+            release_documents__isnull=True,
+        ).delete()[1].get(DocumentBlob._meta.label, 0)
+
+
+def get_retention_policy(site_code):
+    """ return the retention policy of a site, None to keep every release """
+    policies = getattr(settings, 'SNAPSHOTPUBLISHER_RETENTION', {})
+    policy = policies.get(site_code, policies.get('*'))
+    if not policy or not (policy.get('keep_last') or policy.get('keep_days')):
+        return None
+    return policy
+
+
+def expired_content_releases(site_code, keep_last=None, keep_days=None):
+    """ the archived releases of a site out of the retention policy, oldest first """
+    archived_content_releases = ContentRelease.objects.archived(site_code)
+    kept = Q(id__in=ContentRelease.objects.filter(
+        base_release__isnull=False,
+    ).values('base_release'))
+    if keep_last:
+        kept |= Q(id__in=list(archived_content_releases.order_by(
+            F('publish_datetime').desc(nulls_last=True), '-id',
+        ).values_list('id', flat=True)[:keep_last]))
+    if keep_days:
+        kept |= Q(publish_datetime__gte=timezone.now() - timedelta(days=keep_days))
+    return archived_content_releases.exclude(kept).order_by(
+        F('publish_datetime').asc(nulls_first=True), 'id')
+
+
+def delete_content_release(content_release, batch_size=DEFAULT_GC_BATCH_SIZE, pause=0):
+    """
+    delete a release and the documents no other release references with their blobs, the
+    documents are detached and deleted in batches so an interrupted deletion is carried on by
+    the next call, return the number of documents deleted
+    """
+    total = 0
+    while True:
+        with transaction.atomic(using=get_primary_database()):
+            release_document_ids = list(content_release.release_documents.order_by(
+                'id').values_list('id', flat=True)[:batch_size])
+            if not release_document_ids:
+                break
+            content_release.release_documents.remove(*release_document_ids)
+            release_documents = ReleaseDocument.objects.orphans().filter(
+                id__in=release_document_ids)
+            document_blob_ids = list(release_documents.exclude(
+                blob=None).values_list('blob', flat=True))
+            total += release_documents.delete()[1].get(ReleaseDocument._meta.label, 0)
+        _delete_document_blobs(document_blob_ids)
+        if pause:
+            time.sleep(pause)
+    content_release.delete()
+    return total
+
+
+def apply_retention_policy(site_codes=None, batch_size=DEFAULT_GC_BATCH_SIZE, dry_run=False,
+                           limit=None, pause=0, progress=None):
+    """
+    delete the expired archived releases of the sites and their exclusive documents, at most
+    limit releases per call, return the number of releases deleted (found with dry_run).
+    progress is called after every release with the release and its number of exclusive
+    documents.
+    """
+    if site_codes is None:
+        site_codes = ContentRelease.objects.values_list('site_code', flat=True).distinct()
+
+    total = 0
+    for site_code in site_codes:
+        policy = get_retention_policy(site_code)
+        if policy is None:
+            continue
+        content_releases = expired_content_releases(
+            site_code, policy.get('keep_last'), policy.get('keep_days'))
+        if limit is not None:
+            content_releases = content_releases[:limit - total]
+        for content_release in list(content_releases):
+            if dry_run:
+                # filtered by id, a filter on content_releases would restrict the count
+                count = ReleaseDocument.objects.filter(
+                    id__in=content_release.release_documents.values('id'),
+                ).annotate(
+                    release_count=Count('content_releases'),
+                ).filter(release_count=1).count()
+            else:
+                count = delete_content_release(content_release, batch_size, pause)
+                cache.bump_generation_on_commit(site_code)
+            total += 1
+            if progress is not None:
+                progress(content_release, count)
+        if limit is not None and total >= limit:
+            break
+    return total
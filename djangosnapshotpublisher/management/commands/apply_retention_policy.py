@@ -0,0 +1,52 @@
+"""
+.. module:: djangosnapshotpublisher.management.commands.apply_retention_policy
+"""
+
+from django.core.management.base import BaseCommand
+
+from djangosnapshotpublisher.garbage_collection import (DEFAULT_GC_BATCH_SIZE,
+                                                        apply_retention_policy)
+
+
+class Command(BaseCommand):
+    """ Command """
+    help = 'Delete the archived ContentRelease out of SNAPSHOTPUBLISHER_RETENTION'
+
+    def add_arguments(self, parser):
+        """ add_arguments """
+        parser.add_argument(
+            'site_codes', nargs='*',
+            help='sites to apply the retention policy to, all by default',
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_GC_BATCH_SIZE)
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='maximum number of releases deleted by this run',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='seconds to wait between two batches of documents',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='list the expired releases without deleting them',
+        )
+
+    def handle(self, *args, **options):
+        """ handle """
+        action = 'Found' if options['dry_run'] else 'Deleted'
+
+        def progress(content_release, count):
+            self.stdout.write('{} {} {} ({}) with {} exclusive documents'.format(
+                action, content_release.site_code, content_release.uuid,
+                content_release.version, count))
+
+        count = apply_retention_policy(
+            site_codes=options['site_codes'] or None,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            limit=options['limit'],
+            pause=options['pause'],
+            progress=progress,
+        )
+        self.stdout.write('{} {} expired releases'.format(action, count))
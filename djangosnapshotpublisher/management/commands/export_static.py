@@ -0,0 +1,58 @@
+"""
+.. module:: djangosnapshotpublisher.management.commands.export_static
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangosnapshotpublisher.export import DEFAULT_EXPORT_BATCH_SIZE, export_static
+from djangosnapshotpublisher.models import ContentRelease
+
+
+class Command(BaseCommand):
+    """ Command """
+    help = 'Export the documents of a ContentRelease to a file tree with a manifest of their hashes'
+
+    def add_arguments(self, parser):
+        """ add_arguments """
+        parser.add_argument('site_code')
+        parser.add_argument('release_uuid', help='uuid of the release or "live"')
+        parser.add_argument('path')
+        parser.add_argument(
+            '--resolve-base-release', action='store_true',
+            help='include the documents of the base release the release doesn\'t override',
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='only write the documents whose hash changed since the previous manifest',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='number of processes writing the files, the number of CPUs by default',
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_EXPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        """ handle """
+        try:
+            if options['release_uuid'] == 'live':
+                content_release = ContentRelease.objects.live(options['site_code'])
+            else:
+                content_release = ContentRelease.objects.get(
+                    site_code=options['site_code'], uuid=options['release_uuid'])
+        except ContentRelease.DoesNotExist:
+            raise CommandError('ContentRelease doesn\'t exists')
+
+        try:
+            counts = export_static(
+                content_release, options['path'],
+                incremental=options['incremental'],
+                processes=options['processes'],
+                batch_size=options['batch_size'],
+                resolve_base_release=options['resolve_base_release'],
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            'Exported {} into {}: {} written, {} unchanged, {} deleted'.format(
+                content_release.uuid, options['path'], counts['written'], counts['unchanged'],
+                counts['deleted']))
@@ -0,0 +1,51 @@
+"""
+.. module:: djangosnapshotpublisher.management.commands.gc_release_documents
+"""
+
+from django.core.management.base import BaseCommand
+
+from djangosnapshotpublisher.garbage_collection import (DEFAULT_GC_BATCH_SIZE,
+                                                        gc_document_blobs,
+                                                        gc_release_documents)
+
+
+class Command(BaseCommand):
+    """ Command """
+    help = 'Delete the ReleaseDocuments no ContentRelease references and their DocumentBlobs'
+
+    def add_arguments(self, parser):
+        """ add_arguments """
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_GC_BATCH_SIZE)
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='seconds to wait between two batches',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='count the documents without deleting them',
+        )
+
+    def handle(self, *args, **options):
+        """ handle """
+        action = 'Found' if options['dry_run'] else 'Deleted'
+
+        def progress(name):
+            def write_progress(count):
+                if options['verbosity'] >= 2:
+                    self.stdout.write('{} {} {} so far'.format(action, count, name))
+            return write_progress
+
+        count = gc_release_documents(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            pause=options['pause'],
+            progress=progress('documents'),
+        )
+        self.stdout.write('{} {} orphaned documents'.format(action, count))
+        count = gc_document_blobs(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            pause=options['pause'],
+            progress=progress('blobs'),
+        )
+        self.stdout.write('{} {} unreferenced blobs'.format(action, count))
@@ -0,0 +1,40 @@
+"""
+.. module:: djangosnapshotpublisher.management.commands.pack_content_release
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangosnapshotpublisher.models import ContentRelease
+from djangosnapshotpublisher.packed_release import write_packed_release
+
+
+class Command(BaseCommand):
+    """ Command """
+    help = 'Pack a ContentRelease into a single file served by PackedRelease'
+
+    def add_arguments(self, parser):
+        """ add_arguments """
+        parser.add_argument('site_code')
+        parser.add_argument('release_uuid', help='uuid of the release or "live"')
+        parser.add_argument('path')
+        parser.add_argument(
+            '--resolve-base-release', action='store_true',
+            help='include the documents of the base release the release doesn\'t override',
+        )
+
+    def handle(self, *args, **options):
+        """ handle """
+        try:
+            if options['release_uuid'] == 'live':
+                content_release = ContentRelease.objects.live(options['site_code'])
+            else:
+                content_release = ContentRelease.objects.get(
+                    site_code=options['site_code'], uuid=options['release_uuid'])
+        except ContentRelease.DoesNotExist:
+            raise CommandError('ContentRelease doesn\'t exists')
+
+        count = write_packed_release(
+            content_release, options['path'],
+            resolve_base_release=options['resolve_base_release'])
+        self.stdout.write('Packed {} documents of {} into {}'.format(
+            count, content_release.uuid, options['path']))
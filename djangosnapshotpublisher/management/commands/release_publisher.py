@@ -2,19 +2,49 @@
 .. module:: djangosnapshotpublisher.management.commands.release_publisher
 """
 
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 
 from djangosnapshotpublisher.models import ContentRelease
 from djangosnapshotpublisher.publisher_api import PublisherAPI
+from djangosnapshotpublisher.warmup import warm_content_release
 
 
 class Command(BaseCommand):
     """ Command """
     help = 'Publish schedule ContentRelease'
 
+    def add_arguments(self, parser):
+        """ add_arguments """
+        parser.add_argument(
+            '--warm-ahead', type=int, default=600,
+            help='warm the cache for the releases scheduled in the next WARM_AHEAD seconds, '
+                 'it should be below SNAPSHOTPUBLISHER_CACHE_TIMEOUT, 0 to disable',
+        )
+        parser.add_argument('--warm-batch-size', type=int, default=None)
+        parser.add_argument('--warm-concurrency', type=int, default=None)
+
     def handle(self, *args, **options):
         """ handle """
         site_codes = ContentRelease.objects.values_list('site_code', flat=True).distinct()
         for site_code in site_codes:
             publisher_api = PublisherAPI(api_type='django')
             publisher_api.get_live_content_release(site_code)
+
+        if not options['warm_ahead']:
+            return
+        now = timezone.now()
+        scheduled_content_releases = ContentRelease.objects.filter(
+            status=1,
+            is_stage=True,
+            publish_datetime__gt=now,
+            publish_datetime__lte=now + timedelta(seconds=options['warm_ahead']),
+        )
+        for content_release in scheduled_content_releases:
+            count = warm_content_release(
+                content_release, options['warm_batch_size'], options['warm_concurrency'])
+            if count is not None:
+                self.stdout.write('Warmed {} documents of {}'.format(
+                    count, content_release.uuid))
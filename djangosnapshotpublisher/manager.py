@@ -2,9 +2,12 @@
 .. module:: djangosnapshotpublisher.manager
    :synopsis: djangosnapshotpublisher manager
 """
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
+from . import cache
+from .routers import get_primary_database
+
 
 class ContentReleaseManager(models.Manager):
     """ ContentReleaseManager """
@@ -40,6 +43,8 @@ class ContentReleaseManager(models.Manager):
 
     def live(self, site_code):
         """ live """
+        # changelog imports the models
+        from . import changelog
         # current_live_release = None
         # try:
         #     current_live_release = self.get_queryset().get(
@@ -57,20 +62,20 @@ class ContentReleaseManager(models.Manager):
                 is_stage=True,
                 publish_datetime__lt=timezone.now(),
             )
-            stage_content_release_ready.is_live = True
-            stage_content_release_ready.is_stage = False
-            stage_content_release_ready.status = 2
-            stage_content_release_ready.save()
-            current_live_release = self.get_queryset().filter(
-                site_code=site_code,
-                status=2,
-                is_live=True,
-            )
-            if current_live_release.exists():
-                current_live_release.is_live = False
-                current_live_release.status = 3
-                current_live_release.save()
+            # archive the current live release before promoting the staged one
+            with transaction.atomic(using=get_primary_database()):
+                self.get_queryset().filter(
+                    site_code=site_code,
+                    status=2,
+                    is_live=True,
+                ).update(is_live=False, status=3)
+                stage_content_release_ready.is_live = True
+                stage_content_release_ready.is_stage = False
+                stage_content_release_ready.status = 2
+                stage_content_release_ready.save()
+                changelog.record_changes(site_code, stage_content_release_ready.uuid, 'live')
             current_live_release = stage_content_release_ready
+            cache.cutover_on_commit(site_code, current_live_release)
         except self.model.DoesNotExist:
             pass
 
@@ -115,3 +120,11 @@ class ContentReleaseManager(models.Manager):
     #         uuid=uuid,
     #         publish_datetime__lt=timezone.now(),
     #     ).exists()
+
+
+class ReleaseDocumentManager(models.Manager):
+    """ ReleaseDocumentManager """
+
+    def orphans(self):
+        """ the ReleaseDocuments no ContentRelease references """
+        return self.get_queryset().filter(content_releases__isnull=True)
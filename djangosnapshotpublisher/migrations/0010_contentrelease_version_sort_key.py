@@ -0,0 +1,46 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:07
+
+import re
+
+from django.db import migrations, models
+
+
+def version_sort_key(value):
+    # copy of models.version_sort_key as of this migration
+    if not value or not re.match(r'^([0-9])+(\.[0-9]+)*$', value):
+        return None
+    numbers = [number.lstrip('0') for number in value.split('.')]
+    while len(numbers) > 1 and not numbers[-1]:
+        numbers.pop()
+    return '.'.join('{:02d}{}'.format(len(number), number) for number in numbers)
+
+
+def set_version_sort_key(apps, schema_editor):
+    ContentRelease = apps.get_model('djangosnapshotpublisher', 'ContentRelease')
+    content_releases = ContentRelease.objects.using(schema_editor.connection.alias)
+    content_releases_to_update = list(
+        content_releases.exclude(version=None).only('id', 'version').iterator())
+    for content_release in content_releases_to_update:
+        content_release.version_sort_key = version_sort_key(content_release.version)
+    content_releases.bulk_update(
+        content_releases_to_update, ['version_sort_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangosnapshotpublisher', '0009_auto_20201019_0929'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentrelease',
+            name='version_sort_key',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(set_version_sort_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='contentrelease',
+            index=models.Index(fields=['site_code', 'version_sort_key'], name='djangosnaps_site_co_c8492a_idx'),
+        ),
+    ]
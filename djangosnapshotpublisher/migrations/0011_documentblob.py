@@ -0,0 +1,79 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:11
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 500
+
+
+def move_document_json_to_blob(apps, schema_editor):
+    DocumentBlob = apps.get_model('djangosnapshotpublisher', 'DocumentBlob')
+    ReleaseDocument = apps.get_model('djangosnapshotpublisher', 'ReleaseDocument')
+    db_alias = schema_editor.connection.alias
+    blob_ids = {}
+    last_id = 0
+    while True:
+        release_documents = list(ReleaseDocument.objects.using(db_alias).filter(
+            id__gt=last_id,
+        ).order_by('id').only('id', 'document_json')[:BATCH_SIZE])
+        if not release_documents:
+            break
+        last_id = release_documents[-1].id
+        for release_document in release_documents:
+            if release_document.document_json is None:
+                continue
+            blob_hash = hashlib.sha256(release_document.document_json.encode()).hexdigest()
+            if blob_hash not in blob_ids:
+                blob_ids[blob_hash] = DocumentBlob.objects.using(db_alias).get_or_create(
+                    hash=blob_hash, defaults={'body': release_document.document_json})[0].id
+            release_document.blob_id = blob_ids[blob_hash]
+        ReleaseDocument.objects.using(db_alias).bulk_update(release_documents, ['blob'])
+
+
+def move_blob_to_document_json(apps, schema_editor):
+    ReleaseDocument = apps.get_model('djangosnapshotpublisher', 'ReleaseDocument')
+    db_alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        release_documents = list(ReleaseDocument.objects.using(db_alias).filter(
+            id__gt=last_id,
+        ).order_by('id').select_related('blob')[:BATCH_SIZE])
+        if not release_documents:
+            break
+        last_id = release_documents[-1].id
+        for release_document in release_documents:
+            release_document.document_json = \
+                release_document.blob.body if release_document.blob_id else None
+        ReleaseDocument.objects.using(db_alias).bulk_update(
+            release_documents, ['document_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangosnapshotpublisher', '0010_contentrelease_version_sort_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('body', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='releasedocument',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='release_documents', to='djangosnapshotpublisher.documentblob'),
+        ),
+        migrations.RunPython(move_document_json_to_blob, move_blob_to_document_json),
+        migrations.RemoveField(
+            model_name='releasedocument',
+            name='document_json',
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2026-10-19 03:22
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangosnapshotpublisher', '0011_documentblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_code', models.SlugField(max_length=100, unique=True)),
+                ('sequence', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_code', models.SlugField(max_length=100)),
+                ('sequence', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('publish', 'publish'), ('unpublish', 'unpublish'), ('delete', 'delete'), ('live', 'live')], max_length=20)),
+                ('release_uuid', models.UUIDField()),
+                ('document_key', models.CharField(blank=True, max_length=250, null=True)),
+                ('content_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('site_code', 'sequence')},
+            },
+        ),
+    ]
@@ -2,16 +2,18 @@
 .. module:: djangosnapshotpublisher.models
 """
 
+import hashlib
 import re
 import uuid
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, router, transaction
 from django.forms.models import model_to_dict
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from .manager import ContentReleaseManager
+from .manager import ContentReleaseManager, ReleaseDocumentManager
+from .routers import get_primary_database
 
 
 CONTENT_RELEASE_STATUS = (
@@ -41,6 +43,20 @@ def valide_version(value):
     return True
 
 
+def version_sort_key(value):
+    """
+    return a key of the version which sorts like the version numbers, e.g. 9.0 < 10.0: every
+    number is prefixed by its number of digits, leading zeros and trailing .0 are dropped so
+    1.0 and 1 get the same key, None if the version isn't valid
+    """
+    if not value or not re.match(r'^([0-9])+(\.[0-9]+)*$', value):
+        return None
+    numbers = [number.lstrip('0') for number in value.split('.')]
+    while len(numbers) > 1 and not numbers[-1]:
+        numbers.pop()
+    return '.'.join('{:02d}{}'.format(len(number), number) for number in numbers)
+
+
 class ReleaseDocumentExtraParameter(models.Model):
     """ ReleaseDocumentExtraParameter """
     key = models.SlugField(max_length=255)
@@ -61,20 +77,78 @@ class ReleaseDocumentExtraParameter(models.Model):
         return instance_dict
 
 
+def document_blob_hash(body):
+    """ document_blob_hash """
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class DocumentBlob(models.Model):
+    """
+    DocumentBlob
+
+    Body of the documents, stored once per content and shared by every ReleaseDocument with
+    the same body. It is deleted by gc_release_documents once no ReleaseDocument references it.
+    """
+    hash = models.CharField(max_length=64, unique=True)
+    body = models.TextField()
+
+
 class ReleaseDocument(models.Model):
     """ ReleaseDocument """
     document_key = models.CharField(max_length=250)
     content_type = models.CharField(max_length=100, default='content')
-    document_json = models.TextField(null=True)
+    blob = models.ForeignKey(
+        DocumentBlob,
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='release_documents',
+    )
     deleted = models.BooleanField(default=False)
 
+    objects = ReleaseDocumentManager()
+
     def __str__(self):
         return '{} - {}'.format(self.content_type, self.document_key)
 
-    def to_dict(self):
+    @property
+    def document_json(self):
+        """ body of the document, None for a deleted document """
+        if '_document_json' in self.__dict__:
+            return self.__dict__['_document_json']
+        return self.blob.body if self.blob_id else None
+
+    @document_json.setter
+    def document_json(self, value):
+        # stored on save, in the DocumentBlob of this body
+        self.__dict__['_document_json'] = value
+
+    def save(self, *args, **kwargs):
+        """ save """
+        if '_document_json' not in self.__dict__:
+            super(ReleaseDocument, self).save(*args, **kwargs)
+            return
+        body = self.__dict__.pop('_document_json')
+        with transaction.atomic(using=router.db_for_write(ReleaseDocument, instance=self)):
+            if body is None:
+                self.blob = None
+            else:
+                # an identical body is only referenced, not written again; the blob is locked
+                # until the document is committed so gc_document_blobs can't delete it meanwhile
+                self.blob, _ = DocumentBlob.objects.select_for_update().get_or_create(
+                    hash=document_blob_hash(body), defaults={'body': body})
+            super(ReleaseDocument, self).save(*args, **kwargs)
+
+    def to_dict(self, include_parameters=False):
         """ to_dict """
         instance_dict = model_to_dict(self)
         instance_dict.pop('id')
+        instance_dict['document_json'] = self.document_json
+        if include_parameters:
+            instance_dict['parameters'] = {
+                parameter.key: parameter.content for parameter in self.parameters.all()
+            }
         return instance_dict
 
 
@@ -103,6 +177,7 @@ class ContentRelease(models.Model):
     """ ContentRelease """
     uuid = models.UUIDField(max_length=255, unique=True, default=uuid.uuid4)
     version = models.CharField(max_length=20, blank=True, null=True,)
+    version_sort_key = models.CharField(max_length=64, null=True, editable=False)
     title = models.CharField(max_length=100)
     site_code = models.SlugField(max_length=100)
     status = models.IntegerField(choices=CONTENT_RELEASE_STATUS, default=0)
@@ -124,22 +199,22 @@ class ContentRelease(models.Model):
 
     objects = ContentReleaseManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['site_code', 'version_sort_key']),
+        ]
+
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
         """ save """
+        self.version_sort_key = version_sort_key(self.version)
         if self.version and self.status not in [2, 3] and valide_version(self.version):
             is_version_conflict = self.__class__.objects.filter(
                 site_code=self.site_code,
                 status__in=[1, 2, 3],
-                version__gte=self.version,
-            ).exclude(id=self.id)
-
-            is_version_conflict = self.__class__.objects.filter(
-                site_code=self.site_code,
-                status__in=[1, 2, 3],
-                version__gte=self.version,
+                version_sort_key__gte=self.version_sort_key,
             ).exclude(id=self.id).exists()
 
             if is_version_conflict:
@@ -171,19 +246,28 @@ class ContentRelease(models.Model):
 
         super(ContentRelease, self).save(*args, **kwargs)
 
-    def to_dict(self):
+    def to_dict(self, include_parameters=False):
         """ to_dict """
-        instance_dict = model_to_dict(self)
+        # exclude release_documents, model_to_dict would query the m2m for every release
+        instance_dict = model_to_dict(self, exclude=['release_documents'])
         instance_dict['uuid'] = self.uuid
         instance_dict['status'] = self.get_status_display()
-        instance_dict.pop('release_documents')
         instance_dict.pop('is_live')
         instance_dict.pop('is_stage')
         instance_dict.pop('id')
+        if include_parameters:
+            # use parameters.all() so a prefetch_related('parameters') is reused
+            instance_dict['parameters'] = {
+                parameter.key: parameter.content for parameter in self.parameters.all()
+            }
         return instance_dict
 
     def copy_document_release_ref_from_baserelease(self):
         """ copy_document_release_ref_from_baserelease """
+        with transaction.atomic(using=get_primary_database()):
+            self._copy_document_release_ref_from_baserelease()
+
+    def _copy_document_release_ref_from_baserelease(self):
         if self.use_current_live_as_base_release:
             try:
                 self.base_release = self.__class__.objects.get(
@@ -291,3 +375,45 @@ class ContentRelease(models.Model):
             new_extra_parameter.save()
 
         return new_release
+
+
+CHANGE_ACTIONS = (
+    ('publish', 'publish'),
+    ('unpublish', 'unpublish'),
+    ('delete', 'delete'),
+    ('live', 'live'),
+)
+
+
+class ChangeLogSequence(models.Model):
+    """ ChangeLogSequence, last sequence of the ChangeLogEntries of a site """
+    site_code = models.SlugField(max_length=100, unique=True)
+    sequence = models.BigIntegerField(default=0)
+
+
+class ChangeLogEntry(models.Model):
+    """
+    ChangeLogEntry
+
+    A document published, unpublished or deleted in a release, or a release going live, numbered
+    by a sequence incremented for each change of the site. The entries are never updated.
+    """
+    site_code = models.SlugField(max_length=100)
+    sequence = models.BigIntegerField()
+    action = models.CharField(max_length=20, choices=CHANGE_ACTIONS)
+    release_uuid = models.UUIDField()
+    document_key = models.CharField(max_length=250, blank=True, null=True)
+    content_type = models.CharField(max_length=100, blank=True, null=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = [('site_code', 'sequence')]
+
+    def __str__(self):
+        return '{} #{}'.format(self.site_code, self.sequence)
+
+    def to_dict(self):
+        """ to_dict """
+        instance_dict = model_to_dict(self)
+        instance_dict.pop('id')
+        return instance_dict
@@ -0,0 +1,217 @@
+"""
+.. module:: djangosnapshotpublisher.packed_release
+   :synopsis: pack a content release into a single file served without database
+
+File layout, integers are little endian:
+
+* header: magic ``SNPR``, format version (H), reserved (H), document count (I),
+  metadata length (I), index offset (Q)
+* metadata: json of the content release (``ContentRelease.to_dict`` with its parameters)
+* records: for every document, its key, its document_json and the json of its parameters
+* index: one fixed size entry per document sorted by key, with the offsets and lengths of
+  the record parts and flags, so a lookup is a binary search over the index
+
+A key is ``<content_type>\\0<document_key>`` encoded in utf-8.
+"""
+
+from collections import namedtuple
+import json
+import mmap
+import os
+import struct
+
+from .lazy_encoder import LazyEncoder
+
+
+MAGIC = b'SNPR'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHIIQ')
+ENTRY = struct.Struct('<QQQIIIB3x')
+FLAG_DELETED = 1
+FLAG_NULL_DOCUMENT_JSON = 2
+
+PackedDocument = namedtuple('PackedDocument', [
+    'document_key', 'content_type', 'document_json', 'parameters', 'deleted'])
+PackedDocument.__doc__ = """
+document of a PackedRelease, document_json and parameters (json of a dict) are memoryview
+slices of the mapped file, document_json is None for a deleted document
+"""
+
+
+class PackedReleaseError(Exception):
+    """ PackedReleaseError """
+
+
+def encode_key(document_key, content_type):
+    """ encode_key """
+    return '{}\0{}'.format(content_type, document_key).encode()
+
+
+def write_packed_release(content_release, path, resolve_base_release=False, batch_size=1000):
+    """
+    pack the documents of a content release into path, the file is written next to path then
+    moved in place so readers never see a partial file
+    """
+    # imported here so the reader can be used without the models, e.g. on edge workers
+    # pylint: disable=import-outside-toplevel
+    from .compare import release_documents_with_base_release
+    from .models import ReleaseDocument, ReleaseDocumentExtraParameter
+
+    if resolve_base_release:
+        release_documents = release_documents_with_base_release(content_release)
+    else:
+        release_documents = ReleaseDocument.objects.filter(content_releases=content_release.id)
+
+    metadata = json.dumps(
+        content_release.to_dict(include_parameters=True), cls=LazyEncoder).encode()
+    tmp_path = '{}.tmp'.format(path)
+    entries = []
+    seen_keys = set()
+    with open(tmp_path, 'wb') as packed_file:
+        packed_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0, len(metadata), 0))
+        packed_file.write(metadata)
+        offset = HEADER.size + len(metadata)
+
+        batch = []
+        for release_document in release_documents.values_list(
+                'id', 'document_key', 'content_type', 'blob__body', 'deleted',
+        ).iterator(chunk_size=batch_size):
+            batch.append(release_document)
+            if len(batch) == batch_size:
+                offset = _write_batch(
+                    packed_file, offset, batch, entries, seen_keys,
+                    ReleaseDocumentExtraParameter)
+                batch = []
+        offset = _write_batch(
+            packed_file, offset, batch, entries, seen_keys, ReleaseDocumentExtraParameter)
+
+        entries.sort(key=lambda entry: entry[0])
+        index_offset = offset
+        for _, entry in entries:
+            packed_file.write(ENTRY.pack(*entry))
+        packed_file.seek(0)
+        packed_file.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, 0, len(entries), len(metadata), index_offset))
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+def _write_batch(packed_file, offset, batch, entries, seen_keys, parameter_model):
+    parameters = {}
+    for release_document_id, key, content in parameter_model.objects.filter(
+            release_document_id__in=[release_document[0] for release_document in batch],
+    ).values_list('release_document_id', 'key', 'content'):
+        parameters.setdefault(release_document_id, {})[key] = content
+
+    for release_document_id, document_key, content_type, document_json, deleted in batch:
+        key = encode_key(document_key, content_type)
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+        body = (document_json or '').encode()
+        parameters_json = json.dumps(parameters.get(release_document_id, {})).encode()
+        flags = (FLAG_DELETED if deleted else 0) | \
+            (FLAG_NULL_DOCUMENT_JSON if document_json is None else 0)
+
+        packed_file.write(key)
+        packed_file.write(body)
+        packed_file.write(parameters_json)
+        entries.append((key, (
+            offset, offset + len(key), offset + len(key) + len(body),
+            len(key), len(body), len(parameters_json), flags,
+        )))
+        offset += len(key) + len(body) + len(parameters_json)
+    return offset
+
+
+class PackedRelease:
+    """
+    PackedRelease
+
+    Read only access to a file written by write_packed_release. The file is memory mapped so
+    the pages are shared by every process reading it, lookups are a binary search over the
+    index and the documents are returned as memoryview slices without copying them.
+    The memoryviews must be released before calling close.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as packed_file:
+            self._mmap = mmap.mmap(packed_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, _, self._count, metadata_length, self._index_offset = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise PackedReleaseError('{} is not a packed release'.format(path))
+        self.metadata = json.loads(self._mmap[HEADER.size:HEADER.size + metadata_length])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self._find(encode_key(*key)) is not None
+
+    def __iter__(self):
+        for position in range(self._count):
+            yield self._document(self._entry(position))
+
+    def close(self):
+        """ close """
+        self._view.release()
+        self._mmap.close()
+
+    def _entry(self, position):
+        return ENTRY.unpack_from(self._mmap, self._index_offset + position * ENTRY.size)
+
+    def _key(self, entry):
+        return self._mmap[entry[0]:entry[0] + entry[3]]
+
+    def _find(self, key):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            entry_key = self._key(entry)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def _document(self, entry):
+        key_offset, body_offset, parameters_offset, key_length, body_length, \
+            parameters_length, flags = entry
+        content_type, document_key = bytes(
+            self._view[key_offset:key_offset + key_length]).decode().split('\0', 1)
+        return PackedDocument(
+            document_key=document_key,
+            content_type=content_type,
+            document_json=None if flags & FLAG_NULL_DOCUMENT_JSON else
+            self._view[body_offset:body_offset + body_length],
+            parameters=self._view[parameters_offset:parameters_offset + parameters_length],
+            deleted=bool(flags & FLAG_DELETED),
+        )
+
+    def get_document(self, document_key, content_type='content'):
+        """ get_document, raise KeyError when the release doesn't have the document """
+        entry = self._find(encode_key(document_key, content_type))
+        if entry is None:
+            raise KeyError((document_key, content_type))
+        return self._document(entry)
+
+    def get_documents(self, keys):
+        """ get_documents, return a dict by (document_key, content_type) of the documents found """
+        documents = {}
+        for document_key, content_type in keys:
+            entry = self._find(encode_key(document_key, content_type))
+            if entry is not None:
+                documents[(document_key, content_type)] = self._document(entry)
+        return documents
@@ -0,0 +1,201 @@
+"""
+.. module:: djangosnapshotpublisher.preload
+   :synopsis: live releases loaded in memory before the workers fork
+
+`preload_live_releases`, called at startup by a server forking its workers after loading the
+application (e.g. gunicorn --preload), reads the live release of the sites set by
+SNAPSHOTPUBLISHER_PRELOAD_SITES with their documents into ReleaseIndexes. The forked workers
+share these pages copy-on-write, so their first requests are served from memory.
+
+A snapshot is used while the cache generation of its site (see djangosnapshotpublisher.cache)
+is the one it was loaded under, so caching must be enabled. When the generation moves, a thread
+of the process refreshes it from the change log: the generation of the snapshot is only moved
+forward if the changes since it was loaded don't touch its releases, otherwise it is reloaded.
+Until then the reads go through the cache as usual.
+"""
+
+import gc
+from collections import namedtuple
+import pickle
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Q, prefetch_related_objects
+from django.utils import timezone
+
+from . import cache
+from .models import ChangeLogEntry, ContentRelease
+from .release_index import build_release_index
+
+
+DEFAULT_PRELOAD_MAX_BODY_CHARS = 64 * 1024
+
+PreloadedRelease = namedtuple('PreloadedRelease', [
+    'generation', 'sequence', 'pickled_content_release', 'valid_until', 'release_uuids',
+    'documents',
+])
+PreloadedRelease.__doc__ = """
+PreloadedRelease, the live release of a site under a generation, documents is the ReleaseIndex
+of its documents resolved with its base release. The release is kept pickled so every caller
+gets its own copy of it, like from the cache.
+"""
+
+_preloaded_releases = {}
+_refresh_lock = threading.Lock()
+_refresh_threads = {}
+
+
+def preload_live_releases(site_codes=None):
+    """
+    load the live release of the sites, SNAPSHOTPUBLISHER_PRELOAD_SITES by default, then close
+    the database connections and freeze the objects so the forked workers share them, nothing
+    is done without sites
+    """
+    if site_codes is None:
+        site_codes = getattr(settings, 'SNAPSHOTPUBLISHER_PRELOAD_SITES', [])
+    if not site_codes:
+        return
+    for site_code in site_codes:
+        generation = cache.get_generation(site_code)
+        if generation is None:
+            continue
+        try:
+            _preloaded_releases[site_code] = load_live_release(site_code, generation)
+        except ContentRelease.DoesNotExist:
+            pass
+    # the connections must not be shared with the workers
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+
+
+def _last_sequence(site_code):
+    return ChangeLogEntry.objects.filter(
+        site_code=site_code).aggregate(sequence=Max('sequence'))['sequence'] or 0
+
+
+def _get_live(site_code):
+    live_content_release = ContentRelease.objects.live(site_code)
+    prefetch_related_objects([live_content_release], 'parameters')
+    valid_until = ContentRelease.objects.filter(
+        site_code=site_code,
+        status=1,
+        is_stage=True,
+        publish_datetime__isnull=False,
+    ).values_list('publish_datetime', flat=True).first()
+    return live_content_release, valid_until
+
+
+def _pickle(content_release):
+    return pickle.dumps(content_release, pickle.HIGHEST_PROTOCOL)
+
+
+def load_live_release(site_code, generation):
+    """ load the live release of a site and its documents under generation """
+    # read before the documents, a change in between is seen by the next refresh
+    sequence = _last_sequence(site_code)
+    live_content_release, valid_until = _get_live(site_code)
+    max_body_chars = getattr(
+        settings, 'SNAPSHOTPUBLISHER_PRELOAD_MAX_BODY_CHARS', DEFAULT_PRELOAD_MAX_BODY_CHARS)
+
+    return PreloadedRelease(
+        generation=generation,
+        sequence=sequence,
+        pickled_content_release=_pickle(live_content_release),
+        valid_until=valid_until,
+        release_uuids=_release_uuids(live_content_release),
+        documents=build_release_index(
+            live_content_release, resolve_base_release=True, max_body_chars=max_body_chars),
+    )
+
+
+def _release_uuids(content_release):
+    release_uuids = [content_release.uuid]
+    if content_release.base_release_id:
+        release_uuids.append(content_release.base_release.uuid)
+    return release_uuids
+
+
+def refresh_preloaded_release(site_code, generation):
+    """
+    bring the snapshot of a site to generation, reloading it only if its releases changed
+    """
+    preloaded_release = _preloaded_releases.get(site_code)
+    if preloaded_release is None or preloaded_release.generation == generation:
+        return
+    changes = ChangeLogEntry.objects.filter(
+        site_code=site_code, sequence__gt=preloaded_release.sequence)
+    sequence = _last_sequence(site_code)
+    if changes.filter(Q(action='live') | Q(release_uuid__in=preloaded_release.release_uuids)) \
+            .exists():
+        _preloaded_releases[site_code] = load_live_release(site_code, generation)
+    else:
+        # the release row and its parameters aren't in the change log, they are read again
+        live_content_release, valid_until = _get_live(site_code)
+        _preloaded_releases[site_code] = preloaded_release._replace(
+            generation=generation,
+            sequence=sequence,
+            pickled_content_release=_pickle(live_content_release),
+            valid_until=valid_until,
+        )
+
+
+def _refresh_in_thread(site_code, generation):
+    try:
+        refresh_preloaded_release(site_code, generation)
+    except ContentRelease.DoesNotExist:
+        _preloaded_releases.pop(site_code, None)
+    finally:
+        connections.close_all()
+        with _refresh_lock:
+            _refresh_threads.pop(site_code, None)
+
+
+def get_preloaded_release(site_code, generation):
+    """
+    return the snapshot of a site if it is current for generation, None otherwise, starting
+    its refresh if it is outdated
+    """
+    preloaded_release = _preloaded_releases.get(site_code)
+    if preloaded_release is None or generation is None:
+        return None
+    if preloaded_release.generation == generation:
+        return preloaded_release
+    with _refresh_lock:
+        if site_code not in _refresh_threads:
+            _refresh_threads[site_code] = threading.Thread(
+                target=_refresh_in_thread, args=(site_code, generation), daemon=True)
+            _refresh_threads[site_code].start()
+    return None
+
+
+def get_live(site_code, generation):
+    """ the preloaded live release, None if missing or a scheduled release is due """
+    preloaded_release = get_preloaded_release(site_code, generation)
+    if preloaded_release is None or (
+            preloaded_release.valid_until is not None and
+            preloaded_release.valid_until <= timezone.now()):
+        return None
+    return pickle.loads(preloaded_release.pickled_content_release)
+
+
+def get_documents(site_code, generation, release_uuid, keys, resolve_base_release=False):
+    """
+    return a dict of the preloaded documents by (document_key, content_type) in the format of
+    the cached ones, only the keys found are returned
+    """
+    preloaded_release = get_preloaded_release(site_code, generation)
+    if preloaded_release is None or str(preloaded_release.release_uuids[0]) != str(release_uuid):
+        return {}
+    return {
+        key: {
+            'document_key': document.document_key,
+            'content_type': document.content_type,
+            'deleted': document.deleted,
+            'document_json': document.document_json,
+            'parameters': dict(document.parameters),
+        }
+        for key, document in preloaded_release.documents.get_documents(keys).items()
+        if document.own or resolve_base_release
+    }
@@ -4,19 +4,28 @@
 """
 
 from datetime import datetime
-from functools import reduce
-from operator import itemgetter
+from functools import partial, reduce, wraps
+from itertools import islice
+from operator import itemgetter, or_
 import json
 
+from django.conf import settings
+from django.db import connections, router, transaction
 from django.db.models import CharField, Case, Q, Count, When, Value as V
 from django.db.models.functions import Concat
-from django.db.models.query import QuerySet
+from django.db.models.query import QuerySet, prefetch_related_objects
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from . import cache, changelog, compare, preload
+from .changelog import DEFAULT_CHANGES_LIMIT
+from .garbage_collection import DEFAULT_GC_BATCH_SIZE, gc_document_blobs, gc_release_documents
 from .lazy_encoder import LazyEncoder
-from .models import (ContentRelease, ReleaseDocumentExtraParameter, ReleaseDocument,
-                     ContentReleaseExtraParameter)
+from .models import (ContentRelease, DocumentBlob, ReleaseDocumentExtraParameter,
+                     ReleaseDocument, ContentReleaseExtraParameter)
+from .routers import (get_primary_database, get_read_database, read_from_primary, read_only,
+                      write)
+from .warmup import warm_and_cutover, warm_content_release
 
 
 API_TYPES = ['django', 'json']
@@ -45,28 +54,112 @@ ERROR_STATUS_CODE = {
     'content_release_already_stage': _('Content Release alredy staged'),
     'content_release_already_live': _('Content Release alredy live'),
     'no_content_release_stage': _('No Stage Content Release'),
+    'no_content_release': _('There is no ContentRelease'),
+    'invalid_cursor': _('Invalid cursor'),
 }
 
 
+def _release_documents_by_keys(content_release, keys, prefix, content_type):
+    """
+    the documents of a release for a list of (document_key, content_type), one IN by
+    content_type, or for the document_key prefix of content_type
+    """
+    release_documents = ReleaseDocument.objects.filter(content_releases=content_release.id)
+    if keys is None:
+        return release_documents.filter(
+            content_type=content_type, document_key__startswith=prefix)
+    document_keys = {}
+    for document_key, document_content_type in keys:
+        document_keys.setdefault(document_content_type, []).append(document_key)
+    if not document_keys:
+        return release_documents.none()
+    return release_documents.filter(reduce(or_, [
+        Q(content_type=document_content_type, document_key__in=document_keys_of_type)
+        for document_content_type, document_keys_of_type in document_keys.items()
+    ]))
+
+
+def _fill_from_primary(method):
+    """
+    decorator for the PublisherAPI methods reading what they store in the shared cache, their
+    reads go to the primary when caching is enabled: a replica lagging behind a write would
+    store the data before the write under the generation bumped by the write, served by every
+    process until it expires
+    """
+    @wraps(method)
+    def wrapper(self, site_code, generation, *args):
+        if generation is None:
+            return method(self, site_code, generation, *args)
+        with read_from_primary():
+            return method(self, site_code, generation, *args)
+    return wrapper
+
+
+def _write_parameters(related_parameters, new_parameter, parameters, clear_first=False):
+    """
+    write a dict of parameters to the related manager of the parameters of a release or a
+    document, comparing them with the stored ones: the changed ones are updated, the new ones
+    created with new_parameter(key=, content=) and, with clear_first, the other ones deleted,
+    each in one query. Return True if a parameter changed
+    """
+    # compared the way the TextField stores them, e.g. 1 is read back as '1'
+    parameters = {
+        key: value if value is None else str(value) for key, value in (parameters or {}).items()
+    }
+    if not parameters and not clear_first:
+        return False
+    stored_parameters = {parameter.key: parameter for parameter in related_parameters.all()}
+    model = related_parameters.model
+
+    deleted_parameter_ids = [
+        parameter.id for key, parameter in stored_parameters.items() if key not in parameters
+    ] if clear_first else []
+    updated_parameters = []
+    for key, value in parameters.items():
+        if key in stored_parameters and stored_parameters[key].content != value:
+            stored_parameters[key].content = value
+            updated_parameters.append(stored_parameters[key])
+    created_parameters = [
+        new_parameter(key=key, content=value)
+        for key, value in parameters.items() if key not in stored_parameters
+    ]
+    if not (deleted_parameter_ids or updated_parameters or created_parameters):
+        return False
+
+    with transaction.atomic(using=get_primary_database()):
+        if deleted_parameter_ids:
+            model.objects.filter(id__in=deleted_parameter_ids).delete()
+        if updated_parameters:
+            model.objects.bulk_update(updated_parameters, ['content'])
+        if created_parameters:
+            model.objects.bulk_create(created_parameters)
+    return True
+
+
 class PublisherAPI:
     """ PublisherAPI """
 
-    def __init__(self, api_type='django'):
+    def __init__(self, api_type='django', read_database=None):
         if api_type not in API_TYPES:
             raise ValueError(ERROR_STATUS_CODE['wrong_api_type'])
         self.api_type = api_type
+        self.read_database = read_database or get_read_database()
 
-    def send_response(self, status_code, data=None):
+    def send_response(self, status_code, data=None, include_parameters=False):
         """ send_response """
         if status_code == 'success':
             response = {
                 'status': 'success',
             }
+            if isinstance(data, QuerySet):
+                # bind the queryset to the database routed for this call, it is evaluated later
+                data = data.using(data.db)
             if self.api_type == 'json':
+                to_dict_kwargs = {'include_parameters': True} if include_parameters else {}
                 if isinstance(data, QuerySet):
-                    data = [item.to_dict() for item in data]
+                    data = [item.to_dict(**to_dict_kwargs) for item in data]
                 if isinstance(data, (ContentRelease, ReleaseDocument)):
-                    data = data.to_dict()
+                    data = data.to_dict(**to_dict_kwargs)
             if data is not None:
                 response['content'] = data
         else:
@@ -79,6 +172,7 @@ class PublisherAPI:
             return json.dumps(response, cls=LazyEncoder)
         return response
 
+    @write
     def add_content_release(self, site_code, title, version, parameters=None,
                             based_on_release_uuid=None, use_current_live_as_base_release=False):
         """ add_content_release """
@@ -88,7 +182,12 @@ class PublisherAPI:
                 title=title,
                 version=version,
             )
-            self.update_content_release_parameters(site_code, content_release.uuid, parameters)
+            changed = _write_parameters(
+                content_release.parameters,
+                partial(ContentReleaseExtraParameter, content_release=content_release),
+                parameters)
+            if changed:
+                cache.bump_generation_on_commit(site_code)
             return self.send_response('content_release_already_exists')
         except ContentRelease.DoesNotExist:
             base_release = None
@@ -106,9 +205,14 @@ class PublisherAPI:
                 use_current_live_as_base_release=use_current_live_as_base_release,
             )
             content_release.save()
-            self.update_content_release_parameters(site_code, content_release.uuid, parameters)
+            _write_parameters(
+                content_release.parameters,
+                partial(ContentReleaseExtraParameter, content_release=content_release),
+                parameters)
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success', content_release)
 
+    @write
     def update_content_release_parameters(self, site_code, release_uuid, parameters,
                                           clear_first=False):
         """ update_content_release_parameters """
@@ -118,25 +222,18 @@ class PublisherAPI:
                 uuid=release_uuid,
             )
 
-            if clear_first:
-                ContentReleaseExtraParameter.objects.filter(
-                    content_release=content_release).delete()
-
-            if parameters:
-                for key, value in parameters.items():
-                    ContentReleaseExtraParameter.objects.update_or_create(
-                        key=key,
-                        content_release=content_release,
-                        defaults={
-                            'content': value,
-                        }
-                    )
-            
+            changed = _write_parameters(
+                content_release.parameters,
+                partial(ContentReleaseExtraParameter, content_release=content_release),
+                parameters, clear_first)
+            if changed:
+                cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
 
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
 
+    @read_only
     def get_extra_paramater(self, site_code, release_uuid, key):
         """ get_extra_paramater """
         try:
@@ -149,6 +246,7 @@ class PublisherAPI:
         except ContentReleaseExtraParameter.DoesNotExist:
             return self.send_response('content_release_extra_parameter_does_not_exist')
 
+    @read_only
     def get_extra_paramaters(self, site_code, release_uuid):
         """ get_extra_paramaters """
         extra_parameters = ContentReleaseExtraParameter.objects.filter(
@@ -157,14 +255,17 @@ class PublisherAPI:
         )
         return self.send_response('success', extra_parameters)
 
+    @write
     def remove_content_release(self, site_code, release_uuid):
         """ remove_content_release """
         try:
             ContentRelease.objects.get(site_code=site_code, uuid=release_uuid).delete()
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
 
+    @write
     def update_content_release(self, site_code, release_uuid, title=None, version=None,
                                parameters=None):
         """ update_content_release """
@@ -177,19 +278,29 @@ class PublisherAPI:
             if version:
                 content_release.version = version
             content_release.save()
-            self.update_content_release_parameters(site_code, release_uuid, parameters)
+            _write_parameters(
+                content_release.parameters,
+                partial(ContentReleaseExtraParameter, content_release=content_release),
+                parameters)
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
 
-    def get_content_release_details(self, site_code, release_uuid, parameters=None):
+    @read_only
+    def get_content_release_details(self, site_code, release_uuid, parameters=None,
+                                    include_parameters=False):
         """ get_content_release_details """
         try:
-            content_release = ContentRelease.objects.get(site_code=site_code, uuid=release_uuid)
-            return self.send_response('success', content_release)
+            content_releases = ContentRelease.objects.all()
+            if include_parameters:
+                content_releases = content_releases.prefetch_related('parameters')
+            content_release = content_releases.get(site_code=site_code, uuid=release_uuid)
+            return self.send_response('success', content_release, include_parameters)
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
 
+    @read_only
     def get_content_release_details_query_parameters(self, site_code, parameters):
         """ get_content_release_details_query_parameters """
         if not parameters:
@@ -218,22 +329,58 @@ class PublisherAPI:
             id=content_release_id
         ))
 
-    def get_stage_content_release(self, site_code, parameters=None):
+    @read_only
+    def get_stage_content_release(self, site_code, parameters=None, include_parameters=False):
         """ get_stage_content_release """
         try:
             stage_content_release = ContentRelease.objects.stage(site_code)
-            return self.send_response('success', stage_content_release)
+            if include_parameters:
+                prefetch_related_objects([stage_content_release], 'parameters')
+            return self.send_response('success', stage_content_release, include_parameters)
         except ContentRelease.DoesNotExist:
             return self.send_response('no_content_release_stage')
 
-    def get_live_content_release(self, site_code, parameters=None):
+    @read_only
+    def get_live_content_release(self, site_code, parameters=None, include_parameters=False):
         """ get_live_content_release """
+        generation = cache.get_generation(site_code)
+        live_content_release = preload.get_live(site_code, generation) or cache.get_live(
+            site_code, generation)
+        if live_content_release is not None:
+            return self.send_response('success', live_content_release, include_parameters)
+        stale_generation = cache.get_stale_generation(site_code, generation)
         try:
-            live_content_release = ContentRelease.objects.live(site_code)
-            return self.send_response('success', live_content_release)
+            live_content_release = cache.coalesce(
+                cache.live_cache_key(site_code, generation),
+                partial(self._get_live_content_release, site_code, generation),
+                recheck=partial(cache.get_live, site_code, generation),
+                stale=partial(cache.get_live, site_code, stale_generation),
+            )
         except ContentRelease.DoesNotExist:
             return self.send_response('no_content_release_live')
+        if include_parameters:
+            prefetch_related_objects([live_content_release], 'parameters')
+        return self.send_response('success', live_content_release, include_parameters)
+
+    @_fill_from_primary
+    def _get_live_content_release(self, site_code, generation):
+        live_content_release = ContentRelease.objects.live(site_code)
+        if generation is not None:
+            # the cached release is stored with its parameters and expires when the next
+            # scheduled release goes live
+            prefetch_related_objects([live_content_release], 'parameters')
+            cache.set_live(
+                site_code, generation, live_content_release,
+                ContentRelease.objects.filter(
+                    site_code=site_code,
+                    status=1,
+                    is_stage=True,
+                    publish_datetime__isnull=False,
+                ).values_list('publish_datetime', flat=True).first(),
+            )
+        return live_content_release
 
+    @write
     def set_stage_content_release(self, site_code, release_uuid):
         """ set_stage_content_release """
         content_release = None
@@ -265,19 +412,23 @@ class PublisherAPI:
 
         if content_release.status == 0:
             content_release.copy_document_release_ref_from_baserelease()
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
         else:
             return self.send_response('content_release_not_preview')
 
+    @write
     def unset_stage_content_release(self, site_code, release_uuid):
         # unset_stage_content_release
         try:
             stage_content_release = ContentRelease.objects.stage(site_code)
             stage_content_release.remove_document_release_ref_from_baserelease()
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
         except ContentRelease.DoesNotExist:
             return self.send_response('no_content_release_stage')
 
+    @write
     def set_live_content_release(self, site_code, release_uuid, publish_datetime=None):
         """ set_live_content_release """
         if publish_datetime is not None and publish_datetime < timezone.now():
@@ -302,6 +453,12 @@ class PublisherAPI:
             return self.send_response('content_release_already_live')
 
         if content_release.status == 1 and content_release.is_stage:
+            warm = publish_datetime is None and getattr(
+                settings, 'SNAPSHOTPUBLISHER_WARM_ON_GO_LIVE', True)
+            in_transaction = transaction.get_connection(get_primary_database()).in_atomic_block
+            if warm and not in_transaction:
+                # warmed before the go live is written, the readers never miss the new release
+                warm_content_release(content_release)
             if publish_datetime is None:
                 content_release.status = 2
                 content_release.publish_datetime = timezone.now()
@@ -309,11 +466,23 @@ class PublisherAPI:
                 content_release.publish_datetime = publish_datetime
             content_release.is_stage = False
             content_release.is_live = True
-            content_release.save()
-            if live_content_release:
-                live_content_release.status = 3
-                live_content_release.is_live = False
-                live_content_release.save()
+            with transaction.atomic(using=get_primary_database()):
+                content_release.save()
+                if live_content_release:
+                    live_content_release.status = 3
+                    live_content_release.is_live = False
+                    live_content_release.save()
+                if publish_datetime is None:
+                    changelog.record_changes(site_code, release_uuid, 'live')
+            if warm and in_transaction:
+                # the warm-up threads read on their own connections, they would cache the
+                # documents of before the transaction of the caller: warmed once it commits
+                transaction.on_commit(
+                    partial(warm_and_cutover, content_release), using=get_primary_database())
+            elif publish_datetime is None:
+                cache.cutover_on_commit(site_code, content_release)
+            else:
+                cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
         else:
             return self.send_response('content_release_not_stage')
@@ -369,21 +538,43 @@ class PublisherAPI:
     #     except ContentRelease.DoesNotExist:
     #         return self.send_response('content_release_does_not_exist')
 
-    def list_content_releases(self, site_code, status=None, after=None):
+    @read_only
+    def list_content_releases(self, site_code, status=None, after=None,
+                              include_parameters=False):
         """ list_content_releases """
         content_releases = ContentRelease.objects.filter(site_code=site_code)
         if status:
             content_releases = content_releases.filter(status=status)
         if after:
             content_releases = content_releases.filter(publish_datetime__gte=after)
-        return self.send_response('success', content_releases)
+        if include_parameters:
+            content_releases = content_releases.prefetch_related('parameters')
+        return self.send_response('success', content_releases, include_parameters)
+
+    @read_only
+    def get_latest_version_content_release(self, site_code, status=None,
+                                           include_parameters=False):
+        """ get_latest_version_content_release, the release with the highest version """
+        content_releases = ContentRelease.objects.filter(
+            site_code=site_code,
+            version_sort_key__isnull=False,
+        )
+        if status is not None:
+            content_releases = content_releases.filter(status=status)
+        if include_parameters:
+            content_releases = content_releases.prefetch_related('parameters')
+        content_release = content_releases.order_by('-version_sort_key').first()
+        if content_release is None:
+            return self.send_response('no_content_release')
+        return self.send_response('success', content_release, include_parameters)
 
+    @read_only
     def get_document_from_content_release(self, site_code, release_uuid, document_key,
                                           content_type='content'):
         """get_document_from_content_release """
         try:
             content_release = ContentRelease.objects.get(site_code=site_code, uuid=release_uuid)
-            release_document = ReleaseDocument.objects.get(
+            release_document = ReleaseDocument.objects.select_related('blob').get(
                 document_key=document_key,
                 content_type=content_type,
                 content_releases=content_release.id,
@@ -394,6 +585,7 @@ class PublisherAPI:
         except ReleaseDocument.DoesNotExist:
             return self.send_response('release_document_does_not_exist')
 
+    @read_only
     def get_document_extra_from_content_release(self, site_code, release_uuid, document_key,
                                                 content_type='content'):
         """get_document_extra_from_content_release """
@@ -413,51 +605,175 @@ class PublisherAPI:
         except ReleaseDocument.DoesNotExist:
             return self.send_response('release_document_does_not_exist')
 
+    @read_only
+    def get_document_with_extra_from_content_release(self, site_code, release_uuid, document_key,
+                                                     content_type='content'):
+        """ get_document_with_extra_from_content_release """
+        generation = cache.get_generation(site_code)
+        document = preload.get_documents(
+            site_code, generation, release_uuid, [(document_key, content_type)],
+        ).get((document_key, content_type)) or cache.get_document(
+            site_code, generation, release_uuid, document_key, content_type)
+        if document is not None:
+            return self.send_response('success', document)
+        stale_generation = cache.get_stale_generation(site_code, generation)
+        try:
+            document = cache.coalesce(
+                cache.document_cache_key(
+                    site_code, release_uuid, document_key, content_type, generation),
+                partial(
+                    self._get_document_with_extra, site_code, generation, release_uuid,
+                    document_key, content_type),
+                recheck=partial(
+                    cache.get_document, site_code, generation, release_uuid, document_key,
+                    content_type),
+                stale=partial(
+                    cache.get_document, site_code, stale_generation, release_uuid,
+                    document_key, content_type),
+            )
+        except ContentRelease.DoesNotExist:
+            return self.send_response('content_release_does_not_exist')
+        except ReleaseDocument.DoesNotExist:
+            return self.send_response('release_document_does_not_exist')
+        return self.send_response('success', document)
+
+    @_fill_from_primary
+    def _get_document_with_extra(self, site_code, generation, release_uuid, document_key,
+                                 content_type):
+        try:
+            release_document = ReleaseDocument.objects.select_related(
+                'blob',
+            ).prefetch_related('parameters').get(
+                document_key=document_key,
+                content_type=content_type,
+                content_releases__site_code=site_code,
+                content_releases__uuid=release_uuid,
+            )
+        except ReleaseDocument.DoesNotExist:
+            if not ContentRelease.objects.filter(site_code=site_code, uuid=release_uuid).exists():
+                raise ContentRelease.DoesNotExist
+            raise
+        document = release_document.to_dict(include_parameters=True)
+        cache.set_document(
+            site_code, generation, release_uuid, document_key, content_type, document)
+        return document
+
+    @read_only
+    def get_documents_from_content_release(self, site_code, release_uuid, keys,
+                                           resolve_base_release=False):
+        """ get_documents_from_content_release """
+        keys = [(document_key, content_type) for document_key, content_type in keys]
+        generation = cache.get_generation(site_code)
+        documents = preload.get_documents(
+            site_code, generation, release_uuid, keys, resolve_base_release)
+        documents.update(cache.get_documents(
+            site_code, generation, release_uuid, [key for key in keys if key not in documents],
+            resolve_base_release))
+        missing_keys = sorted({key for key in keys if key not in documents})
+
+        if missing_keys:
+            stale_generation = cache.get_stale_generation(site_code, generation)
+            # identical batches, e.g. the same page requested by many clients, are coalesced
+            try:
+                documents.update(cache.coalesce(
+                    cache.documents_cache_key(
+                        site_code, release_uuid, missing_keys, generation, resolve_base_release),
+                    partial(
+                        self._get_documents, site_code, generation, release_uuid, missing_keys,
+                        resolve_base_release),
+                    recheck=partial(
+                        cache.get_all_documents, site_code, generation, release_uuid,
+                        missing_keys, resolve_base_release),
+                    stale=partial(
+                        cache.get_all_documents, site_code, stale_generation, release_uuid,
+                        missing_keys, resolve_base_release),
+                ))
+            except ContentRelease.DoesNotExist:
+                return self.send_response('content_release_does_not_exist')
+
+        return self.send_response('success', {
+            'documents': [documents[key] for key in keys if key in documents],
+            'missing': [
+                {'document_key': document_key, 'content_type': content_type}
+                for document_key, content_type in keys
+                if (document_key, content_type) not in documents
+            ],
+        })
+
+    @_fill_from_primary
+    def _get_documents(self, site_code, generation, release_uuid, keys, resolve_base_release):
+        content_release = ContentRelease.objects.get(site_code=site_code, uuid=release_uuid)
+        if resolve_base_release:
+            release_documents = compare.release_documents_with_base_release(content_release)
+        else:
+            release_documents = ReleaseDocument.objects.filter(content_releases=content_release.id)
+
+        documents = {
+            (release_document.document_key, release_document.content_type):
+                release_document.to_dict(include_parameters=True)
+            for release_document in release_documents.filter(reduce(or_, [
+                Q(document_key=document_key, content_type=content_type)
+                for document_key, content_type in keys
+            ])).select_related('blob').prefetch_related('parameters')
+        }
+        cache.set_documents(site_code, generation, release_uuid, documents, resolve_base_release)
+        return documents
+
+    @write
     def publish_document_to_content_release(self, site_code, release_uuid, document_json,
                                             document_key, content_type='content', parameters=None):
         """ publish_document_to_content_release """
         try:
             content_release = ContentRelease.objects.get(site_code=site_code, uuid=release_uuid)
             created = False
-            try:
-                release_document = None
-                release_document = ReleaseDocument.objects.get(
-                    document_key=document_key,
-                    content_releases=content_release.id,
-                    content_type=content_type,
-                )
-                release_document.document_json = document_json
-                release_document.deleted = False
-                release_document.save()
-
-                # clear then store parameters
-                ReleaseDocumentExtraParameter.objects.filter(
-                    release_document=release_document).delete()
-            except ReleaseDocument.DoesNotExist:
-                release_document = ReleaseDocument(
-                    document_key=document_key,
-                    content_type=content_type,
-                    document_json=document_json,
-                )
-                release_document.save()
-                content_release.release_documents.add(release_document)
-                content_release.save()
-                created = True
-
-            # store parameters
-            if parameters:
-                for key, value in parameters.items():
-                    extra_parameter = ReleaseDocumentExtraParameter(
-                        key=key,
-                        content=value,
-                        release_document=release_document,
+            # the change is logged in the same transaction
+            with transaction.atomic(using=get_primary_database()):
+                try:
+                    release_document = None
+                    release_document = ReleaseDocument.objects.get(
+                        document_key=document_key,
+                        content_releases=content_release.id,
+                        content_type=content_type,
+                    )
+                    release_document.document_json = document_json
+                    release_document.deleted = False
+                    release_document.save()
+
+                    # only the parameters which changed are written
+                    _write_parameters(
+                        release_document.parameters,
+                        partial(
+                            ReleaseDocumentExtraParameter, release_document=release_document),
+                        parameters, clear_first=True)
+                except ReleaseDocument.DoesNotExist:
+                    release_document = ReleaseDocument(
+                        document_key=document_key,
+                        content_type=content_type,
+                        document_json=document_json,
                     )
-                    extra_parameter.save()
+                    # the document is never seen without its release by gc_release_documents
+                    release_document.save()
+                    content_release.release_documents.add(release_document)
+                    content_release.save()
+                    created = True
+                    if parameters:
+                        ReleaseDocumentExtraParameter.objects.bulk_create([
+                            ReleaseDocumentExtraParameter(
+                                key=key,
+                                content=value,
+                                release_document=release_document,
+                            )
+                            for key, value in parameters.items()
+                        ])
+                changelog.record_changes(
+                    site_code, release_uuid, 'publish', [(document_key, content_type)])
 
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success', {'created': created})
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
 
+    @write
     def unpublish_document_from_content_release(self, site_code, release_uuid, document_key,
                                                 content_type='content'):
         """ unpublish_document_from_content_release """
@@ -468,36 +784,179 @@ class PublisherAPI:
                 content_type=content_type,
                 content_releases__id=content_release.id,
             )
-            release_document.delete()
+            with transaction.atomic(using=get_primary_database()):
+                release_document.delete()
+                changelog.record_changes(
+                    site_code, release_uuid, 'unpublish', [(document_key, content_type)])
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
         except ReleaseDocument.DoesNotExist:
             return self.send_response('release_document_does_not_exist')
 
+    @write
     def delete_document_from_content_release(self, site_code, release_uuid, document_key,
                                              content_type='content'):
         """ delete_document_from_content_release """
         try:
             content_release = ContentRelease.objects.get(site_code=site_code, uuid=release_uuid)
-            release_document, created = ReleaseDocument.objects.update_or_create(
-                document_key=document_key,
-                content_type=content_type,
-                content_releases__id=content_release.id,
-                defaults={
-                    'document_json': None,
-                    'deleted': True,
-                }
-            )
+            with transaction.atomic(using=get_primary_database()):
+                release_document, created = ReleaseDocument.objects.update_or_create(
+                    document_key=document_key,
+                    content_type=content_type,
+                    content_releases__id=content_release.id,
+                    defaults={
+                        'document_json': None,
+                        'deleted': True,
+                    }
+                )
+                if created:
+                    content_release.release_documents.add(release_document)
+                changelog.record_changes(
+                    site_code, release_uuid, 'delete', [(document_key, content_type)])
             if created:
-                content_release.release_documents.add(release_document)
                 content_release.save()
+            cache.bump_generation_on_commit(site_code)
             return self.send_response('success')
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
 
-    def compare_content_releases(self, site_code, my_release_uuid, compare_to_release_uuid):
+    @write
+    def unpublish_documents_from_content_release(self, site_code, release_uuid, keys=None,
+                                                 prefix=None, content_type='content'):
+        """
+        unpublish_documents_from_content_release, unpublish a list of (document_key, content_type)
+        or the documents of content_type whose document_key starts with prefix
+        """
+        if keys is None and prefix is None:
+            return self.send_response('parameters_missing')
+        try:
+            content_release = ContentRelease.objects.get(site_code=site_code, uuid=release_uuid)
+        except ContentRelease.DoesNotExist:
+            return self.send_response('content_release_does_not_exist')
+
+        with transaction.atomic(using=get_primary_database()):
+            release_document_ids = {
+                (document_key, document_content_type): release_document_id
+                for release_document_id, document_key, document_content_type in
+                _release_documents_by_keys(content_release, keys, prefix, content_type).values_list(
+                    'id', 'document_key', 'content_type')
+            }
+            if keys is None:
+                keys = sorted(release_document_ids)
+            keys = [(document_key, document_content_type)
+                    for document_key, document_content_type in keys]
+            ReleaseDocument.objects.filter(id__in=release_document_ids.values()).delete()
+            changelog.record_changes(site_code, release_uuid, 'unpublish', [
+                key for key in keys if key in release_document_ids])
+        cache.bump_generation_on_commit(site_code)
+        return self.send_response('success', {
+            'results': [
+                {
+                    'document_key': document_key,
+                    'content_type': document_content_type,
+                    'status': 'success' if (document_key, document_content_type) in \
+                        release_document_ids else 'release_document_does_not_exist',
+                }
+                for document_key, document_content_type in keys
+            ],
+        })
+
+    @write
+    def delete_documents_from_content_release(self, site_code, release_uuid, keys=None,
+                                              prefix=None, content_type='content'):
+        """
+        delete_documents_from_content_release, delete a list of (document_key, content_type) or
+        the documents of content_type whose document_key starts with prefix, the ones of the base
+        release included
+        """
+        if keys is None and prefix is None:
+            return self.send_response('parameters_missing')
+        try:
+            content_release = ContentRelease.objects.get(site_code=site_code, uuid=release_uuid)
+        except ContentRelease.DoesNotExist:
+            return self.send_response('content_release_does_not_exist')
+
+        with transaction.atomic(using=get_primary_database()):
+            release_document_ids = {
+                (document_key, document_content_type): release_document_id
+                for release_document_id, document_key, document_content_type in
+                _release_documents_by_keys(content_release, keys, prefix, content_type).values_list(
+                    'id', 'document_key', 'content_type')
+            }
+            if keys is None:
+                keys = sorted(set(compare.release_documents_with_base_release(
+                    content_release,
+                ).filter(
+                    content_type=content_type, document_key__startswith=prefix,
+                ).values_list('document_key', 'content_type')))
+            keys = [(document_key, document_content_type)
+                    for document_key, document_content_type in keys]
+
+            ReleaseDocument.objects.filter(
+                id__in=release_document_ids.values(),
+            ).update(deleted=True, blob=None)
+            release_documents = [
+                ReleaseDocument(
+                    document_key=document_key, content_type=document_content_type, deleted=True)
+                for document_key, document_content_type in dict.fromkeys(keys)
+                if (document_key, document_content_type) not in release_document_ids
+            ]
+            if release_documents:
+                if connections[router.db_for_write(ReleaseDocument)].features.\
+                        can_return_rows_from_bulk_insert:
+                    ReleaseDocument.objects.bulk_create(release_documents)
+                else:
+                    # the ids of the inserted rows are needed to add them to the release
+                    for release_document in release_documents:
+                        release_document.save()
+                content_release.release_documents.add(*release_documents)
+            changelog.record_changes(site_code, release_uuid, 'delete', dict.fromkeys(keys))
+        cache.bump_generation_on_commit(site_code)
+        return self.send_response('success', {
+            'results': [
+                {
+                    'document_key': document_key,
+                    'content_type': document_content_type,
+                    'created': (document_key, document_content_type) not in release_document_ids,
+                }
+                for document_key, document_content_type in keys
+            ],
+        })
+
+    @write
+    def gc_release_documents(self, batch_size=DEFAULT_GC_BATCH_SIZE, dry_run=False):
+        """
+        gc_release_documents, delete the ReleaseDocuments no release references then the
+        DocumentBlobs no ReleaseDocument references
+        """
+        count = gc_release_documents(batch_size=batch_size, dry_run=dry_run)
+        blob_count = gc_document_blobs(batch_size=batch_size, dry_run=dry_run)
+        return self.send_response('success', {
+            'count': count,
+            'blob_count': blob_count,
+            'dry_run': dry_run,
+        })
+
+    @read_only
+    def get_changes_since(self, site_code, sequence=0, limit=DEFAULT_CHANGES_LIMIT):
+        """ get_changes_since """
+        changes = [
+            change.to_dict() for change in changelog.get_changes_since(site_code, sequence, limit)
+        ]
+        return self.send_response('success', {
+            'changes': changes,
+            'sequence': changes[-1]['sequence'] if changes else sequence,
+        })
+
+    @read_only
+    def compare_content_releases(self, site_code, my_release_uuid, compare_to_release_uuid,
+                                 limit=None, cursor=None, summary=False):
         """ compare_content_releases """
+        if summary or limit is not None or cursor is not None:
+            return self._compare_content_releases_page(
+                site_code, my_release_uuid, compare_to_release_uuid, limit, cursor, summary)
         try:
             comparison = []
 
@@ -634,3 +1093,92 @@ class PublisherAPI:
             return self.send_response('success', comparison)
         except ContentRelease.DoesNotExist:
             return self.send_response('content_release_does_not_exist')
+
+    def _compare_content_releases_page(self, site_code, my_release_uuid, compare_to_release_uuid,
+                                       limit, cursor, summary):
+        try:
+            my_content_release = ContentRelease.objects.get(
+                site_code=site_code, uuid=my_release_uuid)
+            compare_to_content_release = ContentRelease.objects.get(
+                site_code=site_code, uuid=compare_to_release_uuid)
+        except ContentRelease.DoesNotExist:
+            return self.send_response('content_release_does_not_exist')
+        if summary:
+            return self.send_response('success', compare.compare_summary(
+                my_content_release, compare_to_content_release))
+
+        try:
+            after = compare.decode_cursor(cursor) if cursor is not None else None
+        except ValueError:
+            return self.send_response('invalid_cursor')
+        limit = limit or compare.DEFAULT_COMPARE_PAGE_SIZE
+        rows = list(islice(compare.iter_compare(
+            my_content_release, compare_to_content_release, after=after,
+            chunk_size=limit + 1), limit + 1))
+        next_cursor = compare.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return self.send_response('success', {
+            'results': rows[:limit],
+            'cursor': next_cursor,
+        })
+
+    @read_only
+    def get_document_diffs(self, site_code, my_release_uuid, compare_to_release_uuid, keys):
+        """ get_document_diffs """
+        keys = [(document_key, content_type) for document_key, content_type in keys]
+        try:
+            my_content_release = ContentRelease.objects.get(
+                site_code=site_code, uuid=my_release_uuid)
+            compare_to_content_release = ContentRelease.objects.get(
+                site_code=site_code, uuid=compare_to_release_uuid)
+        except ContentRelease.DoesNotExist:
+            return self.send_response('content_release_does_not_exist')
+
+        # (compare_to hash, my hash) by key, None when the release doesn't have the document
+        hash_pairs = {}
+        if keys:
+            keys_filter = reduce(or_, [
+                Q(document_key=document_key, content_type=content_type)
+                for document_key, content_type in keys
+            ])
+            for index, content_release in enumerate(
+                    [compare_to_content_release, my_content_release]):
+                for document_key, content_type, blob_hash in \
+                        compare.release_documents_with_base_release(content_release).filter(
+                            keys_filter, deleted=False, blob__isnull=False,
+                        ).values_list('document_key', 'content_type', 'blob__hash'):
+                    hash_pairs.setdefault((document_key, content_type), [None, None])[index] = \
+                        blob_hash
+        hash_pairs = {key: tuple(hash_pair) for key, hash_pair in hash_pairs.items()}
+
+        # a diff is computed once per pair of bodies
+        diffs = cache.get_document_diffs(set(hash_pairs.values()))
+        missing_hash_pairs = set(hash_pairs.values()) - set(diffs.keys())
+        if missing_hash_pairs:
+            bodies = dict(DocumentBlob.objects.filter(hash__in={
+                blob_hash for hash_pair in missing_hash_pairs for blob_hash in hash_pair
+                if blob_hash is not None
+            }).values_list('hash', 'body'))
+            computed_diffs = {
+                (from_hash, to_hash): compare.document_json_diff(
+                    bodies.get(from_hash), bodies.get(to_hash))
+                for from_hash, to_hash in missing_hash_pairs
+            }
+            cache.set_document_diffs(computed_diffs)
+            diffs.update(computed_diffs)
+
+        return self.send_response('success', {
+            'diffs': [
+                {
+                    'document_key': document_key,
+                    'content_type': content_type,
+                    'diff': diffs[hash_pairs[(document_key, content_type)]],
+                }
+                for document_key, content_type in keys
+                if (document_key, content_type) in hash_pairs
+            ],
+            'missing': [
+                {'document_key': document_key, 'content_type': content_type}
+                for document_key, content_type in keys
+                if (document_key, content_type) not in hash_pairs
+            ],
+        })
@@ -0,0 +1,154 @@
+"""
+.. module:: djangosnapshotpublisher.release_index
+   :synopsis: compact read only index of the documents of a release held in memory
+
+A ReleaseIndex keeps a resolved release in parallel tuples instead of a model instance or a
+dict per document: the interned document keys, the bodies, the parameters and a byte of flags
+per document, sorted by (content_type, document_key). A lookup is a binary search in the range
+of its content_type and a prefix scan reads the keys following the first match.
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+import sys
+
+
+FLAG_DELETED = 1
+FLAG_BASE_RELEASE = 2
+
+IndexedDocument = namedtuple('IndexedDocument', [
+    'document_key', 'content_type', 'document_json', 'parameters', 'deleted', 'own'])
+IndexedDocument.__doc__ = """
+document of a ReleaseIndex, parameters is a tuple of (key, content), own is False for a
+document of the base release
+"""
+
+
+class ReleaseIndex:
+    """
+    ReleaseIndex
+
+    Read only index of the documents of a release, built from an iterable of IndexedDocument
+    or by build_release_index.
+    """
+    __slots__ = ('_ranges', '_document_keys', '_bodies', '_parameters', '_flags')
+
+    def __init__(self, documents):
+        documents = sorted(documents, key=lambda document: (
+            document.content_type, document.document_key))
+        self._ranges = {}
+        for position, document in enumerate(documents):
+            content_type = sys.intern(document.content_type)
+            start, _ = self._ranges.get(content_type, (position, position))
+            self._ranges[content_type] = (start, position + 1)
+        self._document_keys = tuple(sys.intern(document.document_key) for document in documents)
+        self._bodies = tuple(document.document_json for document in documents)
+        # most documents have no parameters, they share the empty tuple
+        self._parameters = tuple(tuple(document.parameters) for document in documents)
+        self._flags = bytes(
+            (FLAG_DELETED if document.deleted else 0) |
+            (0 if document.own else FLAG_BASE_RELEASE)
+            for document in documents
+        )
+
+    def __len__(self):
+        return len(self._document_keys)
+
+    def __contains__(self, key):
+        return self._find(*key) is not None
+
+    def __iter__(self):
+        for content_type, (start, end) in sorted(self._ranges.items()):
+            for position in range(start, end):
+                yield self._document(position, content_type)
+
+    def _find(self, document_key, content_type):
+        start, end = self._ranges.get(content_type, (0, 0))
+        position = bisect_left(self._document_keys, document_key, start, end)
+        if position < end and self._document_keys[position] == document_key:
+            return position
+        return None
+
+    def _document(self, position, content_type):
+        flags = self._flags[position]
+        return IndexedDocument(
+            document_key=self._document_keys[position],
+            content_type=content_type,
+            document_json=self._bodies[position],
+            parameters=self._parameters[position],
+            deleted=bool(flags & FLAG_DELETED),
+            own=not flags & FLAG_BASE_RELEASE,
+        )
+
+    def get_document(self, document_key, content_type='content'):
+        """ get_document, raise KeyError when the release doesn't have the document """
+        position = self._find(document_key, content_type)
+        if position is None:
+            raise KeyError((document_key, content_type))
+        return self._document(position, content_type)
+
+    def get_documents(self, keys):
+        """ get_documents, return a dict by (document_key, content_type) of the documents found """
+        documents = {}
+        for document_key, content_type in keys:
+            position = self._find(document_key, content_type)
+            if position is not None:
+                documents[(document_key, content_type)] = self._document(position, content_type)
+        return documents
+
+    def scan_prefix(self, prefix, content_type='content'):
+        """ the documents of content_type whose document_key starts with prefix, by key """
+        start, end = self._ranges.get(content_type, (0, 0))
+        position = bisect_left(self._document_keys, prefix, start, end)
+        while position < end and self._document_keys[position].startswith(prefix):
+            yield self._document(position, content_type)
+            position += 1
+
+
+def build_release_index(content_release, resolve_base_release=False, max_body_chars=None):
+    """
+    index the documents of a release, with the ones of its base release it doesn't override if
+    resolve_base_release; documents with a body longer than max_body_chars characters are left
+    out without being read
+    """
+    # imported here so the index can be used without the models, like PackedRelease
+    # pylint: disable=import-outside-toplevel
+    from django.db.models import Q
+    from django.db.models.functions import Length
+
+    from .compare import release_documents_with_base_release
+    from .models import ReleaseDocument, ReleaseDocumentExtraParameter
+
+    own_release_documents = ReleaseDocument.objects.filter(content_releases=content_release.id)
+    if resolve_base_release:
+        release_documents = release_documents_with_base_release(content_release)
+        own_release_document_ids = set(own_release_documents.values_list('id', flat=True))
+    else:
+        release_documents = own_release_documents
+        own_release_document_ids = None
+
+    if max_body_chars is not None:
+        release_documents = release_documents.annotate(body_length=Length('blob__body')).filter(
+            Q(body_length__isnull=True) | Q(body_length__lte=max_body_chars))
+
+    parameters = {}
+    for release_document_id, key, content in ReleaseDocumentExtraParameter.objects.filter(
+            release_document__in=release_documents,
+    ).order_by('key').values_list('release_document_id', 'key', 'content').iterator():
+        parameters.setdefault(release_document_id, []).append((sys.intern(key), content))
+
+    def documents():
+        for release_document_id, document_key, content_type, deleted, document_json in \
+                release_documents.values_list(
+                    'id', 'document_key', 'content_type', 'deleted', 'blob__body').iterator():
+            yield IndexedDocument(
+                document_key=document_key,
+                content_type=content_type,
+                document_json=document_json,
+                parameters=parameters.get(release_document_id, ()),
+                deleted=deleted,
+                own=own_release_document_ids is None or
+                release_document_id in own_release_document_ids,
+            )
+
+    return ReleaseIndex(documents())
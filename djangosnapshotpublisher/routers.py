@@ -0,0 +1,113 @@
+"""
+.. module:: djangosnapshotpublisher.routers
+   :synopsis: route PublisherAPI reads to a read replica
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import time
+
+from django.conf import settings
+
+
+APP_LABEL = 'djangosnapshotpublisher'
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5
+
+_read_database = ContextVar('snapshotpublisher_read_database', default=None)
+_pinned_until = ContextVar('snapshotpublisher_pinned_until', default=0)
+
+
+def get_primary_database():
+    """ get_primary_database """
+    return getattr(settings, 'SNAPSHOTPUBLISHER_PRIMARY_DATABASE', 'default')
+
+
+def get_read_database():
+    """ return the database set by SNAPSHOTPUBLISHER_READ_DATABASE, None to read the primary """
+    return getattr(settings, 'SNAPSHOTPUBLISHER_READ_DATABASE', None)
+
+
+def pin_primary():
+    """ read from the primary for a short window so the context reads its own writes """
+    _pinned_until.set(time.monotonic() + getattr(
+        settings, 'SNAPSHOTPUBLISHER_READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES_SECONDS))
+
+
+def is_primary_pinned():
+    """ is_primary_pinned """
+    return _pinned_until.get() > time.monotonic()
+
+
+def get_current_read_database():
+    """ the database the reads of the context are sent to, the primary outside a read call """
+    alias = _read_database.get()
+    if alias is None or is_primary_pinned():
+        return get_primary_database()
+    return alias
+
+
+@contextmanager
+def read_from(alias):
+    """ route the reads done in the block to the given database alias """
+    token = _read_database.set(alias)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """ route the reads done in the block to the primary, whatever the database of the context """
+    with read_from(get_primary_database()):
+        yield
+
+
+def read_only(method):
+    """ decorator for the PublisherAPI reads, they are routed to api.read_database """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with read_from(self.read_database):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def write(method):
+    """ decorator for the PublisherAPI writes, the following reads go to the primary """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            pin_primary()
+    return wrapper
+
+
+class PublisherRouter:
+    """
+    PublisherRouter
+
+    Send the reads done by the PublisherAPI read calls to their read database, unless a write
+    happened in the same context during the last SNAPSHOTPUBLISHER_READ_YOUR_WRITES_SECONDS.
+    The other reads, e.g. the ones of the writes, and the writes, including the ones done by a
+    read call (e.g. promoting a scheduled release), go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        """ db_for_read """
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return get_current_read_database()
+
+    def db_for_write(self, model, **hints):
+        """ db_for_write """
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return get_primary_database()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """ objects read from the replica can be linked to objects of the primary """
+        if obj1._meta.app_label == APP_LABEL and obj2._meta.app_label == APP_LABEL:
+            return True
+        return None
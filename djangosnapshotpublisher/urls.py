@@ -0,0 +1,30 @@
+"""
+.. module:: djangosnapshotpublisher.urls
+   :synopsis: optional read only http api, include it in the project urls to enable it
+"""
+
+from django.urls import path
+
+from . import views
+
+
+app_name = 'djangosnapshotpublisher'
+
+urlpatterns = [
+    path(
+        '<slug:site_code>/live/',
+        views.live_content_release,
+        name='live_content_release',
+    ),
+    path(
+        '<slug:site_code>/releases/<uuid:release_uuid>/documents/',
+        views.release_documents,
+        name='release_documents',
+    ),
+    path(
+        '<slug:site_code>/releases/<uuid:release_uuid>/documents/<str:content_type>/'
+        '<path:document_key>',
+        views.release_document,
+        name='release_document',
+    ),
+]
@@ -0,0 +1,103 @@
+"""
+.. module:: djangosnapshotpublisher.views
+   :synopsis: optional read only http api
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+from .lazy_encoder import LazyEncoder
+from .models import ContentRelease
+from .publisher_api import PublisherAPI
+
+
+ARCHIVED_STATUS = 3
+DEFAULT_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def _json_response(request, response, immutable=False):
+    """
+    serialize a PublisherAPI response with a strong ETag computed from its content and answer
+    304 when the client already has it
+    """
+    content = json.dumps(response, cls=LazyEncoder, sort_keys=True).encode()
+    http_response = HttpResponse(
+        content,
+        content_type='application/json',
+        status=200 if response['status'] == 'success' else 404,
+    )
+    if http_response.status_code != 200:
+        return http_response
+
+    http_response['ETag'] = '"{}"'.format(hashlib.sha256(content).hexdigest())
+    if immutable:
+        patch_cache_control(http_response, public=True, immutable=True, max_age=getattr(
+            settings, 'SNAPSHOTPUBLISHER_IMMUTABLE_MAX_AGE', DEFAULT_IMMUTABLE_MAX_AGE))
+    else:
+        patch_cache_control(http_response, no_cache=True)
+    return get_conditional_response(
+        request, etag=http_response['ETag'], response=http_response)
+
+
+def _is_immutable(site_code, release_uuid, resolve_base_release=False):
+    """
+    the documents of an archived release are only sent as immutable when
+    SNAPSHOTPUBLISHER_IMMUTABLE_ARCHIVED_RELEASES says they are never written again, the
+    PublisherAPI doesn't prevent it, and when they don't depend on the current live release
+    """
+    if not getattr(settings, 'SNAPSHOTPUBLISHER_IMMUTABLE_ARCHIVED_RELEASES', False):
+        return False
+    content_release = ContentRelease.objects.filter(
+        site_code=site_code, uuid=release_uuid, status=ARCHIVED_STATUS,
+    ).select_related('base_release').first()
+    if content_release is None:
+        return False
+    if resolve_base_release:
+        if content_release.use_current_live_as_base_release:
+            return False
+        if content_release.base_release_id and \
+                content_release.base_release.status != ARCHIVED_STATUS:
+            return False
+    return True
+
+
+@require_safe
+def live_content_release(request, site_code):
+    """ live_content_release """
+    response = PublisherAPI().get_live_content_release(site_code, include_parameters=True)
+    if response['status'] == 'success':
+        response['content'] = response['content'].to_dict(include_parameters=True)
+    return _json_response(request, response)
+
+
+@require_safe
+def release_document(request, site_code, release_uuid, content_type, document_key):
+    """ release_document """
+    response = PublisherAPI().get_document_with_extra_from_content_release(
+        site_code, release_uuid, document_key, content_type)
+    return _json_response(
+        request, response, immutable=response['status'] == 'success' and _is_immutable(
+            site_code, release_uuid))
+
+
+@require_safe
+def release_documents(request, site_code, release_uuid):
+    """
+    release_documents, multi-get of the documents passed as `key` query parameters
+    eg: ?key=content:key1&key=navigation:nav
+    """
+    keys = [
+        tuple(reversed(key.split(':', 1))) if ':' in key else (key, 'content')
+        for key in request.GET.getlist('key')
+    ]
+    resolve_base_release = request.GET.get('resolve_base_release') == 'true'
+    response = PublisherAPI().get_documents_from_content_release(
+        site_code, release_uuid, keys, resolve_base_release=resolve_base_release)
+    return _json_response(
+        request, response, immutable=response['status'] == 'success' and _is_immutable(
+            site_code, release_uuid, resolve_base_release))
@@ -0,0 +1,103 @@
+"""
+.. module:: djangosnapshotpublisher.warmup
+   :synopsis: fill the cache with a release before it goes live
+
+The documents of the incoming release are cached under the generation its go live will set
+(see djangosnapshotpublisher.cache), so they are served from the cache as soon as the pointer
+flips. The documents are read in batches by up to SNAPSHOTPUBLISHER_WARM_CONCURRENCY threads
+so a warm-up doesn't load the database more than a few readers would.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+from . import cache
+from .models import ReleaseDocument
+
+
+DEFAULT_WARM_BATCH_SIZE = 500
+DEFAULT_WARM_CONCURRENCY = 4
+
+
+def warm_marker_key(site_code, release_uuid, generation):
+    """ warm_marker_key """
+    return '{}:warm:{}:{}:{}'.format(cache.CACHE_KEY_PREFIX, site_code, generation, release_uuid)
+
+
+def warm_content_release(content_release, batch_size=None, concurrency=None):
+    """
+    cache the documents of a release for its go live, return the number of documents cached,
+    None if caching is disabled or the release is already warm for its next go live
+    """
+    site_code = content_release.site_code
+    generation = cache.get_cutover_generation(site_code)
+    if generation is None:
+        return None
+
+    # the marker is claimed up front so concurrent warm-ups of the release don't overlap, and
+    # released if a batch fails so the next attempt isn't skipped
+    marker_key = warm_marker_key(site_code, content_release.uuid, generation)
+    if not cache.get_cache().add(marker_key, True, cache.get_cache_timeout()):
+        return None
+    try:
+        return _warm_content_release(
+            content_release, site_code, generation, batch_size, concurrency)
+    except BaseException:
+        cache.get_cache().delete(marker_key)
+        raise
+
+
+def warm_and_cutover(content_release):
+    """
+    warm a release then cut the cache over to it as the live release, the cutover is done even
+    if the warm-up fails
+    """
+    try:
+        warm_content_release(content_release)
+    finally:
+        cache.cutover(content_release.site_code, content_release)
+
+
+def _warm_content_release(content_release, site_code, generation, batch_size, concurrency):
+
+    batch_size = batch_size or getattr(
+        settings, 'SNAPSHOTPUBLISHER_WARM_BATCH_SIZE', DEFAULT_WARM_BATCH_SIZE)
+    concurrency = concurrency or getattr(
+        settings, 'SNAPSHOTPUBLISHER_WARM_CONCURRENCY', DEFAULT_WARM_CONCURRENCY)
+    release_document_ids = list(content_release.release_documents.order_by(
+        'id').values_list('id', flat=True))
+    batches = [
+        release_document_ids[index:index + batch_size]
+        for index in range(0, len(release_document_ids), batch_size)
+    ]
+
+    warm_batch = partial(_warm_batch, site_code, generation, content_release.uuid)
+    if concurrency <= 1 or len(batches) <= 1:
+        for batch in batches:
+            warm_batch(batch)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(partial(_warm_batch_in_thread, warm_batch), batches))
+    return len(release_document_ids)
+
+
+def _warm_batch(site_code, generation, release_uuid, release_document_ids):
+    release_documents = ReleaseDocument.objects.filter(
+        id__in=release_document_ids,
+    ).select_related('blob').prefetch_related('parameters')
+    cache.set_documents(site_code, generation, release_uuid, {
+        (release_document.document_key, release_document.content_type):
+            release_document.to_dict(include_parameters=True)
+        for release_document in release_documents
+    })
+
+
+def _warm_batch_in_thread(warm_batch, release_document_ids):
+    try:
+        warm_batch(release_document_ids)
+    finally:
+        # the connections of the worker threads would be left open otherwise
+        connections.close_all()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+.. module:: scripts.benchmark_async_api
+   :synopsis: compare PublisherAPI and AsyncPublisherAPI under concurrent load
+
+Create a test database, publish a release then fetch its documents with the sync api (one call
+after the other, like a sync worker would) and with the async api (all the calls of a page
+fanned out with asyncio.gather).
+
+    DJANGO_SETTINGS_MODULE=config.settings.test python scripts/benchmark_async_api.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.test')
+
+import django  # noqa: E402
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from djangosnapshotpublisher.async_publisher_api import AsyncPublisherAPI  # noqa: E402
+from djangosnapshotpublisher.publisher_api import PublisherAPI  # noqa: E402
+
+
+def seed(publisher_api, documents):
+    """ publish a live release with the given number of documents """
+    content_release = publisher_api.add_content_release('bench', 'bench', '0.0.1')['content']
+    for index in range(documents):
+        publisher_api.publish_document_to_content_release(
+            'bench', content_release.uuid, json.dumps({'index': index, 'body': 'x' * 1024}),
+            'key{}'.format(index), parameters={'index': str(index)})
+    publisher_api.set_stage_content_release('bench', content_release.uuid)
+    publisher_api.set_live_content_release('bench', content_release.uuid)
+    return content_release
+
+
+def page_keys(page, page_size, documents):
+    """ page_keys """
+    return [
+        'key{}'.format((page * page_size + index) % documents) for index in range(page_size)
+    ]
+
+
+def run_sync(publisher_api, release_uuid, pages, page_size, documents):
+    """ one call per document, one page after the other """
+    for page in range(pages):
+        publisher_api.get_live_content_release('bench')
+        for document_key in page_keys(page, page_size, documents):
+            publisher_api.get_document_with_extra_from_content_release(
+                'bench', release_uuid, document_key)
+
+
+async def run_async(publisher_api, release_uuid, pages, page_size, documents, concurrency):
+    """ the documents of a page are fanned out, up to `concurrency` pages at the same time """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def render_page(page):
+        async with semaphore:
+            await publisher_api.get_live_content_release('bench')
+            await asyncio.gather(*[
+                publisher_api.get_document_with_extra_from_content_release(
+                    'bench', release_uuid, document_key)
+                for document_key in page_keys(page, page_size, documents)
+            ])
+
+    await asyncio.gather(*[render_page(page) for page in range(pages)])
+
+
+async def run_async_multi_get(publisher_api, release_uuid, pages, page_size, documents,
+                              concurrency):
+    """ one multi-get per page, up to `concurrency` pages at the same time """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def render_page(page):
+        async with semaphore:
+            await publisher_api.get_live_content_release('bench')
+            await publisher_api.get_documents_from_content_release('bench', release_uuid, [
+                (document_key, 'content')
+                for document_key in page_keys(page, page_size, documents)
+            ])
+
+    await asyncio.gather(*[render_page(page) for page in range(pages)])
+
+
+def timed(label, function, *args):
+    """ timed """
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    print('{:<24} {:>8.3f}s'.format(label, elapsed))
+
+
+def main():
+    """ main """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        content_release = seed(PublisherAPI(), args.documents)
+        print('{} pages of {} documents, concurrency {}'.format(
+            args.pages, args.page_size, args.concurrency))
+        timed('PublisherAPI', run_sync, PublisherAPI(), content_release.uuid, args.pages,
+              args.page_size, args.documents)
+        timed('AsyncPublisherAPI', asyncio.run, run_async(
+            AsyncPublisherAPI(), content_release.uuid, args.pages, args.page_size,
+            args.documents, args.concurrency))
+        timed('AsyncPublisherAPI multi', asyncio.run, run_async_multi_get(
+            AsyncPublisherAPI(), content_release.uuid, args.pages, args.page_size,
+            args.documents, args.concurrency))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
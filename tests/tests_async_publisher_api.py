@@ -0,0 +1,84 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+import asyncio
+import json
+import uuid
+
+from asgiref.sync import async_to_sync
+from django.test import TransactionTestCase
+
+from djangosnapshotpublisher.async_publisher_api import AsyncPublisherAPI
+from djangosnapshotpublisher.models import ContentRelease
+
+
+class AsyncPublisherAPITestCase(TransactionTestCase):
+    """ unittest for AsyncPublisherAPI, reads run in other threads so data must be committed """
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = AsyncPublisherAPI(api_type='django')
+
+    def test_read_write(self):
+        """ unittest for AsyncPublisherAPI reads and writes """
+
+        async def scenario():
+            response = await self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+            content_release = response['content']
+            for index in range(5):
+                await self.publisher_api.publish_document_to_content_release(
+                    'site1', content_release.uuid, json.dumps({'index': index}),
+                    'key{}'.format(index))
+
+            #  fan out reads across documents
+            responses = await asyncio.gather(*[
+                self.publisher_api.get_document_with_extra_from_content_release(
+                    'site1', content_release.uuid, 'key{}'.format(index))
+                for index in range(5)
+            ])
+            self.assertEqual(
+                [json.loads(response['content']['document_json'])['index']
+                 for response in responses],
+                list(range(5)))
+
+            #  multi-get
+            response = await self.publisher_api.get_documents_from_content_release(
+                'site1', content_release.uuid, [('key0', 'content'), ('key9', 'content')])
+            self.assertEqual(len(response['content']['documents']), 1)
+            self.assertEqual(len(response['content']['missing']), 1)
+
+            #  querysets are evaluated before being returned to the event loop
+            response = await self.publisher_api.list_content_releases('site1')
+            self.assertEqual([item.title for item in response['content']], ['title1'])
+
+            #  go live then get live across sites
+            await self.publisher_api.set_stage_content_release('site1', content_release.uuid)
+            await self.publisher_api.set_live_content_release('site1', content_release.uuid)
+            responses = await asyncio.gather(
+                self.publisher_api.get_live_content_release('site1'),
+                self.publisher_api.get_live_content_release('site2'),
+            )
+            self.assertEqual(responses[0]['content'], content_release)
+            self.assertEqual(responses[1]['error_code'], 'no_content_release_live')
+
+            #  errors
+            response = await self.publisher_api.get_document_from_content_release(
+                'site1', uuid.uuid4(), 'key1')
+            self.assertEqual(response['error_code'], 'content_release_does_not_exist')
+
+        async_to_sync(scenario)()
+        self.assertTrue(ContentRelease.objects.filter(site_code='site1', is_live=True).exists())
+
+    def test_json_api_type(self):
+        """ unittest for AsyncPublisherAPI with api_type=json """
+
+        publisher_api = AsyncPublisherAPI(api_type='json')
+        self.assertEqual(publisher_api.api_type, 'json')
+        response = json.loads(async_to_sync(publisher_api.add_content_release)(
+            'site1', 'title1', '0.0.1', {'frontend_id': 'v0.1'}))
+        response = json.loads(async_to_sync(publisher_api.get_content_release_details)(
+            'site1', response['content']['uuid'], include_parameters=True))
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content']['parameters'], {'frontend_id': 'v0.1'})
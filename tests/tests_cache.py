@@ -0,0 +1,397 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+import contextvars
+from functools import partial
+import hashlib
+from io import StringIO
+import pickle
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from djangosnapshotpublisher import cache
+from djangosnapshotpublisher.cache import LocalCache, SingleFlight
+from djangosnapshotpublisher.models import ContentRelease
+from djangosnapshotpublisher.publisher_api import PublisherAPI
+from djangosnapshotpublisher.routers import pin_primary, read_from
+from djangosnapshotpublisher.warmup import warm_content_release
+
+
+class LocalCacheTestCase(TestCase):
+    """ unittest for LocalCache """
+
+    def test_local_cache(self):
+        """ unittest for the LRU bounded in bytes """
+
+        entry_size = len(pickle.dumps({'document_json': 'a' * 300}, pickle.HIGHEST_PROTOCOL))
+        local_cache = LocalCache(max_bytes=entry_size * 3)
+        self.assertIsNone(local_cache.get('key1'))
+        local_cache.set('key1', {'document_json': 'a' * 300})
+        local_cache.set('key2', {'document_json': 'b' * 300})
+
+        #  copies are returned
+        document = local_cache.get('key1')
+        document['document_json'] = 'changed'
+        self.assertEqual(local_cache.get('key1'), {'document_json': 'a' * 300})
+
+        #  the least recently used entries are evicted once max_bytes is reached
+        local_cache.set('key3', {'document_json': 'c' * 300})
+        local_cache.set('key4', {'document_json': 'd' * 300})
+        self.assertIsNone(local_cache.get('key2'))
+        self.assertIsNotNone(local_cache.get('key1'))
+        stats = local_cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['entries'], 3)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['bytes'], entry_size * 3)
+
+        #  values bigger than the cache are not stored
+        local_cache.set('key5', 'e' * entry_size * 4)
+        self.assertIsNone(local_cache.get('key5'))
+        local_cache.clear()
+        self.assertEqual(local_cache.stats()['bytes'], 0)
+
+
+class SingleFlightTestCase(TestCase):
+    """ unittest for SingleFlight """
+
+    def test_single_flight(self):
+        """ unittest for concurrent calls of a key computed once """
+
+        single_flight = SingleFlight()
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': 1}
+
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight.do('key', compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 1}] * 5)
+
+        #  the key is computed again once done
+        single_flight.do('key', compute)
+        self.assertEqual(len(calls), 2)
+
+        #  exceptions are raised to every caller
+        with self.assertRaises(ZeroDivisionError):
+            single_flight.do('key', lambda: 1 / 0)
+
+    @override_settings(SNAPSHOTPUBLISHER_READ_YOUR_WRITES_SECONDS=60)
+    def test_coalesce_read_database(self):
+        """ unittest for a caller pinned to the primary while a replica read is in flight """
+
+        started = threading.Event()
+        calls = []
+        results = []
+
+        def compute(alias):
+            calls.append(alias)
+            started.set()
+            time.sleep(0.2)
+            return alias
+
+        def read_replica():
+            with read_from('replica'):
+                results.append(cache.coalesce('key', partial(compute, 'replica')))
+
+        def read_own_writes():
+            pin_primary()
+            with read_from('replica'):
+                return cache.coalesce('key', partial(compute, 'default'))
+
+        thread = threading.Thread(target=read_replica)
+        thread.start()
+        started.wait()
+        result = contextvars.copy_context().run(read_own_writes)
+        thread.join()
+        self.assertEqual(result, 'default')
+        self.assertEqual(results, ['replica'])
+        self.assertEqual(sorted(calls), ['default', 'replica'])
+
+
+@override_settings(
+    SNAPSHOTPUBLISHER_CACHE='default',
+    SNAPSHOTPUBLISHER_LOCAL_CACHE_MAX_BYTES=1024 * 1024,
+)
+class PublisherAPICacheTestCase(TransactionTestCase):
+    """ unittest for the PublisherAPI read caches """
+
+    def setUp(self):
+        """ setUp """
+        caches['default'].clear()
+        self.publisher_api = PublisherAPI(api_type='django')
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', {'frontend_id': 'v0.1'})
+        self.content_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '{}', 'key1')
+        self.publisher_api.set_stage_content_release('site1', self.content_release.uuid)
+        self.publisher_api.set_live_content_release('site1', self.content_release.uuid)
+
+    def test_local_cache(self):
+        """ unittest for documents served by the local cache """
+
+        cache.get_local_cache().clear()
+        self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', self.content_release.uuid, 'key1')
+        hits = cache.get_local_cache_stats()['hits']
+
+        #  served from the process without reading the document from the shared cache
+        caches['default'].delete_many([
+            cache.document_cache_key(
+                'site1', self.content_release.uuid, 'key1', 'content',
+                cache.get_generation('site1')),
+        ])
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release.uuid, 'key1')
+        self.assertEqual(response['content']['document_key'], 'key1')
+        self.assertEqual(cache.get_local_cache_stats()['hits'], hits + 1)
+
+        #  a generation bumped by another process invalidates the local entries
+        caches['default'].incr(cache.generation_key('site1'))
+        with self.assertNumQueries(2):
+            self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release.uuid, 'key1')
+
+    def test_live_content_release(self):
+        """ unittest for the cached live release """
+
+        self.publisher_api.get_live_content_release('site1')
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_live_content_release(
+                'site1', include_parameters=True)
+            self.assertEqual(response['content'], self.content_release)
+            self.assertEqual(
+                response['content'].to_dict(include_parameters=True)['parameters'],
+                {'frontend_id': 'v0.1'})
+
+        #  a cutover invalidates the cached live release
+        response = self.publisher_api.add_content_release('site1', 'title2', '0.0.2')
+        content_release2 = response['content']
+        self.publisher_api.set_stage_content_release('site1', content_release2.uuid)
+        self.publisher_api.set_live_content_release('site1', content_release2.uuid)
+        response = self.publisher_api.get_live_content_release('site1')
+        self.assertEqual(response['content'], content_release2)
+
+    def test_live_content_release_scheduled(self):
+        """ unittest for the cached live release when a release is scheduled """
+
+        response = self.publisher_api.add_content_release('site1', 'title2', '0.0.2')
+        content_release2 = response['content']
+        self.publisher_api.set_stage_content_release('site1', content_release2.uuid)
+        self.publisher_api.get_live_content_release('site1')
+
+        #  the cached live release expires at the publish_datetime of the scheduled release
+        ContentRelease.objects.filter(id=content_release2.id).update(
+            publish_datetime=timezone.now() - timezone.timedelta(seconds=1))
+        caches['default'].set(
+            cache.live_cache_key('site1', cache.get_generation('site1')),
+            (self.content_release, timezone.now() - timezone.timedelta(seconds=1)))
+        cache.get_local_cache().clear()
+        response = self.publisher_api.get_live_content_release('site1')
+        self.assertEqual(response['content'], content_release2)
+
+    def test_document_diffs(self):
+        """ unittest for the cached document diffs """
+
+        response = self.publisher_api.add_content_release('site1', 'title2', '0.0.2')
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"title": "title2"}', 'key1')
+        self.publisher_api.get_document_diffs(
+            'site1', content_release2.uuid, self.content_release.uuid, [('key1', 'content')])
+
+        #  the diff is cached by the pair of bodies, only the hashes are queried
+        with self.assertNumQueries(4):
+            response = self.publisher_api.get_document_diffs(
+                'site1', content_release2.uuid, self.content_release.uuid,
+                [('key1', 'content')])
+        self.assertEqual(response['content']['diffs'][0]['diff'], [
+            {'op': 'add', 'path': '/title', 'value': 'title2'},
+        ])
+
+    def lock(self, key):
+        """ hold the lock of a key as another process would """
+        caches['default'].add('{}:lock:{}'.format(
+            cache.CACHE_KEY_PREFIX, hashlib.md5(key.encode()).hexdigest()), 1)
+
+    @override_settings(SNAPSHOTPUBLISHER_STAMPEDE_WAIT=0.1)
+    def test_stampede(self):
+        """ unittest for the misses computed by another process """
+
+        self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', self.content_release.uuid, 'key1')
+        self.publisher_api.get_live_content_release('site1')
+        cache.bump_generation('site1')
+        generation = cache.get_generation('site1')
+        self.lock(cache.document_cache_key(
+            'site1', self.content_release.uuid, 'key1', 'content', generation))
+        self.lock(cache.live_cache_key('site1', generation))
+
+        #  as another process, without the writes of setUp
+        with self.settings(SNAPSHOTPUBLISHER_READ_YOUR_WRITES_SECONDS=0):
+            pin_primary()
+
+        #  the entries of the previous generation are served while the lock is held
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release.uuid, 'key1')
+            self.assertEqual(response['content']['document_key'], 'key1')
+            response = self.publisher_api.get_live_content_release('site1')
+            self.assertEqual(response['content'], self.content_release)
+
+        #  unless the context reads its own writes, then it waits for the lock holder
+        pin_primary()
+        with self.assertNumQueries(2):
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release.uuid, 'key1')
+        self.assertEqual(response['content']['document_key'], 'key1')
+
+    @override_settings(SNAPSHOTPUBLISHER_SERVE_STALE=False)
+    def test_stampede_lock_released(self):
+        """ unittest for a miss computed by another process """
+
+        self.publisher_api.get_documents_from_content_release(
+            'site1', self.content_release.uuid, [('key1', 'content'), ('key2', 'content')])
+        cache.bump_generation('site1')
+        generation = cache.get_generation('site1')
+        keys = [('key1', 'content'), ('key2', 'content')]
+        key = cache.documents_cache_key('site1', self.content_release.uuid, keys, generation)
+        self.lock(key)
+
+        #  released by the lock holder without a value, the batch is computed right away
+        threading.Timer(0.1, caches['default'].delete_many, [[
+            '{}:lock:{}'.format(cache.CACHE_KEY_PREFIX, hashlib.md5(key.encode()).hexdigest()),
+        ]]).start()
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', self.content_release.uuid, keys)
+        self.assertEqual(len(response['content']['documents']), 1)
+        self.assertEqual(response['content']['missing'], [
+            {'document_key': 'key2', 'content_type': 'content'}])
+
+
+@override_settings(SNAPSHOTPUBLISHER_CACHE='default')
+class CacheWarmUpTestCase(TransactionTestCase):
+    """ unittest for the cache warm-up before a go live """
+
+    def setUp(self):
+        """ setUp """
+        caches['default'].clear()
+        self.publisher_api = PublisherAPI(api_type='django')
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release1 = response['content']
+        self.publisher_api.set_stage_content_release('site1', content_release1.uuid)
+        self.publisher_api.set_live_content_release('site1', content_release1.uuid)
+
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', {'frontend_id': 'v0.2'})
+        self.content_release2 = response['content']
+        for index in range(5):
+            self.publisher_api.publish_document_to_content_release(
+                'site1', self.content_release2.uuid, '{}', 'key{}'.format(index),
+                parameters={'p1': str(index)})
+        self.publisher_api.set_stage_content_release('site1', self.content_release2.uuid)
+
+    def test_warm_ahead(self):
+        """ unittest for the warm-up of a scheduled release by release_publisher """
+
+        publish_datetime = timezone.now() + timezone.timedelta(seconds=0.5)
+        ContentRelease.objects.filter(id=self.content_release2.id).update(
+            publish_datetime=publish_datetime)
+        out = StringIO()
+        call_command(
+            'release_publisher', '--warm-batch-size=2', '--warm-concurrency=2', stdout=out)
+        self.assertIn('Warmed 5 documents of {}'.format(self.content_release2.uuid),
+                      out.getvalue())
+
+        #  already warm
+        out = StringIO()
+        call_command('release_publisher', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+        #  the scheduled go live serves the release and its documents from the cache
+        time.sleep(max((publish_datetime - timezone.now()).total_seconds(), 0))
+        self.publisher_api.get_live_content_release('site1')
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_live_content_release(
+                'site1', include_parameters=True)
+            self.assertEqual(response['content'], self.content_release2)
+            self.assertEqual(response['content'].status, 2)
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release2.uuid, 'key3')
+            self.assertEqual(response['content']['parameters'], {'p1': '3'})
+
+    @override_settings(SNAPSHOTPUBLISHER_WARM_ON_GO_LIVE=False)
+    def test_warm_outdated(self):
+        """ unittest for a write done after the warm-up """
+
+        warm_content_release(self.content_release2)
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release2.uuid, '{"changed": true}', 'key3')
+        self.publisher_api.set_live_content_release('site1', self.content_release2.uuid)
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', self.content_release2.uuid, 'key3')
+        self.assertEqual(response['content']['document_json'], '{"changed": true}')
+
+    @override_settings(SNAPSHOTPUBLISHER_WARM_ON_GO_LIVE=False)
+    def test_warm_failed(self):
+        """ unittest for a warm-up retried after a failed batch """
+
+        with mock.patch.object(cache, 'set_documents', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                warm_content_release(self.content_release2, batch_size=2, concurrency=1)
+        self.assertEqual(warm_content_release(self.content_release2), 5)
+        self.assertIsNone(warm_content_release(self.content_release2))
+
+    def test_warm_on_go_live(self):
+        """ unittest for the warm-up done by set_live_content_release """
+
+        self.publisher_api.set_live_content_release('site1', self.content_release2.uuid)
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_live_content_release('site1')
+            self.assertEqual(response['content'], self.content_release2)
+            response = self.publisher_api.get_documents_from_content_release(
+                'site1', self.content_release2.uuid,
+                [('key0', 'content'), ('key4', 'content')])
+            self.assertEqual(len(response['content']['documents']), 2)
+
+    @override_settings(SNAPSHOTPUBLISHER_WARM_BATCH_SIZE=2, SNAPSHOTPUBLISHER_WARM_CONCURRENCY=2)
+    def test_warm_on_go_live_in_transaction(self):
+        """ unittest for a go live done in the transaction of the caller """
+
+        with transaction.atomic():
+            self.publisher_api.publish_document_to_content_release(
+                'site1', self.content_release2.uuid, '{"changed": true}', 'key3')
+            self.publisher_api.set_live_content_release('site1', self.content_release2.uuid)
+
+        #  warmed once committed, with the documents written in the transaction
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_live_content_release('site1')
+            self.assertEqual(response['content'], self.content_release2)
+            response = self.publisher_api.get_documents_from_content_release(
+                'site1', self.content_release2.uuid,
+                [('key0', 'content'), ('key3', 'content')])
+        self.assertEqual(
+            [document['document_json'] for document in response['content']['documents']],
+            ['{}', '{"changed": true}'])
@@ -0,0 +1,113 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+from io import StringIO
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from djangosnapshotpublisher.export import MANIFEST_FILENAME, document_path
+from djangosnapshotpublisher.publisher_api import PublisherAPI
+
+
+class ExportStaticTestCase(TestCase):
+    """ unittest for export_static """
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        self.content_release1 = response['content']
+        for index in range(10):
+            self.publisher_api.publish_document_to_content_release(
+                'site1', self.content_release1.uuid, json.dumps({'index': index}),
+                'news/{}'.format(index))
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release1.uuid, '{"links": []}', 'main', 'navigation')
+        self.publisher_api.set_stage_content_release('site1', self.content_release1.uuid)
+        self.publisher_api.set_live_content_release('site1', self.content_release1.uuid)
+
+    def tearDown(self):
+        """ tearDown """
+        self.tmp_dir.cleanup()
+
+    def read(self, path):
+        """ content of an exported file """
+        with open(os.path.join(self.path, path), encoding='utf-8') as export_file:
+            return export_file.read()
+
+    def test_export_static(self):
+        """ unittest for export_static """
+
+        out = StringIO()
+        call_command(
+            'export_static', 'site1', 'live', self.path, '--processes=2', '--batch-size=3',
+            stdout=out)
+        self.assertIn('11 written, 0 unchanged, 0 deleted', out.getvalue())
+        self.assertEqual(self.read('content/news%2F3.json'), '{"index": 3}')
+        manifest = json.loads(self.read(MANIFEST_FILENAME))
+        self.assertEqual(manifest['release_uuid'], str(self.content_release1.uuid))
+        self.assertEqual(len(manifest['documents']), 11)
+        self.assertEqual(manifest['documents'][0]['path'], document_path('news/0', 'content'))
+
+        #  incremental export of the next release
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', use_current_live_as_base_release=True)
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"index": "changed"}', 'news/3')
+        self.publisher_api.delete_document_from_content_release(
+            'site1', content_release2.uuid, 'news/4')
+        out = StringIO()
+        call_command(
+            'export_static', 'site1', str(content_release2.uuid), self.path,
+            '--resolve-base-release', '--incremental', '--processes=2', stdout=out)
+        self.assertIn('1 written, 9 unchanged, 1 deleted', out.getvalue())
+        self.assertEqual(self.read('content/news%2F3.json'), '{"index": "changed"}')
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'content/news%2F4.json')))
+        self.assertEqual(len(json.loads(self.read(MANIFEST_FILENAME))['documents']), 10)
+
+    def test_document_path(self):
+        """ unittest for the paths of the documents """
+
+        self.assertEqual(
+            document_path('news/3', 'content'), os.path.join('content', 'news%2F3.json'))
+        for content_type in ['', '.', '..', 'a/b', 'a\\b']:
+            with self.assertRaises(ValueError):
+                document_path('key1', content_type)
+
+        #  too long for a file name, shortened with the hash of the document_key
+        paths = {
+            document_path(''.join(['é' * 200, suffix]), 'content') for suffix in 'ab'
+        }
+        self.assertEqual(len(paths), 2)
+        for path in paths:
+            self.assertLessEqual(len(os.path.basename(path).encode()), 255)
+            self.assertTrue(path.endswith('.json'))
+
+    def test_export_static_paths(self):
+        """ unittest for the export of documents with a long key or an invalid content_type """
+
+        document_key = 'é' * 250
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release1.uuid, '{"long": true}', document_key)
+        export_path = os.path.join(self.path, 'export')
+        call_command('export_static', 'site1', 'live', export_path, stdout=StringIO())
+        self.assertEqual(
+            self.read(os.path.join('export', document_path(document_key, 'content'))),
+            '{"long": true}')
+
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release1.uuid, '{}', 'key1', '..')
+        with self.assertRaises(CommandError):
+            call_command('export_static', 'site1', 'live', export_path, stdout=StringIO())
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'key1.json')))
@@ -0,0 +1,157 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from djangosnapshotpublisher.garbage_collection import gc_document_blobs
+from djangosnapshotpublisher.models import (ContentRelease, DocumentBlob, ReleaseDocument,
+                                            ReleaseDocumentExtraParameter, document_blob_hash)
+from djangosnapshotpublisher.publisher_api import PublisherAPI
+
+
+class GCReleaseDocumentsTestCase(TestCase):
+    """ unittest for gc_release_documents """
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django')
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        self.content_release1 = response['content']
+        for index in range(5):
+            self.publisher_api.publish_document_to_content_release(
+                'site1', self.content_release1.uuid, '{{"index": {}}}'.format(index),
+                'key{}'.format(index), parameters={'p1': str(index)})
+        self.publisher_api.delete_document_from_content_release(
+            'site1', self.content_release1.uuid, 'key5')
+
+        #  a copy shares the documents of the release
+        self.content_release2 = self.content_release1.copy({'version': '0.0.2'})
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release2.uuid, '{}', 'key6')
+
+    def test_gc_release_documents(self):
+        """ unittest for gc_release_documents """
+
+        #  Nothing to collect
+        response = self.publisher_api.gc_release_documents()
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(
+            response['content'], {'count': 0, 'blob_count': 0, 'dry_run': False})
+
+        #  Documents of a removed release still referenced by another one are kept
+        self.publisher_api.remove_content_release('site1', self.content_release1.uuid)
+        response = self.publisher_api.gc_release_documents()
+        self.assertEqual(response['content']['count'], 0)
+
+        #  Dry run, then documents and parameters deleted in batches
+        self.publisher_api.remove_content_release('site1', self.content_release2.uuid)
+        out = StringIO()
+        call_command('gc_release_documents', '--dry-run', '--batch-size=2', stdout=out)
+        self.assertIn('Found 7 orphaned documents', out.getvalue())
+        self.assertIn('Found 6 unreferenced blobs', out.getvalue())
+        self.assertEqual(ReleaseDocument.objects.count(), 7)
+
+        out = StringIO()
+        call_command('gc_release_documents', '--batch-size=2', verbosity=2, stdout=out)
+        self.assertIn('Deleted 2 documents so far', out.getvalue())
+        self.assertIn('Deleted 7 orphaned documents', out.getvalue())
+        self.assertIn('Deleted 6 unreferenced blobs', out.getvalue())
+        self.assertFalse(ReleaseDocument.objects.exists())
+        self.assertFalse(ReleaseDocumentExtraParameter.objects.exists())
+        self.assertFalse(DocumentBlob.objects.exists())
+
+    def test_gc_document_blobs(self):
+        """ unittest for gc_document_blobs and the blobs referenced again """
+        self.publisher_api.unpublish_document_from_content_release(
+            'site1', self.content_release2.uuid, 'key6')
+        document_blob = DocumentBlob.objects.get(hash=document_blob_hash('{}'))
+
+        #  an orphan blob referenced again by a document is kept
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release2.uuid, '{}', 'key7')
+        self.assertEqual(gc_document_blobs(), 0)
+        self.assertEqual(ReleaseDocument.objects.get(document_key='key7').blob, document_blob)
+
+        self.publisher_api.unpublish_document_from_content_release(
+            'site1', self.content_release2.uuid, 'key7')
+        self.assertEqual(gc_document_blobs(), 1)
+        self.assertFalse(DocumentBlob.objects.filter(id=document_blob.id).exists())
+
+        #  the bodies are only read by the queries asking for them
+        self.assertNotIn(
+            DocumentBlob._meta.db_table, str(ReleaseDocument.objects.filter(deleted=False).query))
+
+
+@override_settings(SNAPSHOTPUBLISHER_RETENTION={'site1': {'keep_last': 1, 'keep_days': 30}})
+class RetentionPolicyTestCase(TestCase):
+    """ unittest for apply_retention_policy """
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django')
+        self.content_releases = {}
+        for site_code, version, days, status in [
+                ('site1', '0.1', 100, 3),
+                ('site1', '0.2', 50, 3),
+                ('site1', '0.3', 40, 3),
+                ('site1', '0.4', 35, 3),
+                ('site1', '0.5', 1, 2),
+                ('site2', '0.1', 100, 3)]:
+            content_release = ContentRelease(
+                site_code=site_code,
+                title='title{}'.format(version),
+                version=version,
+                status=status,
+                is_live=status == 2,
+                publish_datetime=timezone.now() - timezone.timedelta(days=days),
+            )
+            content_release.save()
+            self.content_releases[(site_code, version)] = content_release
+            self.publisher_api.publish_document_to_content_release(
+                site_code, content_release.uuid, '{}', 'key{}'.format(version))
+            self.publisher_api.publish_document_to_content_release(
+                site_code, content_release.uuid, '{}', 'shared')
+
+        #  0.2 is the base release of the live release
+        live_content_release = self.content_releases[('site1', '0.5')]
+        live_content_release.base_release = self.content_releases[('site1', '0.2')]
+        live_content_release.save()
+        #  0.3 shares a document with the live release
+        live_content_release.release_documents.add(ReleaseDocument.objects.get(
+            document_key='key0.3'))
+
+    def test_apply_retention_policy(self):
+        """ unittest for apply_retention_policy """
+
+        out = StringIO()
+        call_command('apply_retention_policy', '--dry-run', stdout=out)
+        self.assertIn('Found 2 expired releases', out.getvalue())
+        self.assertIn('{} (0.3) with 1 exclusive documents'.format(
+            self.content_releases[('site1', '0.3')].uuid), out.getvalue())
+        self.assertEqual(ContentRelease.objects.count(), 6)
+
+        #  incremental
+        out = StringIO()
+        call_command('apply_retention_policy', '--limit=1', '--batch-size=1', stdout=out)
+        self.assertIn('Deleted 1 expired releases', out.getvalue())
+        self.assertFalse(ContentRelease.objects.filter(
+            id=self.content_releases[('site1', '0.1')].id).exists())
+        self.assertEqual(ReleaseDocument.objects.filter(document_key='key0.1').count(), 1)
+
+        out = StringIO()
+        call_command('apply_retention_policy', 'site1', stdout=out)
+        self.assertIn('Deleted 1 expired releases', out.getvalue())
+        self.assertEqual(
+            sorted(ContentRelease.objects.values_list('site_code', 'version')),
+            [('site1', '0.2'), ('site1', '0.4'), ('site1', '0.5'), ('site2', '0.1')],
+        )
+        #  documents still used by another release are kept, with the blob they share
+        self.assertTrue(ReleaseDocument.objects.filter(document_key='key0.3').exists())
+        self.assertEqual(ReleaseDocument.objects.filter(document_key='shared').count(), 4)
+        self.assertEqual(DocumentBlob.objects.count(), 1)
@@ -4,15 +4,22 @@
 """
 
 import json
+from unittest import mock
 # import uuid
 
 from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 
-from djangosnapshotpublisher.admin import ContentReleaseAdmin
-from djangosnapshotpublisher.models import ContentRelease, ContentReleaseExtraParameter
+from djangosnapshotpublisher.admin import (ContentReleaseAdmin, ReleaseDocumentAdmin,
+                                           ReleaseDocumentForm)
+from djangosnapshotpublisher.models import (ContentRelease, ContentReleaseExtraParameter,
+                                            DocumentBlob, ReleaseDocument, version_sort_key)
 from djangosnapshotpublisher.publisher_api import PublisherAPI
 
 
@@ -40,7 +47,7 @@ class ContentReleaseTestCase(TestCase):
         self.assertEqual(content_release_admin.get_readonly_fields(None, None), [])
         self.assertEqual(
             content_release_admin.get_readonly_fields(None, content_release),
-            ['base_release'],
+            ['base_release', 'document_summary'],
         )
 
     def test_version(self):
@@ -91,6 +98,74 @@ class ContentReleaseTestCase(TestCase):
         except ValidationError as v_e:
             self.assertEqual('version_conflict_live_releases', v_e.code)
 
+        # versions are compared as numbers
+        content_release3 = ContentRelease(
+            version='10.0',
+            title='test3',
+            site_code='site1',
+            status=1,
+        )
+        content_release3.save()
+        content_release4 = ContentRelease(
+            version='9.1',
+            title='test4',
+            site_code='site1',
+        )
+        with self.assertRaises(ValidationError):
+            content_release4.save()
+        content_release4.version = '10.0.1'
+        content_release4.save()
+
+    def test_version_sort_key(self):
+        """ unittest for version_sort_key """
+        self.assertLess(version_sort_key('9.0'), version_sort_key('10.0'))
+        self.assertLess(version_sort_key('1.2'), version_sort_key('1.2.1'))
+        self.assertLess(version_sort_key('1.2.9'), version_sort_key('1.10'))
+        self.assertEqual(version_sort_key('1.0.0'), version_sort_key('01'))
+        self.assertIsNone(version_sort_key('1.a'))
+        self.assertIsNone(version_sort_key(None))
+
+    def test_document_blob(self):
+        """ unittest for the bodies shared by the documents """
+        publisher_api = PublisherAPI(api_type='django')
+        response = publisher_api.add_content_release('site1', 'title1', '0.1')
+        content_release1 = response['content']
+        response = publisher_api.add_content_release('site1', 'title2', '0.2')
+        content_release2 = response['content']
+
+        #  identical bodies are stored once
+        document_json = json.dumps({'page_title': 'Test'})
+        for content_release in [content_release1, content_release2]:
+            publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, document_json, 'key1')
+        self.assertEqual(DocumentBlob.objects.count(), 1)
+        release_document = ReleaseDocument.objects.get(content_releases=content_release2)
+        self.assertEqual(release_document.document_json, document_json)
+        self.assertEqual(release_document.to_dict()['document_json'], document_json)
+
+        #  a new body gets a new blob, a deleted document none
+        publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, json.dumps({'page_title': 'Test2'}), 'key1')
+        self.assertEqual(DocumentBlob.objects.count(), 2)
+        publisher_api.delete_document_from_content_release(
+            'site1', content_release1.uuid, 'key1')
+        release_document = ReleaseDocument.objects.get(content_releases=content_release1)
+        self.assertIsNone(release_document.blob)
+        self.assertIsNone(release_document.document_json)
+
+        #  admin form
+        form = ReleaseDocumentForm(instance=release_document, data={
+            'document_key': 'key1',
+            'content_type': 'content',
+            'document_json': document_json,
+        })
+        self.assertTrue(form.is_valid())
+        form.save()
+        release_document.refresh_from_db()
+        self.assertEqual(release_document.document_json, document_json)
+        self.assertEqual(ReleaseDocumentForm(
+            instance=release_document).initial['document_json'], document_json)
+
     def test_base_release(self):
         """ unittest for base_release attribute validation """
         # use_current_live_as_base_release True
@@ -327,3 +402,83 @@ class ContentReleaseTestCase(TestCase):
         ).order_by('key').values('key', 'content',)
         self.assertEqual(list(extra_parameters), list(new_extra_parameters))
 
+
+
+class ReleaseDocumentAdminTestCase(TestCase):
+    """ unittest for ReleaseDocumentAdmin """
+
+    def setUp(self):
+        """ setUp """
+        publisher_api = PublisherAPI(api_type='django')
+        response = publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        self.content_release = response['content']
+        for index in range(5):
+            publisher_api.publish_document_to_content_release(
+                'site1', self.content_release.uuid, '{}', 'key{}'.format(index))
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def test_changelist(self):
+        """ unittest for the ReleaseDocument changelist """
+
+        url = reverse('admin:djangosnapshotpublisher_releasedocument_changelist')
+        response = self.client.get(url, {
+            'content_release': self.content_release.id,
+            'q': 'key1',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [release_document.document_key
+             for release_document in response.context['cl'].result_list],
+            ['key1'],
+        )
+
+    def test_content_release_admin(self):
+        """ unittest for the documents of ContentReleaseAdmin """
+
+        response = self.client.get(reverse(
+            'admin:djangosnapshotpublisher_contentrelease_change', args=[self.content_release.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('release_documents', response.context['adminform'].form.fields)
+        self.assertContains(response, '<li>content: 5 (0 deleted)</li>', html=True)
+
+        #  base releases and document counts are read with the releases
+        url = reverse('admin:djangosnapshotpublisher_contentrelease_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for version in ['0.0.2', '0.0.3']:
+            content_release = ContentRelease(
+                site_code='site1', title='title', version=version, status=0)
+            content_release.save()
+            ContentRelease.objects.filter(id=content_release.id).update(
+                base_release=self.content_release)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertEqual(
+            sorted(content_release.document_count
+                   for content_release in response.context['cl'].result_list),
+            [0, 0, 5],
+        )
+
+    def test_browse(self):
+        """ unittest for the documents of a release paginated by key """
+
+        url = reverse(
+            'admin:djangosnapshotpublisher_releasedocument_browse',
+            args=[self.content_release.id])
+        with mock.patch.object(ReleaseDocumentAdmin, 'browse_per_page', 2):
+            response = self.client.get(url)
+            self.assertEqual(
+                [release_document.document_key
+                 for release_document in response.context['release_documents']],
+                ['key0', 'key1'],
+            )
+            response = self.client.get('{}?{}'.format(url, response.context['next_query']))
+            self.assertEqual(
+                [release_document.document_key
+                 for release_document in response.context['release_documents']],
+                ['key2', 'key3'],
+            )
+            response = self.client.get('{}?{}'.format(url, response.context['next_query']))
+            self.assertEqual(len(response.context['release_documents']), 1)
+            self.assertIsNone(response.context['next_query'])
@@ -0,0 +1,106 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+from io import StringIO
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from djangosnapshotpublisher.packed_release import PackedRelease, PackedReleaseError
+from djangosnapshotpublisher.publisher_api import PublisherAPI
+
+
+class PackedReleaseTestCase(TestCase):
+    """ unittest for pack_content_release and PackedRelease """
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'release.pack')
+
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', {'frontend_id': 'v0.1'})
+        self.content_release1 = response['content']
+        for index in range(20):
+            self.publisher_api.publish_document_to_content_release(
+                'site1', self.content_release1.uuid, json.dumps({'index': index}),
+                'key{}'.format(index), parameters={'p1': str(index)})
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release1.uuid, '{"links": []}', 'main', 'navigation')
+        self.publisher_api.set_stage_content_release('site1', self.content_release1.uuid)
+        self.publisher_api.set_live_content_release('site1', self.content_release1.uuid)
+
+    def tearDown(self):
+        """ tearDown """
+        self.tmp_dir.cleanup()
+
+    def test_pack_content_release(self):
+        """ unittest for pack_content_release """
+
+        out = StringIO()
+        call_command('pack_content_release', 'site1', 'live', self.path, stdout=out)
+        self.assertIn('Packed 21 documents', out.getvalue())
+
+        with PackedRelease(self.path) as packed_release:
+            self.assertEqual(len(packed_release), 21)
+            self.assertEqual(packed_release.metadata['uuid'], str(self.content_release1.uuid))
+            self.assertEqual(packed_release.metadata['parameters'], {'frontend_id': 'v0.1'})
+
+            document = packed_release.get_document('key7')
+            self.assertIsInstance(document.document_json, memoryview)
+            self.assertEqual(json.loads(bytes(document.document_json)), {'index': 7})
+            self.assertEqual(json.loads(bytes(document.parameters)), {'p1': '7'})
+            self.assertFalse(document.deleted)
+            document = packed_release.get_document('main', 'navigation')
+            self.assertEqual(bytes(document.document_json), b'{"links": []}')
+            with self.assertRaises(KeyError):
+                packed_release.get_document('main')
+            self.assertIn(('key0', 'content'), packed_release)
+            self.assertNotIn(('key20', 'content'), packed_release)
+            documents = packed_release.get_documents([('key1', 'content'), ('key99', 'content')])
+            self.assertEqual(list(documents.keys()), [('key1', 'content')])
+            keys = [(document.content_type, document.document_key) for document in packed_release]
+            self.assertEqual(keys, sorted(keys))
+            del document, documents
+
+        #  Missing release
+        with self.assertRaises(CommandError):
+            call_command('pack_content_release', 'site2', 'live', self.path)
+
+    def test_pack_content_release_resolve_base_release(self):
+        """ unittest for pack_content_release with the base release """
+
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', None, self.content_release1.uuid)
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"index": "new"}', 'key1')
+        self.publisher_api.delete_document_from_content_release(
+            'site1', content_release2.uuid, 'key2')
+
+        call_command(
+            'pack_content_release', 'site1', str(content_release2.uuid), self.path,
+            '--resolve-base-release', stdout=StringIO())
+        with PackedRelease(self.path) as packed_release:
+            self.assertEqual(len(packed_release), 21)
+            self.assertEqual(
+                bytes(packed_release.get_document('key1').document_json), b'{"index": "new"}')
+            self.assertTrue(packed_release.get_document('key2').deleted)
+            self.assertIsNone(packed_release.get_document('key2').document_json)
+            self.assertEqual(
+                bytes(packed_release.get_document('key3').document_json), b'{"index": 3}')
+
+    def test_not_a_packed_release(self):
+        """ unittest for PackedRelease with a wrong file """
+
+        with open(self.path, 'wb') as wrong_file:
+            wrong_file.write(b'\0' * 64)
+        with self.assertRaises(PackedReleaseError):
+            PackedRelease(self.path)
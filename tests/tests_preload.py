@@ -0,0 +1,143 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TransactionTestCase, override_settings
+
+from djangosnapshotpublisher import cache, preload
+from djangosnapshotpublisher.publisher_api import PublisherAPI
+
+
+@override_settings(SNAPSHOTPUBLISHER_CACHE='default', SNAPSHOTPUBLISHER_PRELOAD_SITES=['site1'])
+class PreloadTestCase(TransactionTestCase):
+    """ unittest for the preloaded live releases """
+
+    def setUp(self):
+        """ setUp """
+        caches['default'].clear()
+        self.publisher_api = PublisherAPI(api_type='django')
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', {'frontend_id': 'v0.1'})
+        self.base_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.base_release.uuid, '{"base": 1}', 'key1')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.base_release.uuid, '{"base": 2}', 'key2')
+        self.publisher_api.set_stage_content_release('site1', self.base_release.uuid)
+        self.publisher_api.set_live_content_release('site1', self.base_release.uuid)
+
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', {'frontend_id': 'v0.2'},
+            based_on_release_uuid=self.base_release.uuid)
+        self.content_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '{"live": 1}', 'key1', parameters={'p1': 'v1'})
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, 'x' * 100, 'large')
+        self.publisher_api.set_stage_content_release('site1', self.content_release.uuid)
+        self.publisher_api.set_live_content_release('site1', self.content_release.uuid)
+
+        # the connections and the gc of the test runner are left alone
+        with mock.patch.object(preload, 'connections'), mock.patch.object(preload, 'gc'), \
+                self.settings(SNAPSHOTPUBLISHER_PRELOAD_MAX_BODY_CHARS=50):
+            preload.preload_live_releases()
+        self.addCleanup(preload._preloaded_releases.clear)
+
+        # no query through the cache either
+        caches['default'].clear()
+        caches['default'].set(cache.generation_key('site1'), self.generation)
+
+    @property
+    def generation(self):
+        """ generation of the preloaded release """
+        return preload._preloaded_releases['site1'].generation
+
+    def test_preload(self):
+        """ unittest for the reads served by the preloaded release """
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_live_content_release('site1')
+            self.assertEqual(response['content'].uuid, self.content_release.uuid)
+
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release.uuid, 'key1')
+            self.assertEqual(response['content'], {
+                'document_key': 'key1',
+                'content_type': 'content',
+                'deleted': False,
+                'document_json': '{"live": 1}',
+                'parameters': {'p1': 'v1'},
+            })
+
+            response = self.publisher_api.get_documents_from_content_release(
+                'site1', self.content_release.uuid, [('key1', 'content'), ('key2', 'content')],
+                resolve_base_release=True)
+            self.assertEqual(
+                [document['document_json'] for document in response['content']['documents']],
+                ['{"live": 1}', '{"base": 2}'])
+
+    def test_preload_copies(self):
+        """ unittest for the preloaded release given to every caller """
+        response = self.publisher_api.get_live_content_release('site1', include_parameters=True)
+        response['content'].title = 'changed'
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_live_content_release(
+                'site1', include_parameters=True)
+            content_release = response['content'].to_dict(include_parameters=True)
+        self.assertEqual(content_release['title'], 'title2')
+        self.assertEqual(content_release['parameters'], {'frontend_id': 'v0.2'})
+
+    def test_preload_disabled(self):
+        """ unittest for preload_live_releases without sites """
+        with mock.patch.object(preload, 'connections') as connections, \
+                mock.patch.object(preload, 'gc') as gc, \
+                self.settings(SNAPSHOTPUBLISHER_PRELOAD_SITES=[]):
+            preload.preload_live_releases()
+        connections.close_all.assert_not_called()
+        gc.freeze.assert_not_called()
+
+        # the keys not in the release are read from the database
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', self.content_release.uuid, [('key3', 'content')])
+        self.assertEqual(response['content']['missing'], [
+            {'document_key': 'key3', 'content_type': 'content'}])
+
+        # the large documents are read from the database
+        with self.assertNumQueries(2):
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release.uuid, 'large')
+        self.assertEqual(response['content']['document_json'], 'x' * 100)
+
+    def test_refresh(self):
+        """ unittest for the refresh of the preloaded release on a generation change """
+        documents = preload._preloaded_releases['site1'].documents
+
+        # outdated, the reads go through the cache while the refresh runs in a thread
+        caches['default'].incr(cache.generation_key('site1'))
+        with mock.patch.object(preload.threading, 'Thread') as thread:
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', self.content_release.uuid, 'key1')
+        self.assertEqual(response['content']['document_json'], '{"live": 1}')
+        thread.return_value.start.assert_called_once()
+        preload._refresh_threads.clear()
+
+        # no change in the change log, the documents are kept
+        preload.refresh_preloaded_release('site1', self.generation + 1)
+        self.assertIs(preload._preloaded_releases['site1'].documents, documents)
+        with self.assertNumQueries(0):
+            self.publisher_api.get_live_content_release('site1')
+
+        # a document of the base release changed, the release is reloaded
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.base_release.uuid, '{"base": 3}', 'key2')
+        generation = cache.get_generation('site1')
+        preload.refresh_preloaded_release('site1', generation)
+        self.assertEqual(self.generation, generation)
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_documents_from_content_release(
+                'site1', self.content_release.uuid, [('key2', 'content')],
+                resolve_base_release=True)
+        self.assertEqual(response['content']['documents'][0]['document_json'], '{"base": 3}')
@@ -4,15 +4,22 @@
 """
 
 import json
+from unittest import mock
 import uuid
 
+from django.core.cache import caches
 from django.core.management import call_command
+from django.db import connection, transaction
 from django.db.models.query import QuerySet
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
+from djangosnapshotpublisher import cache, changelog
+from djangosnapshotpublisher.garbage_collection import gc_document_blobs, gc_release_documents
 from djangosnapshotpublisher.models import (ContentRelease, ContentReleaseExtraParameter,
-                                            ReleaseDocument)
+                                            DocumentBlob, ReleaseDocument,
+                                            ReleaseDocumentExtraParameter)
 from djangosnapshotpublisher.publisher_api import PublisherAPI, DATETIME_FORMAT
 
 
@@ -216,6 +223,39 @@ class PublisherAPITestCase(TestCase):
         self.assertEqual(response['status'], 'error')
         self.assertEqual(response['error_code'], 'content_release_more_than_one')
 
+    def test_update_content_release_parameters(self):
+        """ unittest for update_content_release_parameters """
+
+        parameters = {'p{}'.format(index): 'test{}'.format(index) for index in range(20)}
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', parameters)
+        content_release = response['content']
+
+        #  unchanged parameters aren't written
+        with self.assertNumQueries(2):
+            response = self.publisher_api.update_content_release_parameters(
+                'site1', content_release.uuid, parameters)
+        self.assertEqual(response['status'], 'success')
+
+        #  changed, new and cleared parameters are written in bulk
+        parameters = dict(parameters, p0='changed', p1='changed', new='test')
+        del parameters['p2']
+        with self.assertNumQueries(7):
+            self.publisher_api.update_content_release_parameters(
+                'site1', content_release.uuid, parameters, clear_first=True)
+        self.assertEqual(
+            dict(content_release.parameters.values_list('key', 'content')), parameters)
+
+        #  non string parameters are compared as they are stored
+        self.publisher_api.update_content_release_parameters(
+            'site1', content_release.uuid, {'count': 1, 'enabled': True, 'empty': None})
+        with self.assertNumQueries(2):
+            self.publisher_api.update_content_release_parameters(
+                'site1', content_release.uuid, {'count': 1, 'enabled': True, 'empty': None})
+        self.assertEqual(dict(content_release.parameters.filter(
+            key__in=['count', 'enabled', 'empty']).values_list('key', 'content')), {
+                'count': '1', 'enabled': 'True', 'empty': None})
+
     def test_get_extra_paramater(self):
         """ unittest for test_get_extra_paramater """
 
@@ -531,6 +571,78 @@ class PublisherAPITestCase(TestCase):
         self.assertEqual(response['content'].count(), 1)
         self.assertEqual(response['content'][0].title, 'title3')
 
+    def test_get_latest_version_content_release(self):
+        """ unittest for get_latest_version_content_release """
+
+        #  No ContentRelease
+        response = self.publisher_api.get_latest_version_content_release('site1')
+        self.assertEqual(response['status'], 'error')
+        self.assertEqual(response['error_code'], 'no_content_release')
+
+        #  Versions compared as numbers
+        self.publisher_api.add_content_release('site1', 'title1', '9.0')
+        self.publisher_api.add_content_release('site1', 'title2', '10.0')
+        self.publisher_api.add_content_release('site1', 'title3', '9.5')
+        self.publisher_api.add_content_release('site2', 'title4', '11.0')
+        response = self.publisher_api.get_latest_version_content_release('site1')
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content'].title, 'title2')
+
+        #  With status
+        response = self.publisher_api.get_latest_version_content_release('site1', 2)
+        self.assertEqual(response['error_code'], 'no_content_release')
+
+    def test_content_releases_include_parameters(self):
+        """ unittest for include_parameters on release lookups """
+
+        parameters = {'frontend_id': 'v0.1', 'domain': 'test.co.uk'}
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', parameters)
+        content_release1 = response['content']
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', {'frontend_id': 'v0.2'})
+        content_release2 = response['content']
+
+        #  get_content_release_details
+        with self.assertNumQueries(2):
+            response = self.publisher_api.get_content_release_details(
+                'site1', content_release1.uuid, include_parameters=True)
+            self.assertEqual(response['status'], 'success')
+            self.assertEqual(
+                response['content'].to_dict(include_parameters=True)['parameters'], parameters)
+
+        #  list_content_releases costs one extra query for the whole list
+        with self.assertNumQueries(2):
+            response = self.publisher_api.list_content_releases(
+                'site1', include_parameters=True)
+            releases_parameters = {
+                content_release.title: content_release.to_dict(
+                    include_parameters=True)['parameters']
+                for content_release in response['content']
+            }
+        self.assertEqual(releases_parameters, {
+            'title1': parameters,
+            'title2': {'frontend_id': 'v0.2'},
+        })
+
+        #  get_stage_content_release and get_live_content_release
+        self.publisher_api.set_stage_content_release('site1', content_release1.uuid)
+        response = self.publisher_api.get_stage_content_release(
+            'site1', include_parameters=True)
+        self.assertEqual(response['content'], content_release1)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                response['content'].to_dict(include_parameters=True)['parameters'], parameters)
+        self.publisher_api.set_live_content_release('site1', content_release1.uuid)
+        response = self.publisher_api.get_live_content_release('site1', include_parameters=True)
+        self.assertEqual(response['content'], content_release1)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                response['content'].to_dict(include_parameters=True)['parameters'], parameters)
+
+        #  parameters are not embedded by default
+        self.assertNotIn('parameters', content_release2.to_dict())
+
     def test_get_document_from_content_release(self):
         """ unittest for get_document_from_content_release """
 
@@ -580,6 +692,169 @@ class PublisherAPITestCase(TestCase):
         self.assertEqual(response['content'], release_document)
         self.assertEqual(str(release_document), 'page - key1')
 
+    def test_get_document_with_extra_from_content_release(self):
+        """ unittest for get_document_with_extra_from_content_release """
+
+        #  No ContentRelease
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', uuid.uuid4(), 'key1')
+        self.assertEqual(response['status'], 'error')
+        self.assertEqual(response['error_code'], 'content_release_does_not_exist')
+
+        #  No ReleaseDocument
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        self.assertEqual(response['status'], 'error')
+        self.assertEqual(response['error_code'], 'release_document_does_not_exist')
+
+        #  Get ReleaseDocument and its parameters in two queries
+        document_json = json.dumps({'page_title': 'Test page title'})
+        parameters = {'para1': 'test1', 'para2': 'test2'}
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, document_json, 'key1', 'page', parameters)
+        with self.assertNumQueries(2):
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', content_release.uuid, 'key1', 'page')
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content'], {
+            'document_key': 'key1',
+            'content_type': 'page',
+            'document_json': document_json,
+            'deleted': False,
+            'parameters': parameters,
+        })
+
+    def test_get_documents_from_content_release(self):
+        """ unittest for get_documents_from_content_release """
+
+        #  No ContentRelease
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', uuid.uuid4(), [('key1', 'content')])
+        self.assertEqual(response['status'], 'error')
+        self.assertEqual(response['error_code'], 'content_release_does_not_exist')
+
+        #  Get ReleaseDocuments and report misses
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release1 = response['content']
+        for document_key in ['key1', 'key2', 'key3']:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release1.uuid, '{"release": 1}', document_key,
+                parameters={'p1': document_key})
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release1.uuid, '{"release": 1}', 'nav', 'navigation')
+        keys = [('key1', 'content'), ('nav', 'navigation'), ('key4', 'content')]
+        with self.assertNumQueries(3):
+            response = self.publisher_api.get_documents_from_content_release(
+                'site1', content_release1.uuid, keys)
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content'], {
+            'documents': [{
+                'document_key': 'key1',
+                'content_type': 'content',
+                'document_json': '{"release": 1}',
+                'deleted': False,
+                'parameters': {'p1': 'key1'},
+            }, {
+                'document_key': 'nav',
+                'content_type': 'navigation',
+                'document_json': '{"release": 1}',
+                'deleted': False,
+                'parameters': {},
+            }],
+            'missing': [{'document_key': 'key4', 'content_type': 'content'}],
+        })
+
+        #  Resolve from the base release
+        self.publisher_api.set_stage_content_release('site1', content_release1.uuid)
+        self.publisher_api.set_live_content_release('site1', content_release1.uuid)
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', None, content_release1.uuid)
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"release": 2}', 'key2')
+        self.publisher_api.delete_document_from_content_release(
+            'site1', content_release2.uuid, 'key3')
+        keys = [('key1', 'content'), ('key2', 'content'), ('key3', 'content')]
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', content_release2.uuid, keys)
+        self.assertEqual(
+            [document['document_key'] for document in response['content']['documents']],
+            ['key2', 'key3'])
+        self.assertEqual(response['content']['missing'], [
+            {'document_key': 'key1', 'content_type': 'content'}])
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', content_release2.uuid, keys, resolve_base_release=True)
+        documents = response['content']['documents']
+        self.assertEqual(response['content']['missing'], [])
+        self.assertEqual(
+            [(document['document_json'], document['deleted']) for document in documents],
+            [('{"release": 1}', False), ('{"release": 2}', False), (None, True)])
+
+    @override_settings(SNAPSHOTPUBLISHER_CACHE='default')
+    def test_get_documents_from_content_release_cached(self):
+        """ unittest for get_documents_from_content_release with a cache """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        for document_key in ['key1', 'key2']:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, '{}', document_key)
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', content_release.uuid, [('key1', 'content')])
+
+        #  only the misses are queried
+        keys = [('key1', 'content'), ('key2', 'content')]
+        with self.assertNumQueries(3):
+            response = self.publisher_api.get_documents_from_content_release(
+                'site1', content_release.uuid, keys)
+        with self.assertNumQueries(0):
+            cached_response = self.publisher_api.get_documents_from_content_release(
+                'site1', content_release.uuid, keys)
+        self.assertEqual(cached_response, response)
+
+        #  the single document lookup shares the cache
+        with self.assertNumQueries(0):
+            response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', content_release.uuid, 'key2')
+        self.assertEqual(response['content']['document_key'], 'key2')
+
+    def test_publish_document_to_content_release_parameters(self):
+        """ unittest for the parameters written by publish_document_to_content_release """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        parameters = {'p1': 'test1', 'p2': 'test2', 'p3': 'test3'}
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{}', 'key1', parameters=parameters)
+        parameter_ids = dict(ReleaseDocumentExtraParameter.objects.values_list('key', 'id'))
+
+        #  an identical republish doesn't write the parameters
+        with CaptureQueriesContext(connection) as queries:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, '{}', 'key1', parameters=parameters)
+        self.assertEqual([
+            query['sql'] for query in queries
+            if ReleaseDocumentExtraParameter._meta.db_table in query['sql'] and
+            not query['sql'].startswith('SELECT')
+        ], [])
+
+        #  only the changes are written
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{}', 'key1',
+            parameters={'p1': 'test1', 'p2': 'changed', 'p4': 'test4'})
+        self.assertEqual(
+            dict(ReleaseDocumentExtraParameter.objects.values_list('key', 'content')),
+            {'p1': 'test1', 'p2': 'changed', 'p4': 'test4'},
+        )
+        self.assertEqual(
+            ReleaseDocumentExtraParameter.objects.get(key='p1').id, parameter_ids['p1'])
+
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{}', 'key1')
+        self.assertFalse(ReleaseDocumentExtraParameter.objects.exists())
+
     def test_publish_document_to_content_release(self):
         """ unittest for publish_document_to_content_release """
 
@@ -1097,6 +1372,382 @@ class PublisherAPITestCase(TestCase):
             }
         ])
 
+        # Same rows page by page
+        rows = []
+        cursor = None
+        while True:
+            response = self.publisher_api.compare_content_releases(
+                'site1', content_release2.uuid, content_release1.uuid, limit=2, cursor=cursor)
+            self.assertEqual(response['status'], 'success')
+            rows += response['content']['results']
+            cursor = response['content']['cursor']
+            if cursor is None:
+                break
+        self.assertEqual(rows, self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid)['content'])
+
+    def test_compare_content_releases_page(self):
+        """ unittest for compare_content_releases with limit, cursor and summary """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release1 = response['content']
+        for key in ['key1', 'key2', 'key3', 'key4']:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release1.uuid, '{}', key, parameters={'p1': 'test1'})
+        self.publisher_api.set_stage_content_release('site1', content_release1.uuid)
+        self.publisher_api.set_live_content_release('site1', content_release1.uuid)
+
+        #  release2 is based on release1: key1 unchanged, key2 body changed, key3 parameters
+        #  changed, key4 deleted, key5 added
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', based_on_release_uuid=content_release1.uuid)
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"title": "changed"}', 'key2',
+            parameters={'p1': 'test1'})
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{}', 'key3', parameters={'p1': 'test2'})
+        self.publisher_api.delete_document_from_content_release(
+            'site1', content_release2.uuid, 'key4')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{}', 'key5')
+
+        response = self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid, summary=True)
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content'], {'Added': 1, 'Changed': 2, 'Removed': 1})
+
+        response = self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid, limit=2)
+        self.assertEqual(response['content']['results'], [
+            {'document_key': 'key5', 'content_type': 'content', 'diff': 'Added'},
+            {
+                'document_key': 'key2',
+                'content_type': 'content',
+                'diff': 'Changed',
+                'parameters': {
+                    'release_from': {'p1': 'test1'},
+                    'release_compare_to': {'p1': 'test1'},
+                },
+            },
+        ])
+        response = self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid, limit=2,
+            cursor=response['content']['cursor'])
+        self.assertEqual(response['content']['results'], [
+            {
+                'document_key': 'key3',
+                'content_type': 'content',
+                'diff': 'Changed',
+                'parameters': {
+                    'release_from': {'p1': 'test2'},
+                    'release_compare_to': {'p1': 'test1'},
+                },
+            }, {
+                'document_key': 'key4',
+                'content_type': 'content',
+                'diff': 'Removed',
+                'parameters': {'p1': 'test1'},
+            },
+        ])
+        self.assertIsNone(response['content']['cursor'])
+
+        response = self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid, cursor='invalid')
+        self.assertEqual(response['status'], 'error')
+        self.assertEqual(response['error_code'], 'invalid_cursor')
+
+    def test_compare_content_releases_modes(self):
+        """ unittest for the same comparison by the summary and the paginated modes """
+
+        #  release2 uses the current live release as base and there is none
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release1 = response['content']
+        for key in ['key1', 'key2', 'key3']:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release1.uuid, '{}', key)
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', use_current_live_as_base_release=True)
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{}', 'key1')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"title": "changed"}', 'key2')
+        self.publisher_api.delete_document_from_content_release(
+            'site1', content_release2.uuid, 'key3')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{}', 'key4')
+        self.publisher_api.delete_document_from_content_release(
+            'site1', content_release2.uuid, 'key5')
+
+        response = self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid, limit=2)
+        self.assertEqual(response['status'], 'success')
+        rows = response['content']['results']
+        response = self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid,
+            cursor=response['content']['cursor'])
+        self.assertIsNone(response['content']['cursor'])
+        rows += response['content']['results']
+        self.assertEqual([(row['diff'], row['document_key']) for row in rows], [
+            ('Added', 'key4'), ('Changed', 'key2'), ('Removed', 'key3')])
+
+        response = self.publisher_api.compare_content_releases(
+            'site1', content_release2.uuid, content_release1.uuid, summary=True)
+        self.assertEqual(response['content'], {
+            diff: len([row for row in rows if row['diff'] == diff])
+            for diff in ['Added', 'Changed', 'Removed']
+        })
+
+
+    def test_get_document_diffs(self):
+        """ unittest for get_document_diffs """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release1 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release1.uuid,
+            json.dumps({'title': 'Test1', 'tags': ['a', 'b'], 'body': {'text': 't', 'a/b': 1}}),
+            'key1')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release1.uuid, '{}', 'key2')
+        response = self.publisher_api.add_content_release('site1', 'title2', '0.0.2')
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid,
+            json.dumps({'title': 'Test2', 'tags': ['a'], 'body': {'text': 't', 'a/b': 1.0}}),
+            'key1')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"title": "Test3"}', 'key3')
+
+        response = self.publisher_api.get_document_diffs(
+            'site1', content_release2.uuid, content_release1.uuid,
+            [('key1', 'content'), ('key2', 'content'), ('key3', 'content'), ('key4', 'content')])
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content'], {
+            'diffs': [
+                {
+                    'document_key': 'key1',
+                    'content_type': 'content',
+                    'diff': [
+                        {'op': 'replace', 'path': '/body/a~1b', 'old_value': 1, 'value': 1.0},
+                        {'op': 'remove', 'path': '/tags/1', 'old_value': 'b'},
+                        {'op': 'replace', 'path': '/title', 'old_value': 'Test1', 'value': 'Test2'},
+                    ],
+                }, {
+                    'document_key': 'key2',
+                    'content_type': 'content',
+                    'diff': [{'op': 'remove', 'path': '', 'old_value': {}}],
+                }, {
+                    'document_key': 'key3',
+                    'content_type': 'content',
+                    'diff': [{'op': 'add', 'path': '', 'value': {'title': 'Test3'}}],
+                },
+            ],
+            'missing': [{'document_key': 'key4', 'content_type': 'content'}],
+        })
+
+        response = self.publisher_api.get_document_diffs(
+            'site1', uuid.uuid4(), content_release1.uuid, [('key1', 'content')])
+        self.assertEqual(response['status'], 'error')
+        self.assertEqual(response['error_code'], 'content_release_does_not_exist')
+
+    def test_unpublish_documents_from_content_release(self):
+        """ unittest for unpublish_documents_from_content_release """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        for document_key in ['news/1', 'news/2', 'news/3', 'about']:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, '{}', document_key, parameters={'p1': 'test1'})
+
+        response = self.publisher_api.unpublish_documents_from_content_release(
+            'site1', content_release.uuid)
+        self.assertEqual(response['status'], 'error')
+        self.assertEqual(response['error_code'], 'parameters_missing')
+
+        response = self.publisher_api.unpublish_documents_from_content_release(
+            'site1', content_release.uuid, keys=[('news/1', 'content'), ('news/4', 'content')])
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content']['results'], [
+            {'document_key': 'news/1', 'content_type': 'content', 'status': 'success'},
+            {
+                'document_key': 'news/4',
+                'content_type': 'content',
+                'status': 'release_document_does_not_exist',
+            },
+        ])
+
+        response = self.publisher_api.unpublish_documents_from_content_release(
+            'site1', content_release.uuid, prefix='news/')
+        self.assertEqual(
+            [result['document_key'] for result in response['content']['results']],
+            ['news/2', 'news/3'],
+        )
+        self.assertEqual(
+            list(content_release.release_documents.values_list('document_key', flat=True)),
+            ['about'],
+        )
+        self.assertEqual(ReleaseDocumentExtraParameter.objects.count(), 1)
+
+    def test_delete_documents_from_content_release(self):
+        """ unittest for delete_documents_from_content_release """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release1 = response['content']
+        for document_key in ['news/1', 'news/2', 'about']:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release1.uuid, '{}', document_key)
+        self.publisher_api.set_stage_content_release('site1', content_release1.uuid)
+        self.publisher_api.set_live_content_release('site1', content_release1.uuid)
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', use_current_live_as_base_release=True)
+        content_release2 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release2.uuid, '{"title": "news 3"}', 'news/3')
+
+        #  keys, a document of the release is deleted, the other ones created as deleted
+        response = self.publisher_api.delete_documents_from_content_release(
+            'site1', content_release2.uuid, keys=[('news/3', 'content'), ('news/4', 'content')])
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content']['results'], [
+            {'document_key': 'news/3', 'content_type': 'content', 'created': False},
+            {'document_key': 'news/4', 'content_type': 'content', 'created': True},
+        ])
+
+        #  prefix, the documents of the base release are hidden
+        response = self.publisher_api.delete_documents_from_content_release(
+            'site1', content_release2.uuid, prefix='news/')
+        self.assertEqual(response['content']['results'], [
+            {'document_key': 'news/1', 'content_type': 'content', 'created': True},
+            {'document_key': 'news/2', 'content_type': 'content', 'created': True},
+            {'document_key': 'news/3', 'content_type': 'content', 'created': False},
+            {'document_key': 'news/4', 'content_type': 'content', 'created': False},
+        ])
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', content_release2.uuid,
+            [('news/1', 'content'), ('news/3', 'content'), ('about', 'content')],
+            resolve_base_release=True)
+        self.assertEqual(
+            [(document['document_key'], document['deleted'], document['document_json'])
+             for document in response['content']['documents']],
+            [('news/1', True, None), ('news/3', True, None), ('about', False, '{}')],
+        )
+        self.assertEqual(content_release1.release_documents.filter(deleted=True).count(), 0)
+
+    def test_get_changes_since(self):
+        """ unittest for get_changes_since """
+
+        response = self.publisher_api.get_changes_since('site1')
+        self.assertEqual(response['content'], {'changes': [], 'sequence': 0})
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release1 = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release1.uuid, '{}', 'key1')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release1.uuid, '{}', 'key2')
+        self.publisher_api.delete_documents_from_content_release(
+            'site1', content_release1.uuid, keys=[('key2', 'content'), ('key3', 'content')])
+        self.publisher_api.unpublish_document_from_content_release(
+            'site1', content_release1.uuid, 'key1')
+        self.publisher_api.set_stage_content_release('site1', content_release1.uuid)
+        self.publisher_api.set_live_content_release('site1', content_release1.uuid)
+
+        #  the sequence is per site
+        response = self.publisher_api.add_content_release('site2', 'title1', '0.0.1')
+        self.publisher_api.publish_document_to_content_release(
+            'site2', response['content'].uuid, '{}', 'key1')
+
+        response = self.publisher_api.get_changes_since('site1', limit=3)
+        self.assertEqual(
+            [(change['sequence'], change['action'], change['document_key'])
+             for change in response['content']['changes']],
+            [(1, 'publish', 'key1'), (2, 'publish', 'key2'), (3, 'delete', 'key2')],
+        )
+        self.assertEqual(response['content']['changes'][0]['release_uuid'], content_release1.uuid)
+        response = self.publisher_api.get_changes_since(
+            'site1', response['content']['sequence'])
+        self.assertEqual(
+            [(change['sequence'], change['action'], change['document_key'])
+             for change in response['content']['changes']],
+            [(4, 'delete', 'key3'), (5, 'unpublish', 'key1'), (6, 'live', None)],
+        )
+        self.assertEqual(response['content']['sequence'], 6)
+        response = self.publisher_api.get_changes_since('site2')
+        self.assertEqual(response['content']['sequence'], 1)
+
+@override_settings(SNAPSHOTPUBLISHER_CACHE='default')
+class PublisherAPICachedTestCase(TransactionTestCase):
+    """ unittest for PublisherAPI with a cache, the cache is invalidated once the writes commit """
+
+    def setUp(self):
+        """ setUp """
+        caches['default'].clear()
+        self.publisher_api = PublisherAPI(api_type='django')
+
+    def test_get_document_with_extra_from_content_release_cached(self):
+        """ unittest for get_document_with_extra_from_content_release with a cache """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{"v": 1}', 'key1', 'page', {'para1': 'test1'})
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1', 'page')
+        with self.assertNumQueries(0):
+            cached_response = self.publisher_api.get_document_with_extra_from_content_release(
+                'site1', content_release.uuid, 'key1', 'page')
+        self.assertEqual(cached_response, response)
+
+        #  publishing through the api invalidates the cache
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{"v": 2}', 'key1', 'page', {'para1': 'test2'})
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1', 'page')
+        self.assertEqual(response['content']['document_json'], '{"v": 2}')
+        self.assertEqual(response['content']['parameters'], {'para1': 'test2'})
+
+        #  as does unpublishing
+        self.publisher_api.unpublish_document_from_content_release(
+            'site1', content_release.uuid, 'key1', 'page')
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1', 'page')
+        self.assertEqual(response['error_code'], 'release_document_does_not_exist')
+
+    def test_cache_invalidated_on_commit(self):
+        """ unittest for a write done in the transaction of the caller """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{"v": 1}', 'key1')
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        document_v1 = response['content']
+
+        with transaction.atomic():
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, '{"v": 2}', 'key1')
+            #  another process reading before the commit still sees v1 and caches it under the
+            #  generation it read, which must not be the one of the write
+            generation = cache.get_generation('site1')
+            cache.set_documents(
+                'site1', generation, content_release.uuid, {('key1', 'content'): document_v1})
+
+        self.assertNotEqual(cache.get_generation('site1'), generation)
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        self.assertEqual(response['content']['document_json'], '{"v": 2}')
+
+        #  a rolled back write doesn't invalidate the cache
+        generation = cache.get_generation('site1')
+        with self.assertRaises(ConnectionError), transaction.atomic():
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, '{"v": 3}', 'key1')
+            raise ConnectionError
+        self.assertEqual(cache.get_generation('site1'), generation)
+
 
 class PublisherAPIJsonTestCase(TestCase):
     """ unittest for PublisherAPIJsonTest with api_type=json """
@@ -1230,6 +1881,35 @@ class PublisherAPIJsonTestCase(TestCase):
             'base_release': None,
         })
 
+    def test_list_content_releases_include_parameters(self):
+        """ unittest for list_content_releases with include_parameters """
+
+        parameters = {'frontend_id': 'v0.1', 'domain': 'test.co.uk'}
+        response_json = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', parameters)
+        response = json.loads(response_json)
+        content_release_uuid = response['content']['uuid']
+        response_json = self.publisher_api.list_content_releases(
+            'site1', include_parameters=True)
+        response = json.loads(response_json)
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['content'], [{
+            'uuid': content_release_uuid,
+            'version': '0.0.1',
+            'title': 'title1',
+            'site_code': 'site1',
+            'status': 'PREVIEW',
+            'publish_datetime': None,
+            'use_current_live_as_base_release': False,
+            'base_release': None,
+            'parameters': parameters,
+        }])
+
+        response_json = self.publisher_api.get_content_release_details(
+            'site1', content_release_uuid, include_parameters=True)
+        response = json.loads(response_json)
+        self.assertEqual(response['content']['parameters'], parameters)
+
     def test_get_document_from_content_release(self):
         """ unittest for get_document_from_content_release """
 
@@ -1340,6 +2020,146 @@ class PublisherAPIJsonTestCase(TestCase):
         ])
 
 
+class PublisherAPIReadReplicaTestCase(TestCase):
+    """
+    unittest for PublisherAPI with a read_database, the replica is a separate empty database
+    so reads routed to it don't find what was written on the primary
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django', read_database='replica')
+
+    def test_read_replica(self):
+        """ unittest for read replica routing """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+
+        #  reads right after a write go to the primary
+        response = self.publisher_api.get_content_release_details('site1', content_release.uuid)
+        self.assertEqual(response['status'], 'success')
+
+        #  then to the replica once the read your writes window is over
+        with self.settings(SNAPSHOTPUBLISHER_READ_YOUR_WRITES_SECONDS=0):
+            self.publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, '{}', 'key1')
+            response = self.publisher_api.get_content_release_details(
+                'site1', content_release.uuid)
+            self.assertEqual(response['error_code'], 'content_release_does_not_exist')
+            response = self.publisher_api.list_content_releases('site1')
+            self.assertEqual(response['content'].db, 'replica')
+            self.assertEqual(response['content'].count(), 0)
+
+            #  an api without read_database reads the primary
+            response = PublisherAPI().list_content_releases('site1')
+            self.assertEqual(response['content'].db, 'default')
+            self.assertEqual(response['content'].count(), 1)
+
+        #  writes always go to the primary
+        self.assertEqual(
+            ContentRelease.objects.using('default').filter(site_code='site1').count(), 1)
+        self.assertFalse(ContentRelease.objects.using('replica').exists())
+
+    @override_settings(
+        SNAPSHOTPUBLISHER_CACHE='default', SNAPSHOTPUBLISHER_READ_YOUR_WRITES_SECONDS=0)
+    def test_read_replica_cache(self):
+        """ unittest for a lagging replica not filling the shared cache """
+        caches['default'].clear()
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{"version": 1}', 'key1')
+        self.publisher_api.set_stage_content_release('site1', content_release.uuid)
+        self.publisher_api.set_live_content_release('site1', content_release.uuid)
+
+        #  the replica has the release, then lags behind the next write
+        for model in [
+                DocumentBlob, ContentRelease, ContentReleaseExtraParameter, ReleaseDocument,
+                ContentRelease.release_documents.through, ReleaseDocumentExtraParameter]:
+            model.objects.using('replica').bulk_create(model.objects.using('default').all())
+        self.publisher_api.publish_document_to_content_release(
+            'site1', content_release.uuid, '{"version": 2}', 'key1')
+
+        #  the reads stored in the cache are done on the primary, every process gets the write
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        self.assertEqual(response['content']['document_json'], '{"version": 2}')
+        response = self.publisher_api.get_documents_from_content_release(
+            'site1', content_release.uuid, [('key1', 'content')])
+        self.assertEqual(
+            response['content']['documents'][0]['document_json'], '{"version": 2}')
+        response = PublisherAPI().get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        self.assertEqual(response['content']['document_json'], '{"version": 2}')
+        response = self.publisher_api.get_live_content_release('site1')
+        self.assertEqual(response['content'].uuid, content_release.uuid)
+
+        #  the reads which aren't cached still go to the replica
+        response = self.publisher_api.get_document_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        self.assertEqual(response['content'].document_json, '{"version": 1}')
+
+
+@override_settings(SNAPSHOTPUBLISHER_PRIMARY_DATABASE='replica')
+class PublisherAPIPrimaryDatabaseTestCase(TransactionTestCase):
+    """
+    unittest for PublisherAPI with SNAPSHOTPUBLISHER_PRIMARY_DATABASE set, the replica database
+    stands for the primary and 'default' must stay empty
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django')
+
+    def test_primary_database(self):
+        """ unittest for the reads and writes done on the primary """
+
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', {'frontend_id': 'v0.1'})
+        content_release = response['content']
+        for document_key in ['blog/a', 'blog/b', 'key1']:
+            response = self.publisher_api.publish_document_to_content_release(
+                'site1', content_release.uuid, '{}', document_key, parameters={'p1': 'v1'})
+            self.assertEqual(response['status'], 'success')
+        response = self.publisher_api.update_content_release_parameters(
+            'site1', content_release.uuid, {'frontend_id': 'v0.2'})
+        self.assertEqual(response['status'], 'success')
+        response = self.publisher_api.delete_documents_from_content_release(
+            'site1', content_release.uuid, prefix='blog/')
+        self.assertEqual(len(response['content']['results']), 2)
+        response = self.publisher_api.set_stage_content_release('site1', content_release.uuid)
+        self.assertEqual(response['status'], 'success')
+        response = self.publisher_api.set_live_content_release('site1', content_release.uuid)
+        self.assertEqual(response['status'], 'success')
+        response = self.publisher_api.get_document_with_extra_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        self.assertEqual(response['content']['parameters'], {'p1': 'v1'})
+        response = self.publisher_api.unpublish_document_from_content_release(
+            'site1', content_release.uuid, 'key1')
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(gc_release_documents(), 0)
+        self.assertEqual(gc_document_blobs(), 1)
+
+        self.assertEqual(ContentRelease.objects.using('replica').get().status, 2)
+        self.assertFalse(ContentRelease.objects.using('default').exists())
+        self.assertFalse(ReleaseDocument.objects.using('default').exists())
+
+    def test_primary_database_atomic(self):
+        """ unittest for a write failing in its transaction on the primary """
+
+        response = self.publisher_api.add_content_release('site1', 'title1', '0.0.1')
+        content_release = response['content']
+        with mock.patch.object(changelog, 'record_changes', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.publisher_api.publish_document_to_content_release(
+                    'site1', content_release.uuid, '{}', 'key1', parameters={'p1': 'v1'})
+        self.assertFalse(ReleaseDocument.objects.using('replica').exists())
+        self.assertFalse(DocumentBlob.objects.using('replica').exists())
+
+
 class PublisherScriptTestCase(TestCase):
     """ unittest for PublisherScriptTest with api_type=django """
 
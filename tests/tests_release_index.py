@@ -0,0 +1,95 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+import sys
+
+from django.test import TestCase
+
+from djangosnapshotpublisher.publisher_api import PublisherAPI
+from djangosnapshotpublisher.release_index import (IndexedDocument, ReleaseIndex,
+                                                   build_release_index)
+
+
+class ReleaseIndexTestCase(TestCase):
+    """ unittest for ReleaseIndex and build_release_index """
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django')
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', {'frontend_id': 'v0.1'})
+        self.base_release = response['content']
+        for document_key in ['blog/b', 'blog/a', 'news/a']:
+            self.publisher_api.publish_document_to_content_release(
+                'site1', self.base_release.uuid, '{"base": 1}', document_key)
+        self.publisher_api.set_stage_content_release('site1', self.base_release.uuid)
+        self.publisher_api.set_live_content_release('site1', self.base_release.uuid)
+
+        response = self.publisher_api.add_content_release(
+            'site1', 'title2', '0.0.2', {'frontend_id': 'v0.2'},
+            based_on_release_uuid=self.base_release.uuid)
+        self.content_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '{"key": 1}', 'blog/a',
+            parameters={'p1': 'v1'})
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '{"nav": 1}', 'blog/a', content_type='navigation')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, 'x' * 100, 'large')
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '\u00e9' * 40, 'accents')
+        self.publisher_api.delete_document_from_content_release(
+            'site1', self.content_release.uuid, 'news/a')
+
+    def test_build_release_index(self):
+        """ unittest for build_release_index """
+        release_index = build_release_index(self.content_release, max_body_chars=50)
+        self.assertEqual([
+            (document.content_type, document.document_key) for document in release_index
+        ], [
+            ('content', 'accents'), ('content', 'blog/a'), ('content', 'news/a'),
+            ('navigation', 'blog/a'),
+        ])
+        self.assertEqual(release_index.get_document('blog/a'), IndexedDocument(
+            document_key='blog/a',
+            content_type='content',
+            document_json='{"key": 1}',
+            parameters=(('p1', 'v1'),),
+            deleted=False,
+            own=True,
+        ))
+        self.assertTrue(release_index.get_document('news/a').deleted)
+        self.assertNotIn(('blog/b', 'content'), release_index)
+
+        release_index = build_release_index(self.content_release, resolve_base_release=True)
+        self.assertEqual(len(release_index), 6)
+        self.assertFalse(release_index.get_document('blog/b').own)
+        self.assertTrue(release_index.get_document('news/a').own)
+        self.assertEqual(release_index.get_document('large').document_json, 'x' * 100)
+
+    def test_release_index(self):
+        """ unittest for the lookups of a ReleaseIndex """
+        release_index = ReleaseIndex(
+            IndexedDocument(''.join(['page', str(number)]), content_type, '{}', (), False, True)
+            for number in [10, 2, 1] for content_type in ['content', 'navigation']
+        )
+        self.assertEqual(len(release_index), 6)
+        self.assertIs(
+            release_index.get_document('page1').document_key, sys.intern('page1'))
+
+        self.assertIn(('page2', 'navigation'), release_index)
+        self.assertNotIn(('page3', 'content'), release_index)
+        self.assertNotIn(('page1', 'other'), release_index)
+        with self.assertRaises(KeyError):
+            release_index.get_document('page3')
+        self.assertEqual(list(release_index.get_documents([
+            ('page1', 'content'), ('page3', 'content'), ('page10', 'navigation'),
+        ])), [('page1', 'content'), ('page10', 'navigation')])
+
+        self.assertEqual([
+            document.document_key for document in release_index.scan_prefix('page1')
+        ], ['page1', 'page10'])
+        self.assertEqual(list(release_index.scan_prefix('page1', 'other')), [])
+        self.assertEqual(list(release_index.scan_prefix('zzz')), [])
@@ -0,0 +1,129 @@
+"""
+.. module:: djangosnapshotpublisher.tests
+   :synopsis: djangosnapshotpublisher unittest
+"""
+
+import uuid
+
+from django.test import TestCase
+from django.urls import reverse
+
+from djangosnapshotpublisher.models import ContentRelease
+from djangosnapshotpublisher.publisher_api import PublisherAPI
+
+
+class ViewsTestCase(TestCase):
+    """ unittest for the read only http api """
+
+    def setUp(self):
+        """ setUp """
+        self.publisher_api = PublisherAPI(api_type='django')
+        response = self.publisher_api.add_content_release(
+            'site1', 'title1', '0.0.1', {'frontend_id': 'v0.1'})
+        self.content_release = response['content']
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '{"page_title": "page 1"}', 'key1/page',
+            'content', {'p1': 'test1'})
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '{"links": []}', 'main', 'navigation')
+
+    def test_live_content_release(self):
+        """ unittest for live_content_release """
+
+        url = reverse('djangosnapshotpublisher:live_content_release', args=['site1'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error_code'], 'no_content_release_live')
+
+        self.publisher_api.set_stage_content_release('site1', self.content_release.uuid)
+        self.publisher_api.set_live_content_release('site1', self.content_release.uuid)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content']['uuid'], str(self.content_release.uuid))
+        self.assertEqual(response.json()['content']['parameters'], {'frontend_id': 'v0.1'})
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        #  conditional get
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_release_document(self):
+        """ unittest for release_document """
+
+        url = reverse('djangosnapshotpublisher:release_document', args=[
+            'site1', self.content_release.uuid, 'content', 'key1/page'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], {
+            'document_key': 'key1/page',
+            'content_type': 'content',
+            'document_json': '{"page_title": "page 1"}',
+            'deleted': False,
+            'parameters': {'p1': 'test1'},
+        })
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        #  conditional get
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        #  the etag changes with the content
+        self.publisher_api.publish_document_to_content_release(
+            'site1', self.content_release.uuid, '{"page_title": "page 1 v2"}', 'key1/page')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        #  archived releases can still be written, they are only immutable when configured
+        ContentRelease.objects.filter(id=self.content_release.id).update(status=3)
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        with self.settings(SNAPSHOTPUBLISHER_IMMUTABLE_ARCHIVED_RELEASES=True):
+            response = self.client.get(url)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        #  missing document or release
+        response = self.client.get(reverse('djangosnapshotpublisher:release_document', args=[
+            'site1', self.content_release.uuid, 'content', 'missing']))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('djangosnapshotpublisher:release_document', args=[
+            'site1', uuid.uuid4(), 'content', 'key1/page']))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error_code'], 'content_release_does_not_exist')
+
+        #  read only
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 405)
+
+    def test_release_documents(self):
+        """ unittest for release_documents """
+
+        url = reverse('djangosnapshotpublisher:release_documents', args=[
+            'site1', self.content_release.uuid])
+        response = self.client.get(url, {'key': ['key1/page', 'navigation:main', 'missing']})
+        self.assertEqual(response.status_code, 200)
+        content = response.json()['content']
+        self.assertEqual(
+            [document['document_json'] for document in content['documents']],
+            ['{"page_title": "page 1"}', '{"links": []}'])
+        self.assertEqual(content['missing'], [
+            {'document_key': 'missing', 'content_type': 'content'}])
+
+        response = self.client.get(
+            url, {'key': ['key1/page', 'navigation:main', 'missing']},
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        #  documents resolved from the current live release can change
+        ContentRelease.objects.filter(id=self.content_release.id).update(
+            status=3, use_current_live_as_base_release=True)
+        with self.settings(SNAPSHOTPUBLISHER_IMMUTABLE_ARCHIVED_RELEASES=True):
+            response = self.client.get(url, {'key': ['key1/page']})
+            self.assertIn('immutable', response['Cache-Control'])
+            response = self.client.get(
+                url, {'key': ['key1/page'], 'resolve_base_release': 'true'})
+            self.assertEqual(response['Cache-Control'], 'no-cache')
@@ -7,6 +7,7 @@ from django.contrib import admin
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('snapshotpublisher/', include('djangosnapshotpublisher.urls')),
 ]
 
 if settings.DEBUG:
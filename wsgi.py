@@ -16,3 +16,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.local')
 
 application = get_wsgi_application()
+
+# loaded before gunicorn --preload forks the workers, a no-op unless
+# SNAPSHOTPUBLISHER_PRELOAD_SITES is set
+from djangosnapshotpublisher.preload import preload_live_releases  # noqa: E402
+
+preload_live_releases()